@@ -1,13 +1,32 @@
+import os
 from flask import Flask
 from flask_cors import CORS
-from controller import predict, upload
+from controller import predict, predict_batch, predict_portfolio, upload, get_job, metrics, begin_request_timing, end_request_timing, get_upload_jobs
 
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}}) # To change before release!
-app.route('/api/predict', methods=['POST'])(predict)
-app.route('/api/upload', methods=['POST'])(upload)
+
+def create_app(start_jobs=True):
+    """App factory. `start_jobs=False` leaves the upload job workers to the caller
+    (a pre-fork master must not start threads: see gunicorn.conf.py)."""
+    app = Flask(__name__)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}) # To change before release!
+    app.before_request(begin_request_timing)
+    app.after_request(end_request_timing)
+    app.route('/api/predict', methods=['POST'])(predict)
+    app.route('/api/predict/batch', methods=['POST'])(predict_batch)
+    app.route('/api/predict/portfolio', methods=['POST'])(predict_portfolio)
+    app.route('/api/upload', methods=['POST'])(upload)
+    app.route('/api/jobs/<job_id>', methods=['GET'])(get_job)
+    app.route('/api/metrics', methods=['GET'])(metrics)
+
+    if start_jobs:
+        # resume jobs left queued/running by a previous process
+        get_upload_jobs().start()
+    return app
 
 # --- RUN SERVER ---
+# development only; in production: gunicorn -c gunicorn.conf.py wsgi:app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # not in the dev reloader's parent
+    app = create_app(start_jobs=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+    app.run(debug=True, port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,556 @@
+"""Performance benchmarks for the scoring stack.
+
+    python benchmark.py --out bench.json                       # run everything
+    python benchmark.py --suite scoring --sizes 1,1000         # a subset
+    python benchmark.py --out new.json --compare bench.json    # flag regressions (exit code 1)
+    python benchmark.py --suite imports                        # cold-start import report
+    python benchmark.py --suite serve --serve-workers 4        # dev server vs gunicorn: req/s and memory
+
+Every case runs on synthetic data generated from a fixed seed; the upload suite posts
+generated fixture PDFs to /api/upload with Gemini replaced by a local HTTP stub, and
+with the Markdown/LLM caches disabled so every request does the full work.
+"""
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import math
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1, 1_000, 100_000, 1_000_000)
+SUITES = ("scoring", "upload", "imports", "serve")
+IMPORT_TARGETS = ("vecthor_features", "ml_infer", "services", "controller", "app")
+
+# --- SYNTHETIC DATA ---
+
+_AMOUNT_COLUMNS = (
+    "totalCurrentAssets", "totalNonCurrentAssets", "totalCurrentLiabilities", "totalNonCurrentLiabilities",
+    "inventories", "totalAssets", "totalLiabilities", "totalEquity", "revenue", "ebit", "netIncome",
+    "interestExpense", "operatingCashFlow", "tangibleFixedAssets", "retainedEarnings", "depreciation",
+    "workingCapital", "netIncome_t_minus_1", "quickAssets", "sharesOutstanding", "marketCapitalization",
+    "gnpPriceLevelIndex", "longTermDebtCurrent", "dscrCashFlow_proxy", "dscrDebtService_proxy",
+)
+
+
+def synthetic_frame(n, seed=0):
+    """`n` rows of model inputs (FEATURE_COLUMNS) with ~15% missing values and some zeros."""
+    import pandas as pd
+    from ml_infer import FEATURE_COLUMNS
+
+    rng = np.random.default_rng(seed)
+    data = {
+        "sic": rng.integers(100, 9999, n).astype(float),
+        "fiscalYear": rng.integers(2005, 2025, n).astype(float),
+        "isPubliclyListed": rng.integers(0, 2, n).astype(float),
+    }
+    for c in _AMOUNT_COLUMNS:
+        v = rng.lognormal(14, 2, n) * np.where(rng.random(n) < 0.15, -1.0, 1.0)
+        v[rng.random(n) < 0.05] = 0.0
+        v[rng.random(n) < 0.15] = np.nan
+        data[c] = v
+    return pd.DataFrame(data)[FEATURE_COLUMNS]
+
+
+def synthetic_model_inputs(n, seed=0):
+    """Dicts as accepted by ml_infer.score_from_financial_dict."""
+    return synthetic_frame(n, seed).to_dict("records")
+
+
+def synthetic_payloads(n, seed=0):
+    """Dicts shaped like the /api/predict financial_data payload (controller input)."""
+    df = synthetic_frame(n, seed)
+    rng = np.random.default_rng(seed + 1)
+    countries = np.where(rng.random(n) < 0.5, "italy", "usa")
+    sectors = np.array(["manufacturing", "services", "retail"])[rng.integers(0, 3, n)]
+    ratings = np.array(["AA", "BBB", ""])[rng.integers(0, 3, n)]
+    cols = ["totalCurrentAssets", "totalNonCurrentAssets", "inventories", "totalCurrentLiabilities",
+            "totalNonCurrentLiabilities", "retainedEarnings", "ebit", "revenue", "totalEquity", "netIncome",
+            "interestExpense", "tangibleFixedAssets", "operatingCashFlow", "marketCapitalization",
+            "netIncome_t_minus_1"]
+    values = df[cols].to_numpy()
+    out = []
+    for i in range(n):
+        # the form sends every amount: missing ones arrive as 0
+        row = {c: (0.0 if math.isnan(v) else float(v)) for c, v in zip(cols, values[i])}
+        row.update(
+            dscrCashFlow=row["operatingCashFlow"],
+            dscrDebtService=abs(row["interestExpense"]),
+            country=str(countries[i]),
+            companyName=f"bench-{i}",
+            industrySector=str(sectors[i]),
+            fiscalYear=int(df["fiscalYear"].iat[i]),
+            isPubliclyListed=bool(df["isPubliclyListed"].iat[i]),
+            esgRating=str(ratings[i]),
+            esgScore_E=3.0, esgScore_S=2.0, esgScore_G=4.0,
+        )
+        out.append(row)
+    return out
+
+# --- TIMING ---
+
+def _time(fn, repeat, budget_s):
+    """Runs fn() up to `repeat` times (fewer if one run eats the budget); returns the timings."""
+    times = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        if sum(times) >= budget_s:
+            break
+    return times
+
+
+def _record(times, rows=None):
+    rec = {
+        "runs": len(times),
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+    }
+    if rows:
+        rec["rows"] = rows
+        rec["per_row_us"] = rec["median_s"] / rows * 1e6
+    return rec
+
+
+def run_sized(name, sizes, setup, repeat, budget_s, results):
+    """Times `setup(n)()` at each size, skipping sizes whose extrapolated time exceeds the budget.
+
+    The estimate is linear through the two previous sizes, so fixed per-call overhead
+    measured at n=1 does not get multiplied by a million.
+    """
+    points = []
+    for n in sorted(sizes):
+        key = f"{name}[{n}]"
+        if len(points) >= 2:
+            (n1, t1), (n2, t2) = points[-2:]
+            estimate = t2 + max(t2 - t1, 0.0) / (n2 - n1) * (n - n2)
+            if estimate > budget_s:
+                results[key] = {"rows": n, "skipped": True, "estimated_s": estimate}
+                print(f"  {key:<34} skipped (~{estimate:.0f}s > budget)", flush=True)
+                continue
+        fn = setup(n)
+        times = _time(fn, repeat, budget_s)
+        results[key] = _record(times, n)
+        points.append((n, results[key]["median_s"]))
+        print(f"  {key:<34} {results[key]['median_s'] * 1000:10.2f} ms  ({results[key]['per_row_us']:.1f} us/row)",
+              flush=True)
+
+# --- SUITES ---
+
+def suite_scoring(args, results):
+    import controller
+    from ml_infer import score_batch_from_financial_dicts, score_from_financial_dict, get_model
+    from vecthor_features import SafeImputer, _feat_eng
+
+    def feat_eng(n):
+        df = synthetic_frame(n, args.seed)
+        return lambda: _feat_eng(df)
+
+    imputer = SafeImputer().fit(_feat_eng(synthetic_frame(1000, args.seed + 7)))
+
+    def safe_imputer(n):
+        Xf = _feat_eng(synthetic_frame(n, args.seed))
+        return lambda: imputer.transform(Xf)
+
+    run_sized("feat_eng", args.sizes, feat_eng, args.repeat, args.budget, results)
+    run_sized("safe_imputer.transform", args.sizes, safe_imputer, args.repeat, args.budget, results)
+
+    if not os.path.exists(args.model):
+        print(f"  model not found ({args.model}): skipping model-backed cases", flush=True)
+        return
+
+    t0 = time.perf_counter()
+    get_model(args.model)
+    results["model_load"] = _record([time.perf_counter() - t0])
+    controller.MODEL_PATH = args.model
+
+    def score(n):
+        fins = synthetic_model_inputs(n, args.seed)
+        if n == 1:
+            return lambda: score_from_financial_dict(args.model, fins[0])
+        return lambda: score_batch_from_financial_dicts(args.model, fins)
+
+    def calculate(n):
+        rows = synthetic_payloads(n, args.seed)
+        if n == 1:
+            return lambda: controller._calculate_results(rows[0])
+        return lambda: controller._calculate_results_batch(rows)
+
+    run_sized("score_from_financial_dict", args.sizes, score, args.repeat, args.budget, results)
+    run_sized("_calculate_results", args.sizes, calculate, args.repeat, args.budget, results)
+
+
+_STATEMENT_PAGE = """CONSOLIDATED BALANCE SHEETS
+Total current assets 1,204,500 1,100,200
+Total assets 4,512,000 4,300,100
+Total current liabilities 804,300 790,000
+Total liabilities 2,900,000 2,800,500
+Retained earnings 1,050,000 980,000
+CONSOLIDATED STATEMENTS OF OPERATIONS
+Total revenue 3,200,000 3,050,000
+Operating income 410,000 395,000
+Interest expense 35,000 33,000
+Net income 280,000 265,000
+CONSOLIDATED STATEMENTS OF CASH FLOWS
+Net cash provided by operating activities 455,000 430,000
+"""
+
+_NARRATIVE_PAGE = ("Management discussion and analysis of the business, its markets and risk factors. " * 12).strip()
+
+
+def fixture_pdf(pages, statement_pages=(0,)):
+    """A text PDF with financial statements on `statement_pages` and narrative elsewhere."""
+    import pymupdf
+
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        text = _STATEMENT_PAGE if i in statement_pages else _NARRATIVE_PAGE
+        page.insert_textbox(pymupdf.Rect(50, 50, 550, 800), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class _GeminiStub(BaseHTTPRequestHandler):
+    """Answers generateContent with a fixed extraction after `latency_s`."""
+
+    latency_s = 0.0
+    body = json.dumps({"candidates": [{"content": {"role": "model", "parts": [{"text": json.dumps({
+        "companyName": "Bench Inc.", "fiscalYear": 2024, "totalCurrentAssets": 1204500,
+        "totalNonCurrentAssets": 3307500, "inventories": 210000, "totalCurrentLiabilities": 804300,
+        "totalNonCurrentLiabilities": 2095700, "retainedEarnings": 1050000, "ebit": 410000,
+        "revenue": 3200000, "totalEquity": 1612000, "netIncome": 280000, "interestExpense": 35000,
+        "tangibleFixedAssets": 2100000, "operatingCashFlow": 455000, "marketCapitalization": 5000000,
+    })}]}}]}).encode()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_gemini_stub(latency_s=0.0):
+    _GeminiStub.latency_s = latency_s
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GeminiStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def suite_upload(args, results):
+    from app import create_app
+    import controller
+
+    if os.path.exists(args.model):
+        controller.MODEL_PATH = args.model
+    client = create_app(start_jobs=False).test_client()
+    fixtures = {
+        "upload[1p]": (fixture_pdf(1), None),
+        "upload[30p]": (fixture_pdf(30, (11, 14, 17)), None),
+        "upload[30p+prev]": (fixture_pdf(30, (11, 14, 17)), fixture_pdf(30, (12, 15, 18))),
+    }
+    for key, (doc, prev) in fixtures.items():
+        def post():
+            data = {"document": (io.BytesIO(doc), "current.pdf"), "country": "usa", "companyType": "public",
+                    "industrySector": "manufacturing", "dscrCashFlow": "455000", "dscrDebtService": "90000"}
+            if prev is not None:
+                data["previousDocument"] = (io.BytesIO(prev), "previous.pdf")
+            resp = client.post("/api/upload", data=data, content_type="multipart/form-data")
+            if resp.status_code != 200:
+                raise RuntimeError(f"{key}: HTTP {resp.status_code} {resp.get_data(as_text=True)[:200]}")
+
+        post()  # warm-up: imports, client pool, model load
+        results[key] = _record(_time(post, args.repeat, args.budget))
+        print(f"  {key:<34} {results[key]['median_s'] * 1000:10.2f} ms", flush=True)
+
+def _cold_import(module):
+    """Seconds to import `module` in a fresh interpreter, and its direct imports by cumulative cost."""
+    code = f"import time; t0 = time.perf_counter(); import {module}; print(time.perf_counter() - t0)"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                          capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                rows.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1e6))
+    root_indent = next((indent for indent, name, _ in reversed(rows) if name == module), 1)
+    children = sorted(((name, sec) for indent, name, sec in rows if indent == root_indent + 2), key=lambda r: -r[1])
+    return float(proc.stdout.split()[-1]), children
+
+
+def suite_imports(args, results):
+    for module in IMPORT_TARGETS:
+        key = f"import[{module}]"
+        runs = [_cold_import(module) for _ in range(max(1, args.repeat))]
+        results[key] = _record([sec for sec, _ in runs])
+        results[key]["slowest_imports"] = [{"module": m, "s": round(sec, 4)} for m, sec in runs[-1][1][:8]]
+        top = ", ".join(f"{r['module']} {r['s'] * 1000:.0f}" for r in results[key]["slowest_imports"][:4])
+        print(f"  {key:<34} {results[key]['median_s'] * 1000:10.2f} ms  ({top})", flush=True)
+
+    def cli():
+        subprocess.run([sys.executable, os.path.join(HERE, "ml_infer.py"), "--help"], cwd=HERE,
+                       capture_output=True, check=True)
+
+    results["cli[ml_infer --help]"] = _record(_time(cli, args.repeat, args.budget))
+    print(f"  {'cli[ml_infer --help]':<34} {results['cli[ml_infer --help]']['median_s'] * 1000:10.2f} ms", flush=True)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, proc, timeout_s=120.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/metrics")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+def _memory(pid):
+    """RSS and PSS (shared pages split between the processes sharing them) of a process tree, in MB."""
+    import psutil
+
+    procs = [psutil.Process(pid)]
+    procs += procs[0].children(recursive=True)
+    out = []
+    for p in procs:
+        try:
+            mem = p.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        out.append({"pid": p.pid, "rss_mb": mem.rss / 2**20, "pss_mb": getattr(mem, "pss", mem.rss) / 2**20})
+    return out
+
+
+def _drive(port, bodies, concurrency, seconds):
+    """`concurrency` keep-alive clients POSTing to /api/predict for `seconds`; returns (latencies, errors)."""
+    latencies, errors = [], []
+    stop = time.monotonic() + seconds
+
+    def client(k):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        i = k
+        while time.monotonic() < stop:
+            body = bodies[i % len(bodies)]
+            i += concurrency
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/api/predict", body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errors.append(resp.status)
+                    continue
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(type(e).__name__)
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                continue
+            latencies.append(time.perf_counter() - t0)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def suite_serve(args, results):
+    """/api/predict throughput and memory: Werkzeug dev server (python app.py) vs gunicorn (wsgi.py)."""
+    import importlib.util
+
+    servers = {"dev": [sys.executable, "app.py"]}
+    if importlib.util.find_spec("gunicorn") is None:
+        results["serve[gunicorn]"] = {"skipped": True, "reason": "gunicorn not installed"}
+        print("  serve[gunicorn]: gunicorn not installed, skipped", flush=True)
+    else:
+        servers["gunicorn"] = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"]
+
+    bodies = [json.dumps(p).encode() for p in synthetic_payloads(256, args.seed)]
+    for name, cmd in servers.items():
+        port = _free_port()
+        env = dict(os.environ, PORT=str(port), BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(args.serve_workers),
+                   ACCESS_LOG="", METRICS_ENABLED="1")
+        if os.path.exists(args.model):
+            env["VECTHOR_MODEL_PATH"] = args.model
+        proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_ready(port, proc)
+            _drive(port, bodies, args.serve_concurrency, min(2.0, args.serve_seconds))  # warm-up
+            latencies, errors = _drive(port, bodies, args.serve_concurrency, args.serve_seconds)
+            memory = _memory(proc.pid)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+        key = f"serve[{name}]"
+        latencies.sort()
+        rec = _record(latencies) if latencies else {"runs": 0}
+        rec.update(
+            requests_per_s=len(latencies) / args.serve_seconds,
+            p95_s=latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            errors=len(errors),
+            error_kinds={str(k): errors.count(k) for k in set(errors)},
+            concurrency=args.serve_concurrency,
+            processes=len(memory),
+            rss_mb_total=sum(m["rss_mb"] for m in memory),
+            pss_mb_total=sum(m["pss_mb"] for m in memory),
+            memory=memory,
+        )
+        results[key] = rec
+        print(f"  {key:<34} {rec['requests_per_s']:8.1f} req/s  p50 {rec.get('median_s', 0) * 1000:.1f} ms  "
+              f"p95 {(rec['p95_s'] or 0) * 1000:.1f} ms  errors {rec['errors']}  "
+              f"{rec['processes']} procs: RSS {rec['rss_mb_total']:.0f} MB, PSS {rec['pss_mb_total']:.0f} MB",
+              flush=True)
+
+# --- COMPARE ---
+
+def compare(current, baseline, threshold):
+    """Prints median ratios current/baseline; returns the keys slower than 1 + threshold."""
+    regressions = []
+    for field in ("model_sha256", "cpu_count", "numpy", "sklearn"):
+        before, after = baseline.get("environment", {}).get(field), current["environment"].get(field)
+        if before != after:
+            print(f"warning: {field} differs from the baseline ({before} -> {after})")
+    print(f"\n{'case':<36}{'baseline ms':>14}{'current ms':>14}{'ratio':>9}")
+    for key, cur in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base or "median_s" not in base or "median_s" not in cur:
+            continue
+        ratio = cur["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1.0 + threshold:
+            regressions.append(key)
+            flag = "  <-- slower"
+        print(f"{key:<36}{base['median_s'] * 1000:14.2f}{cur['median_s'] * 1000:14.2f}{ratio:9.2f}{flag}")
+    return regressions
+
+# --- MAIN ---
+
+def _environment(model_path):
+    import sklearn
+    import pandas as pd
+
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "model": model_path,
+    }
+    if os.path.exists(model_path):
+        h = hashlib.sha256()
+        with open(model_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        env["model_sha256"] = h.hexdigest()
+    return env
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the scoring stack")
+    ap.add_argument("--suite", default=",".join(SUITES), help=f"Comma-separated: {', '.join(SUITES)}")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Row counts for sized cases")
+    ap.add_argument("--repeat", type=int, default=5, help="Runs per case (median reported)")
+    ap.add_argument("--budget", type=float, default=60.0, help="Seconds per case; larger sizes are skipped if estimated over")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--model", help="Model path (default: the one the API would use)")
+    ap.add_argument("--gemini-latency-ms", type=float, default=0.0, help="Simulated Gemini latency in the upload suite")
+    ap.add_argument("--serve-workers", type=int, default=os.cpu_count() or 1, help="gunicorn workers in the serve suite")
+    ap.add_argument("--serve-concurrency", type=int, default=8, help="Concurrent clients in the serve suite")
+    ap.add_argument("--serve-seconds", type=float, default=10.0, help="Load duration per server in the serve suite")
+    ap.add_argument("--out", help="Write results as JSON here")
+    ap.add_argument("--compare", metavar="BASELINE_JSON", help="Compare with a previous run")
+    ap.add_argument("--threshold", type=float, default=0.10, help="Slowdown ratio flagged as regression")
+    args = ap.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    suites = [s.strip() for s in args.suite.split(",") if s.strip()]
+    unknown = [s for s in suites if s not in SUITES]
+    if unknown:
+        raise SystemExit(f"Unknown suite(s): {', '.join(unknown)}")
+
+    # isolate caches, job store and Gemini before the backend modules read their config
+    tmp = tempfile.TemporaryDirectory(prefix="solvibly_bench_")
+    os.environ["SOLVIBLY_CACHE_DIR"] = os.path.join(tmp.name, "cache")
+    os.environ["SOLVIBLY_DATA_DIR"] = os.path.join(tmp.name, "data")
+    os.environ["MARKDOWN_CACHE_MAX_MB"] = "0"
+    os.environ["LLM_CACHE_MAX_MB"] = "0"
+    stub = None
+    if "upload" in suites:
+        stub = start_gemini_stub(args.gemini_latency_ms / 1000.0)
+        os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{stub.server_address[1]}"
+        os.environ["GEMINI_API_KEY"] = "benchmark"
+        os.environ["GEMINI_MAX_RETRIES"] = "0"
+
+    sys.path.insert(0, HERE)
+    from ml_infer import resolve_model_path
+
+    args.model = args.model or resolve_model_path()[0]
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": _environment(args.model),
+              "params": {"sizes": args.sizes, "repeat": args.repeat, "budget_s": args.budget, "seed": args.seed,
+                         "gemini_latency_ms": args.gemini_latency_ms},
+              "results": {}}
+    try:
+        for suite in suites:
+            print(f"[{suite}]", flush=True)
+            globals()[f"suite_{suite}"](args, report["results"])
+    finally:
+        if stub is not None:
+            stub.shutdown()
+        tmp.cleanup()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nResults: {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
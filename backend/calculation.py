@@ -1,4 +1,7 @@
 import math
+import numbers
+
+import numpy as np
 
 # --- HELPER FUNCTIONS ---
 
@@ -236,6 +239,278 @@ def calculate_ohlson_oscore(financials):
     except (ZeroDivisionError, KeyError, TypeError, ValueError):
         return 'N/A'
 
+# --- BATCH MODELS ---
+# Columnar versions of the models above for scoring many company-years at once.
+# `data` is a DataFrame or a dict of equal-length arrays keyed like `financials`:
+# a missing column takes the same default as the scalar .get(), None and NaN keep their
+# scalar meaning (None is "not given", NaN propagates), numeric strings are read only
+# where the scalar model goes through _safe_ratio/float(), and the result is an unrounded
+# float array with NaN where the scalar version returns 'N/A' (_round_or_na on each
+# element gives exactly the scalar output).
+
+def _batch_len(data):
+    if hasattr(data, "columns"):
+        return len(data.index)
+    for v in data.values():
+        return len(v)
+    return 0
+
+def _parse_float(x):
+    # float() as called by _safe_ratio: a value it rejects gives None there, NaN here
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _col(data, key, n, default=np.nan, parse=False):
+    if key not in data:
+        return np.full(n, default, dtype=float)
+    v = np.asarray(data[key])
+    if v.dtype.kind in "fiub":
+        return v.astype(float)
+    v = np.asarray(data[key], dtype=object)  # a str in a list would turn every number into a str
+    if parse:
+        return np.array([_parse_float(x) for x in v], dtype=float)
+    # same as the scalar TypeError path: anything that is not a number is 'N/A'
+    return np.array([float(x) if isinstance(x, numbers.Real) else np.nan for x in v], dtype=float)
+
+def _given(data, key, n):
+    # `financials.get(key) is not None`
+    if key not in data:
+        return np.zeros(n, dtype=bool)
+    v = np.asarray(data[key])
+    if v.dtype.kind in "fiub":
+        return np.ones(n, dtype=bool)
+    return np.array([x is not None for x in np.asarray(data[key], dtype=object)], dtype=bool)
+
+def _rejects_float(x):
+    try:
+        float(x)
+        return False
+    except (TypeError, ValueError):
+        return True
+
+def _rejected(data, key, n):
+    # given, but float() raises on it
+    if key not in data:
+        return np.zeros(n, dtype=bool)
+    v = np.asarray(data[key])
+    if v.dtype.kind in "fiub":
+        return np.zeros(n, dtype=bool)
+    return np.array([x is not None and _rejects_float(x) for x in np.asarray(data[key], dtype=object)], dtype=bool)
+
+def _bool_col(data, key, n):
+    if key not in data:
+        return np.zeros(n, dtype=bool)
+    return np.asarray(data[key], dtype=object).astype(bool)
+
+def _str_col(data, key, n, default=""):
+    if key not in data:
+        return np.full(n, str(default).strip().lower(), dtype=object)
+    return np.array([str(x).strip().lower() for x in data[key]], dtype=object)
+
+def _div(num, den):
+    # ZeroDivisionError / _safe_ratio(den=0) -> NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den == 0, np.nan, num / den)
+
+def _log(x):
+    # math.log element-wise: np.log can differ by 1 ulp and break parity with the scalar models
+    out = np.full(x.shape, np.nan)
+    ok = np.isfinite(x) & (x > 0)
+    out[ok] = np.fromiter(map(math.log, x[ok]), dtype=float, count=int(ok.sum()))
+    return out
+
+def _finite_or_nan(x):
+    x = np.asarray(x, dtype=float)
+    return np.where(np.isfinite(x), x, np.nan)
+
+
+def calculate_altman_zscore_batch(data):
+    n = _batch_len(data)
+    ta = _col(data, "totalAssets", n)
+    wc = _col(data, "workingCapital", n)
+    re = _col(data, "retainedEarnings", n)
+    ebit = _col(data, "ebit", n)
+    tl = _col(data, "totalLiabilities", n)
+    sales = _col(data, "revenue", n)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        X1 = _div(wc, ta)
+        X2 = _div(re, ta)
+        X3 = _div(ebit, ta)
+        X5 = _div(sales, ta)
+
+        is_public = _bool_col(data, "isPubliclyListed", n)
+        manu = _str_col(data, "industrySector", n) == "manufacturing"
+
+        X4_pub = _div(_col(data, "marketCapitalization", n), tl)
+        X4_priv = _div(_col(data, "totalEquity", n), tl)
+        z_pub_manu = 1.2*X1 + 1.4*X2 + 3.3*X3 + 0.6*X4_pub + 1.0*X5
+        z_pub_other = 6.56*X1 + 3.26*X2 + 6.72*X3 + 1.05*X4_priv
+        z_priv = 0.717*X1 + 0.847*X2 + 3.107*X3 + 0.420*X4_priv + 0.998*X5
+
+    z = np.where(is_public & manu, z_pub_manu, np.where(is_public, z_pub_other, z_priv))
+    z = np.where(np.isnan(X5), np.nan, z)  # X5 is computed (and may fail) in every branch
+    return _finite_or_nan(z)
+
+
+def calculate_springate_sscore_batch(data):
+    n = _batch_len(data)
+    ta = _col(data, "totalAssets", n)
+    wc = _col(data, "workingCapital", n)
+    ebit = _col(data, "ebit", n)
+    cl = _col(data, "totalCurrentLiabilities", n, parse=True)
+    sales = _col(data, "revenue", n)
+    interest = _col(data, "interestExpense", n, default=0.0)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        a = _div(wc, ta)
+        b = _div(ebit, ta)
+        ebt = ebit - interest
+        c = _div(ebt, cl)
+        d = _div(sales, ta)
+        s = 1.03*a + 3.07*b + 0.66*c + 0.4*d
+    return _finite_or_nan(s)
+
+
+def calculate_taffler_tscore_batch(data):
+    n = _batch_len(data)
+    ebit = _col(data, "ebit", n)
+    interest = _col(data, "interestExpense", n, default=0.0)
+    cl = _col(data, "totalCurrentLiabilities", n)
+    ca = _col(data, "totalCurrentAssets", n)
+    # ca and cl also go through _safe_ratio, which reads numeric strings
+    cl_ratio = _col(data, "totalCurrentLiabilities", n, parse=True)
+    ca_ratio = _col(data, "totalCurrentAssets", n, parse=True)
+    tl = _col(data, "totalLiabilities", n, parse=True)
+    ta = _col(data, "totalAssets", n, parse=True)
+    sales = _col(data, "revenue", n)
+    depreciation = _col(data, "depreciation", n, default=0.0)
+
+    qa = _col(data, "quickAssets", n)
+    inv = _col(data, "inventories" if "inventories" in data else "inventory", n)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        pbt = ebit - interest
+        qa = np.where(_given(data, "quickAssets", n), qa, ca - inv)
+
+        x1 = _div(pbt, cl_ratio)
+        x2 = _div(ca_ratio, tl)
+        x3 = _div(cl_ratio, ta)
+
+        doe = (sales - pbt - depreciation) / 365.0
+        nci = _div(qa - cl, doe)
+
+        z = 3.20 + 12.18*x1 + 2.50*x2 - 10.68*x3 + 0.029*nci
+    return _finite_or_nan(z)
+
+
+def calculate_fulmer_hfactor_batch(data):
+    n = _batch_len(data)
+    re = _col(data, "retainedEarnings", n, parse=True)
+    sales = _col(data, "revenue", n, parse=True)
+    ebit = _col(data, "ebit", n)
+    ocf = _col(data, "operatingCashFlow", n, parse=True)
+
+    ta = _col(data, "totalAssets", n, parse=True)
+    total_debt = _col(data, "totalDebt" if "totalDebt" in data else "totalLiabilities", n, parse=True)
+    wc = _col(data, "workingCapital", n, parse=True)
+    cl = _col(data, "totalCurrentLiabilities", n, parse=True)
+    equity = _col(data, "totalEquity", n, parse=True)
+    tfa = _col(data, "tangibleFixedAssets", n)
+    ie = _col(data, "interestExpense", n)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        F1 = _div(re, ta)
+        F2 = _div(sales, ta)
+        ebt = ebit - np.where(np.isnan(ie), 0.0, ie)
+        F3 = _div(ebt, equity)
+        F4 = _div(ocf, total_debt)
+        F5 = _div(total_debt, ta)
+        F6 = _div(cl, ta)
+        F7 = _log(tfa)
+        F8 = _div(wc, total_debt)
+        F9 = _div(_log(ebit), ie)
+
+        H = (5.528*F1 + 0.212*F2 + 0.073*F3 + 1.270*F4
+             - 0.120*F5 + 2.335*F6 + 0.575*F7 + 1.083*F8 + 0.894*F9 - 6.075)
+    return _finite_or_nan(H)
+
+
+def calculate_grover_gscore_batch(data):
+    n = _batch_len(data)
+    ta = _col(data, "totalAssets", n)
+    wc = _col(data, "workingCapital", n)
+    ebit = _col(data, "ebit", n)
+    ni = _col(data, "netIncome", n)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        X1 = _div(wc, ta)
+        X2 = _div(ebit, ta)
+        X3 = _div(ni, ta)
+        G = 1.650*X1 + 3.404*X2 - 0.016*X3 + 0.057
+    return _finite_or_nan(G)
+
+
+def calculate_zmijewski_xscore_batch(data):
+    n = _batch_len(data)
+    ta = _col(data, "totalAssets", n, default=1.0, parse=True)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        roa = _div(_col(data, "netIncome", n, default=0.0, parse=True), ta)
+        lev = _div(_col(data, "totalLiabilities", n, default=0.0, parse=True), ta)
+        cr = _div(_col(data, "totalCurrentAssets", n, default=0.0, parse=True),
+                  _col(data, "totalCurrentLiabilities", n, default=1.0, parse=True))
+        X = -4.336 - 4.513*roa + 5.679*lev + 0.004*cr
+    return _finite_or_nan(X)
+
+
+def calculate_ohlson_oscore_batch(data):
+    n = _batch_len(data)
+    ta = _col(data, "totalAssets", n, default=1.0)
+    gnp_index = _col(data, "gnpPriceLevelIndex", n)
+
+    tl = _col(data, "totalLiabilities", n, default=0.0)
+    ca = _col(data, "totalCurrentAssets", n, default=1.0, parse=True)
+    cl = _col(data, "totalCurrentLiabilities", n, default=0.0, parse=True)
+    wc = _col(data, "workingCapital", n, default=0.0)
+    ni_t = _col(data, "netIncome", n, default=0.0)
+    ni_tm1 = _col(data, "netIncome_t_minus_1", n, parse=True)
+    ffo = _col(data, "operatingCashFlow", n, default=0.0, parse=True)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        # only None (or no key) means "no index": a NaN index makes the size NaN
+        no_gnp = ~_given(data, "gnpPriceLevelIndex", n) | (gnp_index == 0)
+        size = np.where(no_gnp, _log(ta), _log(_div(ta, np.where(no_gnp, 1.0, gnp_index))))
+
+        tlta = _div(tl, ta)
+        wcta = _div(wc, ta)
+        clca = _div(cl, ca)
+        nita = _div(ni_t, ta)
+        futl = _div(ffo, tl)
+        oeneg = (tl > ta).astype(float)
+
+        # t-1 as in the scalar model: without it (or with NaN) intwo=0 and chin=0,
+        # a value float() rejects is 'N/A'
+        has_tm1 = ~np.isnan(ni_tm1)
+        intwo = (has_tm1 & (ni_t < 0) & (ni_tm1 < 0)).astype(float)
+        denom = np.abs(ni_t) + np.abs(ni_tm1)
+        chin = np.where(has_tm1 & (denom > 0), _div(ni_t - ni_tm1, denom), 0.0)
+        chin = np.where(_rejected(data, "netIncome_t_minus_1", n), np.nan, chin)
+
+        O = (-1.32
+             - 0.407*size
+             + 6.03*tlta
+             - 1.43*wcta
+             + 0.076*clca
+             - 1.72*oeneg
+             - 2.37*nita
+             - 1.83*futl
+             + 0.285*intwo
+             - 0.521*chin)
+    return _finite_or_nan(O)
+
 # --- ESG ---
 
 _MSCI_MAP = {
@@ -1,14 +1,45 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, g, current_app, stream_with_context
+from werkzeug.datastructures import FileStorage
 from calculation import *
-from calculation import compute_esg_score, _to_float_or_none
-from services import process_document_data
-from ml_infer import score_from_financial_dict, MODEL_PATH_DEFAULT
+from calculation import compute_esg_score, _to_float_or_none, _round_or_na
+from services import process_document_data, warm_up as warm_up_services
+from ml_infer import score_from_financial_dict, score_batch_from_financial_dicts, resolve_model_path, get_model, model_version
+from jobs import JobQueue
+from cache import content_key
+from metrics import METRICS_ENABLED, PREDICT_CACHE, REQUEST_SECONDS, end_request, render as render_metrics, server_timing, span, start_request
+from cachetools import TTLCache
+import pandas as pd
+import json
 import math
 import os
+import shutil
+import tempfile
+import threading
+import time
+
+# resolved once at startup instead of probing the filesystem on every request
+MODEL_PATH, USE_CALIBRATED = resolve_model_path()
+
+PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "10000"))
+
+# portfolio files: a small first chunk so the first lines reach the client quickly
+PORTFOLIO_FIRST_CHUNK_ROWS = int(os.getenv("PORTFOLIO_FIRST_CHUNK_ROWS", "50"))
+PORTFOLIO_CHUNK_ROWS = int(os.getenv("PORTFOLIO_CHUNK_ROWS", "2000"))
+
+# /api/predict results memoized per process (PREDICT_CACHE_SIZE=0 disables)
+PREDICT_CACHE_SIZE = int(os.getenv("PREDICT_CACHE_SIZE", "4096"))
+PREDICT_CACHE_TTL_S = float(os.getenv("PREDICT_CACHE_TTL_S", "600"))
+_predict_cache = TTLCache(maxsize=max(PREDICT_CACHE_SIZE, 1), ttl=PREDICT_CACHE_TTL_S)
+_predict_cache_lock = threading.Lock()
+
+DATA_DIR = os.getenv("SOLVIBLY_DATA_DIR", os.path.join(os.path.dirname(__file__), ".data"))
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
 
 # --- CALCULATIONS LOGIC ---
 
-def _calculate_results(financial_data):
+def _base_results(financial_data, distress=True):
+    """Totals, key ratios, ESG and classic distress models (everything but the Vecthor Index).
+    With distress=False the distress models are left to _distress_results_batch."""
     financial_data["totalAssets"] = financial_data.get("totalCurrentAssets", 0) + financial_data.get("totalNonCurrentAssets", 0)
     financial_data["totalLiabilities"] = financial_data.get("totalCurrentLiabilities", 0) + financial_data.get("totalNonCurrentLiabilities", 0)
     financial_data["workingCapital"] = financial_data.get("totalCurrentAssets", 0) - financial_data.get("totalCurrentLiabilities", 0)
@@ -50,6 +81,8 @@ def _calculate_results(financial_data):
         dscr_value = calculate_dscr(enriched_financial_data)
     
     results["dscr"] = dscr_value
+    if not distress:
+        return results
     results["altmanZScore"] = calculate_altman_zscore(enriched_financial_data)
     results["springateSScore"] = calculate_springate_sscore(enriched_financial_data)
     results["tafflerTScore"] = calculate_taffler_tscore(enriched_financial_data)
@@ -60,59 +93,87 @@ def _calculate_results(financial_data):
     if enriched_financial_data.get("netIncome_t_minus_1"):
         results["ohlsonOScore"] = calculate_ohlson_oscore(enriched_financial_data)
 
-    # --- Vecthor Index ---
-    used_calibrated = False
-    try:
-        fin_for_model = {
-            "sic": financial_data.get("sic"),
-            "fiscalYear": financial_data.get("fiscalYear"),
-            "totalCurrentAssets": financial_data.get("totalCurrentAssets"),
-            "totalNonCurrentAssets": financial_data.get("totalNonCurrentAssets"),
-            "totalCurrentLiabilities": financial_data.get("totalCurrentLiabilities"),
-            "totalNonCurrentLiabilities": financial_data.get("totalNonCurrentLiabilities"),
-            "inventories": financial_data.get("inventories"),
-            "totalAssets": financial_data.get("totalAssets"),
-            "totalLiabilities": financial_data.get("totalLiabilities"),
-            "totalEquity": financial_data.get("totalEquity"),
-            "revenue": financial_data.get("revenue"),
-            "ebit": financial_data.get("ebit"),
-            "netIncome": financial_data.get("netIncome"),
-            "interestExpense": financial_data.get("interestExpense"),
-            "operatingCashFlow": financial_data.get("operatingCashFlow"),
-            "tangibleFixedAssets": financial_data.get("tangibleFixedAssets"),
-            "retainedEarnings": financial_data.get("retainedEarnings"),
-            "depreciation": financial_data.get("depreciation"),
-            "workingCapital": financial_data.get("workingCapital"),
-            "netIncome_t_minus_1": financial_data.get("netIncome_t_minus_1"),
-            "quickAssets": financial_data.get("quickAssets"),
-            "sharesOutstanding": financial_data.get("sharesOutstanding"),
-            "marketCapitalization": financial_data.get("marketCapitalization"),
-            "isPubliclyListed": financial_data.get("isPubliclyListed"),
-            "gnpPriceLevelIndex": financial_data.get("gnpPriceLevelIndex"),
-            "longTermDebtCurrent": financial_data.get("longTermDebtCurrent"),
-            "dscrCashFlow_proxy": financial_data.get("dscrCashFlow", financial_data.get("operatingCashFlow")),
-            "dscrDebtService_proxy": (
-                financial_data.get("dscrDebtService")
-                if financial_data.get("dscrDebtService") is not None
-                else (financial_data.get("interestExpense", 0.0) + financial_data.get("longTermDebtCurrent", 0.0))
-            ),
-        }
-        model_path_try = MODEL_PATH_DEFAULT
-        cal_try = r".\models\vecthor_rf_cal.joblib"
-        if os.path.exists(cal_try):
-            model_path_try = cal_try
-            used_calibrated = True
-
-        ml_out = score_from_financial_dict(model_path_try, fin_for_model)
-        p = float(ml_out["prob_12m"])
-        if p <= 0.0 or p >= 1.0:
-            p = max(1e-6, min(1.0 - 1e-6, p))
-        results["vecthorMLScore"] = round(p, 6)
-    except Exception:
-        results["vecthorMLScore"] = "N/A"
-        used_calibrated = False
-    
-    # --- Solvibly Score — full blend (Vecthor Index + Ratios + Models + ESG + Vecthor Index) ---
+    return results
+
+
+_DISTRESS_MODELS_BATCH = [
+    ("altmanZScore", calculate_altman_zscore_batch),
+    ("springateSScore", calculate_springate_sscore_batch),
+    ("tafflerTScore", calculate_taffler_tscore_batch),
+    ("fulmerHFactor", calculate_fulmer_hfactor_batch),
+    ("groverGScore", calculate_grover_gscore_batch),
+    ("zmijewskiXScore", calculate_zmijewski_xscore_batch),
+    ("ohlsonOScore", calculate_ohlson_oscore_batch),
+]
+
+
+def _distress_results_batch(enriched_rows):
+    """Columnar distress models over many rows, same values as the scalar path in _base_results.
+    Rows are grouped by key set so that a missing key keeps its scalar default."""
+    out = [{} for _ in enriched_rows]
+    groups = {}
+    for i, row in enumerate(enriched_rows):
+        groups.setdefault(frozenset(row), []).append(i)
+
+    for keys, idx in groups.items():
+        columns = {k: [enriched_rows[i][k] for i in idx] for k in keys}
+        for name, model_batch in _DISTRESS_MODELS_BATCH:
+            for i, v in zip(idx, model_batch(columns)):
+                out[i][name] = _round_or_na(float(v))
+
+    for row, scores in zip(enriched_rows, out):
+        if not row.get("netIncome_t_minus_1"):
+            scores["ohlsonOScore"] = 'N/A'
+    return out
+
+
+def _model_input(financial_data):
+    """Base columns expected by the Vecthor pipeline."""
+    return {
+        "sic": financial_data.get("sic"),
+        "fiscalYear": financial_data.get("fiscalYear"),
+        "totalCurrentAssets": financial_data.get("totalCurrentAssets"),
+        "totalNonCurrentAssets": financial_data.get("totalNonCurrentAssets"),
+        "totalCurrentLiabilities": financial_data.get("totalCurrentLiabilities"),
+        "totalNonCurrentLiabilities": financial_data.get("totalNonCurrentLiabilities"),
+        "inventories": financial_data.get("inventories"),
+        "totalAssets": financial_data.get("totalAssets"),
+        "totalLiabilities": financial_data.get("totalLiabilities"),
+        "totalEquity": financial_data.get("totalEquity"),
+        "revenue": financial_data.get("revenue"),
+        "ebit": financial_data.get("ebit"),
+        "netIncome": financial_data.get("netIncome"),
+        "interestExpense": financial_data.get("interestExpense"),
+        "operatingCashFlow": financial_data.get("operatingCashFlow"),
+        "tangibleFixedAssets": financial_data.get("tangibleFixedAssets"),
+        "retainedEarnings": financial_data.get("retainedEarnings"),
+        "depreciation": financial_data.get("depreciation"),
+        "workingCapital": financial_data.get("workingCapital"),
+        "netIncome_t_minus_1": financial_data.get("netIncome_t_minus_1"),
+        "quickAssets": financial_data.get("quickAssets"),
+        "sharesOutstanding": financial_data.get("sharesOutstanding"),
+        "marketCapitalization": financial_data.get("marketCapitalization"),
+        "isPubliclyListed": financial_data.get("isPubliclyListed"),
+        "gnpPriceLevelIndex": financial_data.get("gnpPriceLevelIndex"),
+        "longTermDebtCurrent": financial_data.get("longTermDebtCurrent"),
+        "dscrCashFlow_proxy": financial_data.get("dscrCashFlow", financial_data.get("operatingCashFlow")),
+        "dscrDebtService_proxy": (
+            financial_data.get("dscrDebtService")
+            if financial_data.get("dscrDebtService") is not None
+            else (financial_data.get("interestExpense", 0.0) + financial_data.get("longTermDebtCurrent", 0.0))
+        ),
+    }
+
+
+def _ml_score(ml_out):
+    p = float(ml_out["prob_12m"])
+    if p <= 0.0 or p >= 1.0:
+        p = max(1e-6, min(1.0 - 1e-6, p))
+    return round(p, 6)
+
+
+def _blend_results(results, used_calibrated):
+    """Solvibly Score — full blend (Vecthor Index + Ratios + Models + ESG + Vecthor Index)."""
     def _to_num(x):
         try:
             v = float(x)
@@ -290,91 +351,469 @@ def _calculate_results(financial_data):
 
     return results
 
+
+def _calculate_results(financial_data):
+    with span("calculate"):
+        results = _base_results(financial_data)
+
+    # --- Vecthor Index ---
+    used_calibrated = False
+    try:
+        with span("score"):
+            ml_out = score_from_financial_dict(MODEL_PATH, _model_input(financial_data))
+        results["vecthorMLScore"] = _ml_score(ml_out)
+        used_calibrated = USE_CALIBRATED
+    except Exception:
+        results["vecthorMLScore"] = "N/A"
+
+    return _blend_results(results, used_calibrated)
+
+
+def _calculate_results_batch(rows):
+    """Same output as _calculate_results for each row, with a single model call for the batch.
+    Rows that fail (or exceptions passed in place of a row) become {"error": ...} entries."""
+    out = [None] * len(rows)
+    enriched_idx, enriched_rows = [], []
+    model_rows, model_idx = [], []
+    for i, financial_data in enumerate(rows):
+        if isinstance(financial_data, Exception):
+            out[i] = {"error": f"Invalid input: {financial_data}"}
+            continue
+        try:
+            out[i] = _base_results(financial_data, distress=False)
+        except Exception as e:
+            out[i] = {"error": f"An unexpected error occurred: {str(e)}"}
+            continue
+        enriched_idx.append(i)
+        enriched_rows.append({**financial_data, **out[i]})
+        try:
+            model_rows.append(_model_input(financial_data))
+            model_idx.append(i)
+        except Exception:
+            pass
+
+    with span("calculate"):
+        for i, scores in zip(enriched_idx, _distress_results_batch(enriched_rows)):
+            out[i].update(scores)
+
+    ml_scores = {}
+    try:
+        with span("score"):
+            ml_batch = score_batch_from_financial_dicts(MODEL_PATH, model_rows)
+        for i, ml_out in zip(model_idx, ml_batch):
+            ml_scores[i] = _ml_score(ml_out)
+    except Exception:
+        # batch call failed: fall back to per-row scoring so one bad row does not sink the rest
+        for i, fin_for_model in zip(model_idx, model_rows):
+            try:
+                ml_scores[i] = _ml_score(score_from_financial_dict(MODEL_PATH, fin_for_model))
+            except Exception:
+                pass
+
+    for i, results in enumerate(out):
+        if "error" in results:
+            continue
+        try:
+            if i in ml_scores:
+                results["vecthorMLScore"] = ml_scores[i]
+                out[i] = _blend_results(results, USE_CALIBRATED)
+            else:
+                results["vecthorMLScore"] = "N/A"
+                out[i] = _blend_results(results, False)
+        except Exception as e:
+            out[i] = {"error": f"An unexpected error occurred: {str(e)}"}
+    return out
+
+
+# --- STARTUP ---
+
+def warm_up(converter=True):
+    """Loads the model and the lazily-imported dependencies before the first request.
+    In a pre-fork server this runs in the master, so workers share the pages copy-on-write
+    (with converter=False: see services.warm_up)."""
+    warm_up_services(converter)
+    if os.path.exists(MODEL_PATH):
+        get_model(MODEL_PATH)
+
+
+# --- REQUEST TIMING ---
+
+def begin_request_timing():
+    g.request_timing = (time.perf_counter(), start_request())
+
+
+def end_request_timing(response):
+    """Adds the request's spans as a Server-Timing header and records its latency."""
+    started = g.pop('request_timing', None)
+    if started is None:
+        return response
+    t0, token = started
+    spans = end_request(token)
+    elapsed = time.perf_counter() - t0
+    response.headers['Server-Timing'] = server_timing(spans + [('total', elapsed)])
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint, response.status_code)
+    return response
+
+
 # --- ENDPOINTS LOGIC ---
 
+def _coerce_predict_payload(data):
+    """Maps a manual-form payload to the financial_data dict used by _calculate_results."""
+    numeric_keys = [
+        "totalCurrentAssets", "totalNonCurrentAssets", "inventories",
+        "totalCurrentLiabilities", "totalNonCurrentLiabilities",
+        "retainedEarnings", "ebit", "revenue", "totalEquity",
+        "netIncome", "interestExpense", "tangibleFixedAssets",
+        "operatingCashFlow", "marketCapitalization",
+        "dscrCashFlow", "dscrDebtService", "netIncome_t_minus_1"
+    ]
+    string_keys = ["country", "companyName", "industrySector", "fiscalYear", "isPubliclyListed", "esgRating"]
+
+    financial_data = {}
+    for key in numeric_keys:
+        if key == "marketCapitalization" and not data.get("isPubliclyListed"):
+            financial_data[key] = 0.0
+        else:
+            financial_data[key] = float(data.get(key) or 0)
+    for key in string_keys:
+        financial_data[key] = data.get(key)
+
+    isp = financial_data.get("isPubliclyListed")
+    if isinstance(isp, str):
+        isp_l = isp.strip().lower()
+        financial_data["isPubliclyListed"] = isp_l in ("true", "1", "yes", "y", "on")
+
+    financial_data["esgRating"] = (financial_data.get("esgRating") or "").strip().upper()
+    financial_data["esgScore_E"] = _to_float_or_none(data.get("esgScore_E"))
+    financial_data["esgScore_S"] = _to_float_or_none(data.get("esgScore_S"))
+    financial_data["esgScore_G"] = _to_float_or_none(data.get("esgScore_G"))
+    return financial_data
+
+
+def _predict_cache_key(financial_data):
+    """Canonical hash of the coerced input plus the version of the model that would score it."""
+    try:
+        version = model_version(MODEL_PATH)
+    except Exception:
+        version = "unavailable"  # scored as "N/A": cached apart from real scores
+    canonical = json.dumps(financial_data, sort_keys=True, separators=(",", ":"), default=str)
+    return content_key(canonical, version, str(USE_CALIBRATED))
+
+
 def predict():
-    """MANUAL FORM LOGIC"""
+    """MANUAL FORM LOGIC (ETag on every response: send it back as If-None-Match to get a 304)"""
     try:
         data = request.get_json()
-    
-        numeric_keys = [
-            "totalCurrentAssets", "totalNonCurrentAssets", "inventories",
-            "totalCurrentLiabilities", "totalNonCurrentLiabilities",
-            "retainedEarnings", "ebit", "revenue", "totalEquity",
-            "netIncome", "interestExpense", "tangibleFixedAssets",
-            "operatingCashFlow", "marketCapitalization",
-            "dscrCashFlow", "dscrDebtService", "netIncome_t_minus_1"
-        ]
-        string_keys = ["country", "companyName", "industrySector", "fiscalYear", "isPubliclyListed", "esgRating"]
-
-        financial_data = {}
-        for key in numeric_keys:
-            if key == "marketCapitalization" and not data.get("isPubliclyListed"):
-                financial_data[key] = 0.0
-            else:
-                financial_data[key] = float(data.get(key) or 0)
-        for key in string_keys:
-            financial_data[key] = data.get(key)
-
-        isp = financial_data.get("isPubliclyListed")
-        if isinstance(isp, str):
-            isp_l = isp.strip().lower()
-            financial_data["isPubliclyListed"] = isp_l in ("true", "1", "yes", "y", "on")
-
-        financial_data["esgRating"] = (financial_data.get("esgRating") or "").strip().upper()
-        financial_data["esgScore_E"] = _to_float_or_none(data.get("esgScore_E"))
-        financial_data["esgScore_S"] = _to_float_or_none(data.get("esgScore_S"))
-        financial_data["esgScore_G"] = _to_float_or_none(data.get("esgScore_G"))
-        
-        results = _calculate_results(financial_data)
-        return jsonify(results)
+        financial_data = _coerce_predict_payload(data)
+        key = _predict_cache_key(financial_data)
+
+        if request.if_none_match.contains(key):
+            PREDICT_CACHE.inc("not_modified")
+            response = Response(status=304)
+            response.set_etag(key)
+            return response
+
+        results = None
+        if PREDICT_CACHE_SIZE > 0:
+            with _predict_cache_lock:
+                results = _predict_cache.get(key)
+        PREDICT_CACHE.inc("hit" if results is not None else "miss")
+        if results is None:
+            results = _calculate_results(financial_data)
+            if PREDICT_CACHE_SIZE > 0:
+                with _predict_cache_lock:
+                    _predict_cache[key] = results
+
+        response = jsonify(results)
+        response.set_etag(key)
+        return response
 
     except Exception as e:
         return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
 
 
-def upload():
-    """UPLOAD FILE LOGIC"""
+def predict_batch():
+    """BATCH FORM LOGIC: list of manual-form payloads, one model call for the whole batch"""
     try:
-        file = request.files.get('document')
-        previous_pdf = request.files.get('previousDocument')
-        country = request.form.get('country')
-        company_type = request.form.get('companyType')
-        industry_sector = request.form.get('industrySector')
+        data = request.get_json()
+        payloads = data.get("companies") if isinstance(data, dict) else data
+        if not isinstance(payloads, list):
+            return jsonify({'error': 'Expected a JSON list of companies'}), 400
+        if len(payloads) > PREDICT_BATCH_MAX_ROWS:
+            return jsonify({'error': f'Batch too large (max {PREDICT_BATCH_MAX_ROWS} companies)'}), 400
+
+        rows = []
+        for item in payloads:
+            try:
+                rows.append(_coerce_predict_payload(item))
+            except Exception as e:
+                rows.append(e)
+
+        results = _calculate_results_batch(rows)
+        return jsonify({"results": results})
 
-        dscr_cash_flow = request.form.get('dscrCashFlow')
-        dscr_debt_service = request.form.get('dscrDebtService')
-        net_income_prev = request.form.get('netIncome_t_minus_1')
+    except Exception as e:
+        return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
 
-        esg_rating = request.form.get('esgRating')
-        esg_e = request.form.get('esgScore_E')
-        esg_s = request.form.get('esgScore_S')
-        esg_g = request.form.get('esgScore_G')
 
-        if not file:
-            return jsonify({'error': 'No file part'}), 400
+# --- PORTFOLIO FILES ---
 
-        financial_data_from_file = process_document_data(
-            file, country, company_type, industry_sector, prev_file=previous_pdf
-        )
+_PORTFOLIO_COLUMNS = {
+    "totalCurrentAssets", "totalNonCurrentAssets", "inventories", "totalCurrentLiabilities",
+    "totalNonCurrentLiabilities", "retainedEarnings", "ebit", "revenue", "totalEquity", "netIncome",
+    "interestExpense", "tangibleFixedAssets", "operatingCashFlow", "marketCapitalization", "dscrCashFlow",
+    "dscrDebtService", "netIncome_t_minus_1", "country", "companyName", "industrySector", "fiscalYear",
+    "isPubliclyListed", "esgRating", "esgScore_E", "esgScore_S", "esgScore_G",
+}
 
-        financial_data_from_file['dscrCashFlow'] = float(dscr_cash_flow or 0)
-        financial_data_from_file['dscrDebtService'] = float(dscr_debt_service or 0)
 
-        if net_income_prev:
-            financial_data_from_file['netIncome_t_minus_1'] = float(net_income_prev)
+def _chunk_sizes():
+    yield max(1, PORTFOLIO_FIRST_CHUNK_ROWS)
+    while True:
+        yield max(1, PORTFOLIO_CHUNK_ROWS)
 
-        financial_data_from_file['isPubliclyListed'] = str(company_type or '').strip().lower() in ('public', 'listed', 'yes', 'true', 'on', '1')
 
-        financial_data_from_file['esgRating'] = (esg_rating or '').strip().upper()
-        financial_data_from_file['esgScore_E'] = _to_float_or_none(esg_e)
-        financial_data_from_file['esgScore_S'] = _to_float_or_none(esg_s)
-        financial_data_from_file['esgScore_G'] = _to_float_or_none(esg_g)
+def _open_portfolio(stream, filename):
+    """(header, iterator of row-dict chunks, close) for an uploaded CSV/XLSX, read incrementally.
+    `close` releases the reader; it is safe to call more than once, and before the iterator starts.
+    Raises ValueError for files that cannot be used (shown to the client as a 400)."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        # every cell as text, empty cells as "": the same shapes a form post produces
+        reader = pd.read_csv(stream, dtype=str, keep_default_na=False, iterator=True)
+        sizes = _chunk_sizes()
+        try:
+            first = reader.get_chunk(next(sizes))
+        except StopIteration:
+            first = pd.DataFrame()
+        except Exception:
+            reader.close()
+            raise
+
+        def chunks():
+            df = first
+            while len(df):
+                yield df.to_dict("records")
+                try:
+                    df = reader.get_chunk(next(sizes))
+                except StopIteration:
+                    return
+        return list(first.columns), chunks(), reader.close
+
+    if name.endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("XLSX files need the openpyxl package on the server; upload a CSV instead")
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(c) if c is not None else "" for c in next(rows, ())]
+
+        def chunks():
+            sizes = _chunk_sizes()
+            chunk, size = [], next(sizes)
+            for values in rows:
+                chunk.append(dict(zip(header, values)))
+                if len(chunk) >= size:
+                    yield chunk
+                    chunk, size = [], next(sizes)
+            if chunk:
+                yield chunk
+        return header, chunks(), workbook.close
+
+    raise ValueError("Unsupported file type: upload a .csv or .xlsx file")
+
+
+def predict_portfolio():
+    """PORTFOLIO FILE LOGIC: CSV/XLSX with the predict field names as columns, one company per row.
+    Streams NDJSON, one line per row ({"row": n, ...results} or {"row": n, "error": ...}),
+    as each chunk is scored."""
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'error': 'No file part'}), 400
+
+    # Flask closes the upload when this view returns, before the response is streamed:
+    # the generator reads from its own copy (on disk, so memory stays flat for large files)
+    spool = tempfile.TemporaryFile()
+    close_reader = None
+    try:
+        with span("file_save"):
+            shutil.copyfileobj(file.stream, spool, 1 << 20)
+        spool.seek(0)
+        header, chunks, close_reader = _open_portfolio(spool, file.filename)
+        if not _PORTFOLIO_COLUMNS.intersection(header):
+            raise ValueError('No known columns: use the same field names as /api/predict')
+    except Exception as e:
+        if close_reader is not None:
+            close_reader()
+        spool.close()
+        message = str(e) if isinstance(e, ValueError) else f'Could not read the file: {str(e)}'
+        return jsonify({'error': message}), 400
+
+    def close():
+        # from the generator when it ends, and from the response when it is closed: a client
+        # that disconnects before the first chunk never runs the generator at all
+        chunks.close()
+        close_reader()
+        spool.close()
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        row = 0
+        try:
+            for items in chunks:
+                rows = []
+                for item in items:
+                    try:
+                        rows.append(_coerce_predict_payload(item))
+                    except Exception as e:
+                        rows.append(e)
+                for results in _calculate_results_batch(rows):
+                    yield dumps({"row": row, **results}) + "\n"
+                    row += 1
+        except Exception as e:
+            yield dumps({"row": row, "error": f'An unexpected error occurred: {str(e)}'}) + "\n"
+        finally:
+            close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'  # let reverse proxies pass lines through as they come
+    response.call_on_close(close)
+    return response
+
+
+def _process_upload(file, previous_pdf, form):
+    """Document extraction + scoring for an upload; `form` is request.form or a plain dict."""
+    country = form.get('country')
+    company_type = form.get('companyType')
+    industry_sector = form.get('industrySector')
+
+    dscr_cash_flow = form.get('dscrCashFlow')
+    dscr_debt_service = form.get('dscrDebtService')
+    net_income_prev = form.get('netIncome_t_minus_1')
+
+    esg_rating = form.get('esgRating')
+    esg_e = form.get('esgScore_E')
+    esg_s = form.get('esgScore_S')
+    esg_g = form.get('esgScore_G')
+
+    financial_data_from_file = process_document_data(
+        file, country, company_type, industry_sector, prev_file=previous_pdf
+    )
 
-        results = _calculate_results(financial_data_from_file)
+    financial_data_from_file['dscrCashFlow'] = float(dscr_cash_flow or 0)
+    financial_data_from_file['dscrDebtService'] = float(dscr_debt_service or 0)
+
+    if net_income_prev:
+        financial_data_from_file['netIncome_t_minus_1'] = float(net_income_prev)
+
+    financial_data_from_file['isPubliclyListed'] = str(company_type or '').strip().lower() in ('public', 'listed', 'yes', 'true', 'on', '1')
+
+    financial_data_from_file['esgRating'] = (esg_rating or '').strip().upper()
+    financial_data_from_file['esgScore_E'] = _to_float_or_none(esg_e)
+    financial_data_from_file['esgScore_S'] = _to_float_or_none(esg_s)
+    financial_data_from_file['esgScore_G'] = _to_float_or_none(esg_g)
+
+    return _calculate_results(financial_data_from_file)
+
+
+# --- UPLOAD JOBS ---
+
+def _run_upload_job(job_id, payload):
+    """Worker-side upload: reopens the stored documents and runs the same logic as upload()."""
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    opened = []
+    try:
+        docs = {}
+        for field, filename in payload["files"].items():
+            fh = open(os.path.join(job_dir, field), "rb")
+            opened.append(fh)
+            docs[field] = FileStorage(stream=fh, filename=filename, name=field)
+        return _process_upload(docs['document'], docs.get('previousDocument'), payload["form"])
+    finally:
+        for fh in opened:
+            fh.close()
+
+
+def _remove_upload_job_files(job_id):
+    """Called by the queue once the job is over for good (a retry still needs the documents)."""
+    shutil.rmtree(os.path.join(JOBS_DIR, job_id), ignore_errors=True)
+
+
+def _enqueue_upload(files, form):
+    """Stores the uploaded documents next to the job database and queues the job."""
+    jobs = get_upload_jobs()
+    job_id = jobs.new_id()
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    stored = {}
+    with span("file_save"):
+        for field, file in files.items():
+            if file:
+                file.save(os.path.join(job_dir, field))
+                stored[field] = file.filename
+    return jobs.submit({"files": stored, "form": form.to_dict()}, job_id=job_id)
+
+
+_upload_jobs = None
+_upload_jobs_lock = threading.Lock()
+
+
+def get_upload_jobs():
+    """The upload JobQueue, created on first use: importing the module touches no files."""
+    global _upload_jobs
+    with _upload_jobs_lock:
+        if _upload_jobs is None:
+            _upload_jobs = JobQueue(
+                os.path.join(JOBS_DIR, "jobs.sqlite"),
+                handler=_run_upload_job,
+                cleanup=_remove_upload_job_files,
+                workers=int(os.getenv("UPLOAD_JOB_WORKERS", "2")),
+                lease_s=float(os.getenv("UPLOAD_JOB_LEASE_S", "300")),
+            )
+        return _upload_jobs
+
+
+def upload():
+    """UPLOAD FILE LOGIC (add ?async=1 to queue the work and poll /api/jobs/<id>)"""
+    try:
+        file = request.files.get('document')
+        previous_pdf = request.files.get('previousDocument')
+
+        if not file:
+            return jsonify({'error': 'No file part'}), 400
+
+        if str(request.args.get('async') or request.form.get('async') or '').strip().lower() in ('1', 'true', 'yes', 'on'):
+            job_id = _enqueue_upload({'document': file, 'previousDocument': previous_pdf}, request.form)
+            return jsonify({'jobId': job_id, 'status': 'queued', 'statusUrl': f'/api/jobs/{job_id}'}), 202
+
+        results = _process_upload(file, previous_pdf, request.form)
         return jsonify(results)
         
     except Exception as e:
         import traceback #to remove
         traceback.print_exc() #to remove
         return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
+
+
+def get_job(job_id):
+    """UPLOAD JOB STATUS"""
+    job = get_upload_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    body = {'jobId': job['id'], 'status': job['status']}
+    if job['status'] == 'done':
+        body['result'] = job['result']
+    elif job['status'] == 'failed':
+        body['error'] = f"An unexpected error occurred: {job['error']}"
+    return jsonify(body)
+
+
+def metrics():
+    """PROMETHEUS METRICS (disabled with METRICS_ENABLED=0)"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,49 @@
+"""gunicorn -c gunicorn.conf.py wsgi:app
+
+Pre-fork serving: the master imports wsgi.py (model + dependencies) once, then forks the
+workers. Every setting can be overridden from the environment.
+"""
+import gc
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# uploads mostly wait on Gemini: a few threads per worker keep the CPU busy meanwhile
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+# load the app in the master so the workers share its memory
+preload_app = True
+
+# recycle workers gracefully (bounds slow leaks); jitter keeps them from restarting together
+max_requests = int(os.getenv("MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "100"))
+# an upload can take a Gemini timeout plus retries
+timeout = int(os.getenv("WORKER_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = os.getenv("ACCESS_LOG", "-") or None  # ACCESS_LOG= (empty) turns it off
+
+
+def pre_fork(server, worker):
+    # move everything loaded so far out of the GC's reach: collections in the workers would
+    # otherwise write to (and un-share) every page holding a preloaded object
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from controller import get_upload_jobs
+    from services import warm_up
+
+    warm_up(converter=True)  # not fork-safe, so not preloaded by the master
+    get_upload_jobs().start()
+
+
+def worker_exit(server, worker):
+    # recycled (max_requests) or shut down: requeue the upload jobs this worker was running,
+    # otherwise they would wait for their lease to expire before another worker retries them
+    from controller import get_upload_jobs
+
+    get_upload_jobs().stop()
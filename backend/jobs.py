@@ -0,0 +1,233 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing
+
+# --- JOB QUEUE ---
+
+class JobQueue:
+    """Durable local job queue: SQLite for state, a bounded pool of worker threads for the work.
+
+    Jobs survive restarts: queued jobs are picked up by the next process that starts the
+    queue, and running jobs whose lease expired (their worker died) are claimed again,
+    up to `max_attempts`. Several processes can share the same database file.
+
+    A claim is owned through its attempt number: a heartbeat renews the lease of the jobs
+    this process is running, and only the current attempt can finish a job. `cleanup(job_id)`
+    runs once a job is over for good (finished by its owner, or lost too many times).
+    stop() hands the jobs still running in this process back to the queue.
+    """
+
+    def __init__(self, db_path, handler, workers=2, lease_s=900.0, max_attempts=3, poll_s=1.0, cleanup=None):
+        self.db_path = db_path
+        self.handler = handler
+        self.cleanup = cleanup
+        self.workers = max(1, int(workers))
+        self.lease_s = float(lease_s)
+        self.max_attempts = int(max_attempts)
+        self.poll_s = float(poll_s)
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._running = set()  # (job_id, attempt) claims whose lease the heartbeat keeps alive
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def submit(self, payload, job_id=None):
+        """Stores the job as 'queued' and wakes a worker; returns the job id."""
+        job_id = job_id or self.new_id()
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(payload), now, now),
+            )
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "result": json.loads(row[2]) if row[2] is not None else None,
+            "error": row[3],
+            "attempts": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+
+    def start(self):
+        """Starts the worker threads once per process (safe to call after a fork)."""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True).start()
+            threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+        self._wake.set()
+
+    def stop(self):
+        """Stops claiming and requeues this process's running jobs (e.g. before a worker exits),
+        so another process picks them up now instead of after their lease."""
+        self._stopping.set()
+        self._wake.set()
+        with self._lock:
+            running = list(self._running)
+        for job_id, attempt in running:
+            self._release(job_id, attempt)
+
+    def _release(self, job_id, attempt):
+        # the attempt number stays: the abandoned handler can no longer finish the job
+        with self._lock:
+            self._running.discard((job_id, attempt))
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', lease_until = NULL, updated_at = ? "
+                    "WHERE id = ? AND attempts = ? AND status = 'running'",
+                    (time.time(), job_id, attempt),
+                )
+        except sqlite3.Error:
+            traceback.print_exc()  # the lease expires and the job is claimed again
+
+    def _claim(self):
+        """Returns (job_id, payload, attempt) for the next job, or None."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            lost = [r[0] for r in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )]
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', lease_until = NULL, "
+                "updated_at = ? WHERE id = ?",
+                [(now, job_id) for job_id in lost],
+            )
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (now + self.lease_s, now, row[0]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        for job_id in lost:
+            self._cleanup(job_id)
+        return (row[0], json.loads(row[1]), row[2] + 1) if row is not None else None
+
+    def _finish(self, job_id, attempt, result=None, error=None):
+        """Stores the outcome (and cleans up) if `attempt` still owns the job; returns whether it did."""
+        status = "failed" if error is not None else "done"
+        with closing(self._connect()) as conn:
+            owned = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = 'running'",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, attempt),
+            ).rowcount == 1
+        if owned:
+            self._cleanup(job_id)
+        return owned
+
+    def _cleanup(self, job_id):
+        if self.cleanup is None:
+            return
+        try:
+            self.cleanup(job_id)
+        except Exception:
+            traceback.print_exc()
+
+    def _heartbeat_loop(self):
+        # three beats per lease: one failed write (database busy) does not lose the job
+        while not self._stopping.wait(self.lease_s / 3):
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            now = time.time()
+            try:
+                with closing(self._connect()) as conn:
+                    conn.executemany(
+                        "UPDATE jobs SET lease_until = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                        [(now + self.lease_s, job_id, attempt) for job_id, attempt in running],
+                    )
+            except sqlite3.Error:
+                traceback.print_exc()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_s)
+                self._wake.clear()
+                continue
+
+            job_id, payload, attempt = job
+            with self._lock:
+                self._running.add((job_id, attempt))
+            if self._stopping.is_set():  # claimed while stop() was releasing
+                self._release(job_id, attempt)
+                break
+            try:
+                try:
+                    result = self.handler(job_id, payload)
+                except Exception as e:
+                    self._finish(job_id, attempt, error=str(e))
+                else:
+                    self._finish(job_id, attempt, result=result)
+            except Exception:
+                # e.g. "database is locked": the lease runs out and the job is claimed again
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._running.discard((job_id, attempt))
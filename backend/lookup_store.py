@@ -0,0 +1,97 @@
+import argparse
+import math
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+# --- LOOKUP STORE ---
+
+class LookupStore:
+    """SQLite copy of a training-style CSV, indexed on (cik, fiscalYear).
+
+    Built once from the CSV in chunks (`build`), then every lookup is an index seek
+    instead of a full `pd.read_csv`. The source file's size and mtime are recorded,
+    so `for_csv` rebuilds the store when the CSV changes.
+    """
+
+    TABLE = "rows"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _connect(self):
+        # as_uri() percent-encodes '?', '#' and '%' in the path, which SQLite would otherwise parse
+        return sqlite3.connect(Path(self.db_path).absolute().as_uri() + "?mode=ro", uri=True, timeout=30)
+
+    @staticmethod
+    def _source_sig(csv_path):
+        st = os.stat(csv_path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    @classmethod
+    def build(cls, csv_path, db_path, columns=None, chunk_rows=50_000):
+        """Loads `columns` (all when None) of `csv_path` into a fresh store at `db_path`."""
+        tmp_path = f"{db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        usecols = (lambda c: c in set(columns)) if columns else None
+        with closing(sqlite3.connect(tmp_path)) as conn:
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, low_memory=False, usecols=usecols):
+                chunk.to_sql(cls.TABLE, conn, if_exists="append", index=False)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {cls.TABLE}_cik_year ON {cls.TABLE} (cik, fiscalYear)")
+            conn.execute("CREATE TABLE store_meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT INTO store_meta VALUES ('source', ?), ('source_sig', ?)",
+                         (os.path.abspath(csv_path), cls._source_sig(csv_path)))
+            conn.commit()
+        os.replace(tmp_path, db_path)
+        return cls(db_path)
+
+    @classmethod
+    def for_csv(cls, csv_path, db_path=None, columns=None):
+        """Store next to `csv_path` (<csv>.lookup.sqlite), built or rebuilt when missing or stale."""
+        db_path = db_path or f"{csv_path}.lookup.sqlite"
+        if os.path.exists(db_path):
+            store = cls(db_path)
+            if store.source_sig() == cls._source_sig(csv_path):
+                return store
+        return cls.build(csv_path, db_path, columns=columns)
+
+    def source_sig(self):
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT value FROM store_meta WHERE key = 'source_sig'").fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def get(self, cik, year):
+        """First row (in file order) for `(cik, year)` as a dict, or None.
+
+        Missing values come back as NaN, like a row read with pandas.
+        """
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                f"SELECT * FROM {self.TABLE} WHERE cik = ? AND fiscalYear = ? ORDER BY rowid LIMIT 1",
+                (int(cik), int(year)),
+            )
+            row = cur.fetchone()
+            names = [d[0] for d in cur.description]
+        if row is None:
+            return None
+        return {k: (math.nan if v is None else v) for k, v in zip(names, row)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the (cik, fiscalYear) lookup store for a CSV")
+    ap.add_argument("--csv", required=True, help="Path to vecthor_training_v3.csv")
+    ap.add_argument("--db", help="Output SQLite path (default: <csv>.lookup.sqlite)")
+    args = ap.parse_args()
+    store = LookupStore.build(args.csv, args.db or f"{args.csv}.lookup.sqlite")
+    print(f"Lookup store: {store.db_path}")
+
+
+if __name__ == "__main__":
+    main()
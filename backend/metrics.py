@@ -0,0 +1,147 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# aggregation into histograms/counters for /api/metrics; Server-Timing works either way
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# --- METRIC TYPES ---
+
+def _labels_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{k}="{str(v)}"' for k, v in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1.0):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        names = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels_text(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, labels)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, labels)} {cumulative}")
+        return lines
+
+# --- REGISTRY ---
+
+STAGE_SECONDS = Histogram("solvibly_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+REQUEST_SECONDS = Histogram("solvibly_request_seconds", "HTTP request latency", ("endpoint", "status"))
+LLM_CALLS = Counter("solvibly_llm_calls_total", "Gemini calls by outcome", ("outcome",))
+PREDICT_CACHE = Counter("solvibly_predict_cache_total", "/api/predict lookups by result", ("result",))
+MODEL_LOAD_SECONDS = Histogram("solvibly_model_load_seconds", "Time to load a model into the registry",
+                               buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+_METRICS = [STAGE_SECONDS, REQUEST_SECONDS, LLM_CALLS, PREDICT_CACHE, MODEL_LOAD_SECONDS]
+_COLLECTORS = []
+
+
+def register_cache(name, cache):
+    """Exposes a DiskCache's counters at scrape time (nothing is recorded on the hot path)."""
+    _COLLECTORS.append((name, cache))
+
+
+def render():
+    """Prometheus text exposition of every metric."""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    if _COLLECTORS:
+        stats = [(name, cache.stats()) for name, cache in _COLLECTORS]
+        for field, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("bytes", "gauge")):
+            metric = f"solvibly_cache_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {metric} Disk cache {field}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, st in stats:
+                lines.append(f'{metric}{{cache="{name}"}} {st[field]}')
+    return "\n".join(lines) + "\n"
+
+# --- REQUEST SPANS ---
+
+_SPANS = contextvars.ContextVar("solvibly_spans", default=None)
+
+
+def start_request():
+    """Starts collecting spans for the current request; returns the token for end_request."""
+    return _SPANS.set([])
+
+
+def end_request(token):
+    """Stops collecting and returns the spans recorded since start_request as (name, seconds)."""
+    spans = _SPANS.get()
+    _SPANS.reset(token)
+    return spans or []
+
+
+@contextmanager
+def span(stage):
+    """Times the block: added to the request's Server-Timing and to the stage histogram.
+    Code running on executor threads must be submitted through contextvars.copy_context().run
+    for its spans to reach the request."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        spans = _SPANS.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+        STAGE_SECONDS.observe(elapsed, stage)
+
+
+def server_timing(spans):
+    """Server-Timing header value (durations in ms), one entry per span in completion order."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans)
@@ -1,21 +1,23 @@
 # ml_infer.py — ML for Vecthor Index
 from __future__ import annotations
-import argparse, json, os, sys
-from typing import Any, Dict, List
+import argparse, copy, hashlib, json, os, sys, threading, time, weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-from joblib import load
 
 # path modello di default: ./models/vecthor_best.joblib accanto a questo file
 HERE = os.path.dirname(__file__)
 MODEL_PATH_DEFAULT = os.path.join(HERE, "models", "vecthor_best.joblib")
+MODEL_PATH_CALIBRATED = os.path.join(HERE, "models", "vecthor_rf_cal.joblib")
+MODEL_PATH_COMPACT = os.path.join(HERE, "models", "vecthor_best.npz")
 
-# hack per far trovare gli oggetti picklati (_feat_eng, _feat_names_out, SafeImputer)
-import train_vecthor_model
-sys.modules["__main__"]._feat_eng = train_vecthor_model._feat_eng
-sys.modules["__main__"]._feat_names_out = train_vecthor_model._feat_names_out
-sys.modules["__main__"].SafeImputer = train_vecthor_model.SafeImputer
+import vecthor_features
+from lookup_store import LookupStore
+from metrics import MODEL_LOAD_SECONDS
+from vecthor_features import ENGINEERED_COLUMNS, ENGINEERED_EXTRA, ID_COLS, _feat_eng
 
 # colonne base attese dal modello
 FEATURE_COLUMNS: List[str] = [
@@ -30,6 +32,91 @@ FEATURE_COLUMNS: List[str] = [
     "longTermDebtCurrent","dscrCashFlow_proxy","dscrDebtService_proxy",
 ]
 
+# --- MODEL REGISTRY ---
+# un solo load per processo; ricarica atomica solo se il file cambia (mtime/size -> sha256)
+_REGISTRY: Dict[str, Dict[str, Any]] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _load_pickled(path: str) -> Dict[str, Any]:
+    """joblib/sklearn importati solo qui: l'API col modello .npz parte senza."""
+    from joblib import load
+    # i modelli addestrati eseguendo train_vecthor_model.py come script referenziano __main__.*
+    main = sys.modules["__main__"]
+    main._feat_eng = vecthor_features._feat_eng
+    main._feat_names_out = vecthor_features._feat_names_out
+    main.SafeImputer = vecthor_features.SafeImputer
+    return load(path, mmap_mode="r")
+
+def get_model(model_path: str) -> Dict[str, Any]:
+    """Restituisce {"pipeline", "meta"} dal registry, caricandolo solo la prima volta
+    o quando il file su disco è cambiato. Gli array numpy vengono memory-mappati."""
+    path = os.path.abspath(model_path)
+    st = os.stat(path)
+    sig = (st.st_mtime_ns, st.st_size)
+    entry = _REGISTRY.get(path)
+    if entry is not None and sig in (entry["sig"], entry.get("failed_sig")):
+        return entry["obj"]
+
+    with _REGISTRY_LOCK:
+        entry = _REGISTRY.get(path)
+        if entry is not None and sig in (entry["sig"], entry.get("failed_sig")):
+            return entry["obj"]
+        digest = _file_sha256(path)
+        if entry is not None and entry["sha256"] == digest:
+            # solo touch del file: stesso contenuto, niente reload
+            _REGISTRY[path] = {**entry, "sig": sig}
+            return entry["obj"]
+        t0 = time.perf_counter()
+        try:
+            if path.endswith(".npz"):
+                model = CompactModel.load(path)
+                obj = {"pipeline": model, "meta": model.meta}
+            else:
+                obj = _load_pickled(path)
+        except Exception:
+            # file in scrittura/corrotto: continua col modello precedente se c'è, e non
+            # ri-leggere/ri-hashare lo stesso file a ogni richiesta finché non cambia di nuovo
+            if entry is not None:
+                _REGISTRY[path] = {**entry, "failed_sig": sig}
+                return entry["obj"]
+            raise
+        MODEL_LOAD_SECONDS.observe(time.perf_counter() - t0)
+        # swap atomico: i thread in lettura vedono il vecchio o il nuovo, mai uno stato parziale
+        _REGISTRY[path] = {"obj": obj, "sig": sig, "sha256": digest, "loaded_at": time.time()}
+        return obj
+
+def model_version(model_path: str) -> str:
+    """sha256 del modello servito dal registry (caricandolo se serve): cambia a ogni ricarica."""
+    get_model(model_path)
+    return _REGISTRY[os.path.abspath(model_path)]["sha256"]
+
+def resolve_model_path() -> Tuple[str, bool]:
+    """Modello da usare in produzione: il calibrato se presente, poi l'export compatto, poi il default.
+    L'export compatto vale solo se non è più vecchio del .joblib (un training successivo non
+    esportabile, es. hgb, lo lascerebbe indietro).
+    VECTHOR_MODEL_PATH (+ VECTHOR_MODEL_CALIBRATED=1) forza un file specifico."""
+    override = os.getenv("VECTHOR_MODEL_PATH")
+    if override:
+        return override, os.getenv("VECTHOR_MODEL_CALIBRATED", "0").strip().lower() in ("1", "true", "yes", "on")
+    if os.path.exists(MODEL_PATH_CALIBRATED):
+        return MODEL_PATH_CALIBRATED, True
+    if os.path.exists(MODEL_PATH_COMPACT) and not _older_than(MODEL_PATH_COMPACT, MODEL_PATH_DEFAULT):
+        return MODEL_PATH_COMPACT, False
+    return MODEL_PATH_DEFAULT, False
+
+def _older_than(path: str, other: str) -> bool:
+    try:
+        return os.stat(path).st_mtime_ns < os.stat(other).st_mtime_ns
+    except OSError:
+        return False
+
 def _bool01(v: Any) -> float:
     if isinstance(v, bool):
         return 1.0 if v else 0.0
@@ -42,7 +129,7 @@ def _bool01(v: Any) -> float:
     except Exception:
         return 0.0
 
-def _coerce_row(fin: Dict[str, Any]) -> pd.DataFrame:
+def _coerce_values(fin: Dict[str, Any]) -> Dict[str, float]:
     row = {}
     for c in FEATURE_COLUMNS:
         if c not in fin:
@@ -56,10 +143,19 @@ def _coerce_row(fin: Dict[str, Any]) -> pd.DataFrame:
                     row[c] = float(v) if v not in (None, "") else np.nan
                 except Exception:
                     row[c] = np.nan
-    return pd.DataFrame([row], columns=FEATURE_COLUMNS)
+    return row
+
+def _coerce_row(fin: Dict[str, Any]) -> pd.DataFrame:
+    return pd.DataFrame([_coerce_values(fin)], columns=FEATURE_COLUMNS)
+
+def _coerce_rows(fins: List[Dict[str, Any]]) -> pd.DataFrame:
+    return pd.DataFrame([_coerce_values(f) for f in fins], columns=FEATURE_COLUMNS)
 
 def _score_with_pipe(pipe, X: pd.DataFrame) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
+    # hgb: i NaN arrivano al clf come in training, niente azzeramento per riga
+    if _keeps_nan(pipe):
+        X, pipe = _feat_eng(X, fill_all_nan=False), pipe[1:]
     # usa l'intera pipeline: gestisce feat → impute → scale (se c'è) → clf
     if hasattr(pipe, "predict_proba"):
         proba = pipe.predict_proba(X)[0]
@@ -78,41 +174,606 @@ def _score_with_pipe(pipe, X: pd.DataFrame) -> Dict[str, Any]:
         out["decision"] = z
     return out
 
+def _is_feat_eng(step) -> bool:
+    return getattr(getattr(step, "func", None), "__name__", "") == "_feat_eng"
+
+def _keeps_nan(pipe) -> bool:
+    """feat -> clf senza imputer (hgb): il clf gestisce i NaN e li ha visti in training,
+    quindi allo scoring restano NaN invece dell'azzeramento per riga."""
+    steps = getattr(pipe, "steps", None)
+    return bool(steps) and len(steps) == 2 and steps[0][0] == "feat" and _is_feat_eng(steps[0][1])
+
+def _rowwise_features(pipe, X: pd.DataFrame) -> pd.DataFrame:
+    # _feat_eng azzera le colonne tutte-NaN del batch: su una riga singola ogni NaN
+    # diventa 0.0. Qui lo replichiamo cella per cella, così N righe in un'unica
+    # chiamata danno esattamente gli stessi punteggi di N chiamate separate.
+    if _keeps_nan(pipe):
+        return _feat_eng(X, fill_all_nan=False)
+    return pipe.steps[0][1].transform(X).fillna(0.0)
+
+def _outputs_from_proba(proba: np.ndarray) -> List[Dict[str, Any]]:
+    eps = 1e-6
+    out: List[Dict[str, Any]] = []
+    for p0, p1 in proba:
+        p = min(max(float(p1), eps), 1.0 - eps)
+        out.append({"prob_12m": p, "proba_raw": [float(p0), float(p1)]})
+    return out
+
+def _outputs_from_decision(decision: np.ndarray) -> List[Dict[str, Any]]:
+    eps = 1e-6
+    out: List[Dict[str, Any]] = []
+    for z in decision:
+        z = float(z)
+        p = 1.0 / (1.0 + np.exp(-z))
+        p = min(max(p, eps), 1.0 - eps)
+        out.append({"prob_12m": p, "decision": z})
+    return out
+
+def _score_batch_with_pipe(pipe, X: pd.DataFrame) -> List[Dict[str, Any]]:
+    if pipe.steps[0][0] == "feat":
+        Xf, rest = _rowwise_features(pipe, X), pipe[1:]
+    else:
+        Xf, rest = X, pipe
+    if hasattr(pipe, "predict_proba"):
+        return _outputs_from_proba(rest.predict_proba(Xf))
+    return _outputs_from_decision(rest.decision_function(Xf))
+
+# --- FAST PATH NUMPY ---
+# Per poche righe l'overhead di pandas domina: stesse feature di _feat_eng e stessa
+# imputazione di SafeImputer, bit per bit, ma su array numpy (vedi --parity-check).
+FAST_PATH_MAX_ROWS = 64
+_IDX = {c: i for i, c in enumerate(FEATURE_COLUMNS)}
+
+def _coerce_array(fins: List[Dict[str, Any]]) -> np.ndarray:
+    return np.array([[row[c] for c in FEATURE_COLUMNS] for row in map(_coerce_values, fins)], dtype=float)
+
+def _np_safe_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((b == 0.0) | ~np.isfinite(b), np.nan, a / b)
+
+def _np_safe_div_plain(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = a / b
+    r[~np.isfinite(r)] = np.nan
+    return r
+
+def _np_safelog(a: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(a > 0.0, np.log(a), np.nan)
+
+def _fill(a: np.ndarray, v) -> np.ndarray:
+    return np.where(np.isnan(a), v, a)
+
+def _feat_eng_np(B: np.ndarray, fill_all_nan: bool = True) -> np.ndarray:
+    """Equivalente numpy di _feat_eng: B ha le colonne FEATURE_COLUMNS, l'output ENGINEERED_COLUMNS."""
+    X = {c: B[:, i].astype(float) for c, i in _IDX.items()}
+
+    # _bool01 su valori già float: NaN e != 0 -> 1.0
+    isp = X["isPubliclyListed"]
+    X["isPubliclyListed"] = np.where(np.isnan(isp) | (isp != 0.0), 1.0, 0.0)
+
+    tca, tnca = X["totalCurrentAssets"], X["totalNonCurrentAssets"]
+    tcl, tncl = X["totalCurrentLiabilities"], X["totalNonCurrentLiabilities"]
+
+    X["totalAssets"] = _fill(X["totalAssets"], tca + tnca)
+    X["totalLiabilities"] = _fill(X["totalLiabilities"], tcl + tncl)
+    X["totalEquity"] = _fill(X["totalEquity"], X["totalAssets"] - X["totalLiabilities"])
+    X["workingCapital"] = _fill(X["workingCapital"], tca - tcl)
+    X["quickAssets"] = _fill(X["quickAssets"], tca - _fill(X["inventories"], 0.0))
+    X["dscrCashFlow_proxy"] = _fill(X["dscrCashFlow_proxy"], X["operatingCashFlow"])
+    X["dscrDebtService_proxy"] = _fill(
+        X["dscrDebtService_proxy"], _fill(X["interestExpense"], 0.0) + _fill(X["longTermDebtCurrent"], 0.0)
+    )
+
+    ta, tl, eq = X["totalAssets"], X["totalLiabilities"], X["totalEquity"]
+    sales, ebit, wc = X["revenue"], X["ebit"], X["workingCapital"]
+
+    E: Dict[str, np.ndarray] = {}
+    E["r_currentRatio"]     = _np_safe_div(tca, tcl)
+    E["r_quickRatio"]       = _np_safe_div(X["quickAssets"], tcl)
+    E["r_debtToEquity"]     = _np_safe_div(tl, eq)
+    E["r_debtToAssets"]     = _np_safe_div(tl, ta)
+    E["r_interestCoverage"] = _np_safe_div(ebit, X["interestExpense"])
+    E["r_roa"]              = _np_safe_div(X["netIncome"], ta)
+    E["r_roe"]              = _np_safe_div(X["netIncome"], eq)
+    E["r_roi"]              = _np_safe_div(ebit, ta)
+    E["r_ros"]              = _np_safe_div(ebit, sales)
+    E["r_assetTurnover"]    = _np_safe_div(sales, ta)
+    E["r_dscr_proxy"]       = _np_safe_div(X["dscrCashFlow_proxy"], X["dscrDebtService_proxy"])
+
+    X1 = _np_safe_div(wc, ta)
+    X2 = _np_safe_div(X["retainedEarnings"], ta)
+    X3 = _np_safe_div(ebit, ta)
+    X5 = _np_safe_div(sales, ta)
+    sic = X["sic"]
+    manu = np.where((sic >= 2000.0) & (sic < 4000.0), 1.0, 0.0)
+    mc_over_tl = _np_safe_div_plain(X["marketCapitalization"], tl)
+    eq_over_tl = _np_safe_div_plain(eq, tl)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        altman_pub_manu  = 1.2 * X1 + 1.4 * X2 + 3.3 * X3 + 0.6 * mc_over_tl + 1.0 * X5
+        altman_pub_other = 6.56 * X1 + 3.26 * X2 + 6.72 * X3 + 1.05 * eq_over_tl
+        altman_priv      = 0.717 * X1 + 0.847 * X2 + 3.107 * X3 + 0.420 * eq_over_tl + 0.998 * X5
+        is_pub = X["isPubliclyListed"]
+        E["m_altmanZ"] = _fill(
+            altman_pub_manu * ((is_pub == 1.0) & (manu == 1.0))
+            + altman_pub_other * ((is_pub == 1.0) & (manu == 0.0))
+            + altman_priv * (is_pub == 0.0),
+            0.0,
+        )
+
+        roa = _np_safe_div(X["netIncome"], ta)
+        lev = _np_safe_div(tl, ta)
+        cr  = _np_safe_div(tca, tcl)
+        E["m_zmijewskiX"] = -4.336 - 4.513 * roa + 5.679 * lev + 0.004 * cr
+
+        ni_t, ni_tm1, gnp = X["netIncome"], X["netIncome_t_minus_1"], X["gnpPriceLevelIndex"]
+        size = np.where(~np.isnan(gnp) & (gnp > 0.0), _np_safelog(_np_safe_div(ta, gnp)), _np_safelog(ta))
+        tlta = _np_safe_div(tl, ta)
+        wcta = _np_safe_div(wc, ta)
+        clca = _np_safe_div(tcl, tca)
+        nita = _np_safe_div(ni_t, ta)
+        futl = _np_safe_div(X["operatingCashFlow"], tl)
+        oeneg = (tl > ta).astype(float)
+        intwo = (~np.isnan(ni_tm1) & (ni_t < 0.0) & (ni_tm1 < 0.0)).astype(float)
+        denom = np.abs(ni_t) + np.abs(ni_tm1)
+        with np.errstate(divide="ignore"):
+            chin = np.where(denom > 0.0, (ni_t - ni_tm1) / denom, np.nan)
+
+        E["m_ohlsonO"] = (
+            -1.32
+            - 0.407 * size
+            + 6.03 * tlta
+            - 1.43 * wcta
+            + 0.076 * clca
+            - 1.72 * oeneg
+            - 2.37 * nita
+            - 1.83 * futl
+            + 0.285 * intwo
+            - 0.521 * chin
+        )
+
+    E["log_totalAssets"] = _np_safelog(ta)
+    E["log_revenue"]     = _np_safelog(sales)
+    E["log_totalLiab"]   = _np_safelog(tl)
+
+    F = np.column_stack([X[c] for c in FEATURE_COLUMNS] + [E[c] for c in ENGINEERED_EXTRA])
+    # come _feat_eng: colonne tutte NaN -> 0.0
+    if fill_all_nan:
+        F[:, np.isnan(F).all(axis=0)] = 0.0
+    return F
+
+def _fast_path_ok(pipe) -> bool:
+    """feat (_feat_eng) -> [SafeImputer] -> [StandardScaler] -> clf: i soli step che il fast path sa replicare."""
+    steps = getattr(pipe, "steps", None)
+    if not steps or len(steps) < 2 or steps[0][0] != "feat":
+        return False
+    from sklearn.preprocessing import StandardScaler  # già caricato insieme alla pipeline
+    if not _is_feat_eng(steps[0][1]):
+        return False
+    for _, step in steps[1:-1]:
+        if type(step).__name__ == "SafeImputer":
+            if list(getattr(step, "columns_", [])) != ENGINEERED_COLUMNS:
+                return False
+        elif not isinstance(step, StandardScaler):
+            return False
+    return True
+
+# clf fittati su DataFrame (set_output pandas) ma interrogati con ndarray: copie senza
+# feature_names_in_, altrimenti sklearn emette "X does not have valid feature names" a ogni predict
+_NAMELESS: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+_NAMELESS_LOCK = threading.Lock()
+
+def _without_feature_names(est):
+    """Copia superficiale di `est` e degli stimatori annidati (membri calibrati, FrozenEstimator)
+    senza feature_names_in_; gli array fittati (coef_, alberi, isotoniche) restano condivisi."""
+    if isinstance(est, list):
+        return [_without_feature_names(e) for e in est]
+    est = copy.copy(est)
+    est.__dict__.pop("feature_names_in_", None)
+    for attr in ("estimator", "calibrated_classifiers_"):
+        if est.__dict__.get(attr) is not None:
+            est.__dict__[attr] = _without_feature_names(est.__dict__[attr])
+    return est
+
+def _fast_clf(clf):
+    with _NAMELESS_LOCK:
+        fast = _NAMELESS.get(clf)
+        if fast is None:
+            fast = _NAMELESS[clf] = _without_feature_names(clf)
+        return fast
+
+def _predict_fast(pipe, B: np.ndarray) -> List[Dict[str, Any]]:
+    """feat -> [impute] -> [scale] -> clf senza DataFrame, con la semantica per-riga dello scoring singolo."""
+    if _keeps_nan(pipe):
+        F = _feat_eng_np(B, fill_all_nan=False)
+    else:
+        F = _feat_eng_np(B)
+        F[np.isnan(F)] = 0.0  # per-riga: ogni NaN è una colonna "tutta NaN"
+    from sklearn.preprocessing import StandardScaler
+    for _, step in pipe.steps[1:-1]:
+        # SafeImputer: dopo l'azzeramento per-riga non resta nessun NaN da imputare
+        if isinstance(step, StandardScaler):
+            if step.with_mean:
+                F = F - step.mean_
+            if step.with_std:
+                F = F / step.scale_
+    clf = _fast_clf(pipe.steps[-1][1])
+    if hasattr(clf, "predict_proba"):
+        return _outputs_from_proba(clf.predict_proba(F))
+    return _outputs_from_decision(clf.decision_function(F))
+
+# --- COMPACT MODEL ---
+# export .npz di train_vecthor_model.export_compact: load in millisecondi, niente pickle,
+# alberi valutati con traversal vettorizzato (righe × alberi) a passi fissi
+_TRAVERSAL_BLOCK = 1 << 20  # celle righe×alberi per blocco, limita la memoria
+
+class CompactModel:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.kind = str(arrays["kind"])
+        self.meta = json.loads(str(arrays["meta_json"]))
+        if list(arrays["columns"]) != ENGINEERED_COLUMNS:
+            raise ValueError("Compact model: colonne diverse da ENGINEERED_COLUMNS")
+        self.impute_stats = arrays["impute_stats"]
+        self.scale_mean = arrays.get("scale_mean")
+        self.scale_scale = arrays.get("scale_scale")
+        if self.kind == "logreg":
+            self.coef = arrays["coef"]
+            self.intercept = arrays["intercept"]
+        else:
+            self.feature = arrays["tree_feature"]
+            self.threshold = arrays["tree_threshold"]
+            self.left = arrays["tree_left"]
+            self.right = arrays["tree_right"]
+            self.missing_left = arrays["tree_missing_left"]
+            self.value = arrays["tree_value"]
+            self.roots = arrays["tree_roots"]
+            self.forest_offsets = arrays["forest_offsets"]
+            self.max_depth = int(arrays["max_depth"])
+        if self.kind == "rf_cal":
+            self.iso_offsets = arrays["iso_offsets"]
+            self.iso_x = arrays["iso_x"]
+            self.iso_y = arrays["iso_y"]
+            self.iso_bounds = arrays["iso_bounds"]
+
+    @classmethod
+    def load(cls, path: str) -> "CompactModel":
+        with np.load(path, allow_pickle=False) as npz:
+            return cls({k: npz[k] for k in npz.files})
+
+    def _forest_proba(self, X: np.ndarray, forest: int) -> np.ndarray:
+        """Come RandomForestClassifier.predict_proba: media delle frazioni di classe nelle foglie."""
+        roots = self.roots[self.forest_offsets[forest]:self.forest_offsets[forest + 1]]
+        # sklearn valuta gli alberi su float32
+        X = X.astype(np.float32)
+        out = np.zeros((len(X), self.value.shape[1]))
+        step = max(1, _TRAVERSAL_BLOCK // len(roots))
+        for s in range(0, len(X), step):
+            Xb = X[s:s + step]
+            rows = np.arange(len(Xb))[:, None]
+            node = np.broadcast_to(roots, (len(Xb), len(roots)))
+            for _ in range(self.max_depth):
+                x = Xb[rows, self.feature[node]]
+                go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+                nxt = np.where(go_left, self.left[node], self.right[node])
+                if np.array_equal(nxt, node):
+                    break
+                node = nxt
+            leaf = self.value[node]  # righe × alberi × classi
+            acc = out[s:s + step]
+            for t in range(len(roots)):  # somma albero per albero, come _accumulate_prediction
+                acc += leaf[:, t]
+        out /= len(roots)
+        return out
+
+    def _calibrated_proba(self, X: np.ndarray) -> np.ndarray:
+        """Come CalibratedClassifierCV(isotonic).predict_proba: media dei membri calibrati."""
+        n_members = len(self.forest_offsets) - 1
+        mean_proba = np.zeros((len(X), 2))
+        for m in range(n_members):
+            p1 = self._forest_proba(X, m)[:, 1]
+            lo, hi = self.iso_bounds[m]
+            xs = self.iso_x[self.iso_offsets[m]:self.iso_offsets[m + 1]]
+            ys = self.iso_y[self.iso_offsets[m]:self.iso_offsets[m + 1]]
+            proba = np.empty((len(X), 2))
+            proba[:, 1] = np.interp(np.clip(p1, lo, hi), xs, ys)
+            proba[:, 0] = 1.0 - proba[:, 1]
+            proba[(1.0 < proba) & (proba <= 1.0 + 1e-5)] = 1.0
+            mean_proba += proba
+        mean_proba /= n_members
+        return mean_proba
+
+    def predict_proba(self, B: np.ndarray) -> np.ndarray:
+        """B: righe grezze in ordine FEATURE_COLUMNS (vedi _coerce_array)."""
+        F = _feat_eng_np(B)
+        F[np.isnan(F)] = 0.0  # stessa semantica per-riga della pipeline: impute_stats non serve
+        if self.scale_mean is not None:
+            F = (F - self.scale_mean) / self.scale_scale
+        if self.kind == "logreg":
+            z = (F @ self.coef.T + self.intercept).ravel()
+            p1 = 1.0 / (1.0 + np.exp(-z))
+            return np.column_stack([1.0 - p1, p1])
+        if self.kind == "rf_cal":
+            return self._calibrated_proba(F)
+        return self._forest_proba(F, 0)
+
+def _score_array(pipe, B: np.ndarray) -> List[Dict[str, Any]]:
+    if isinstance(pipe, CompactModel):
+        return _outputs_from_proba(pipe.predict_proba(B))
+    if len(B) <= FAST_PATH_MAX_ROWS and _fast_path_ok(pipe):
+        return _predict_fast(pipe, B)
+    return _score_batch_with_pipe(pipe, pd.DataFrame(B, columns=FEATURE_COLUMNS))
+
+def _score_fins(pipe, fins: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if len(fins) == 1 and not isinstance(pipe, CompactModel) and not _fast_path_ok(pipe):
+        return [_score_with_pipe(pipe, _coerce_row(fins[0]))]
+    return _score_array(pipe, _coerce_array(fins))
+
 def score_from_financial_dict(model_path: str, financials: Dict[str, Any]) -> Dict[str, Any]:
-    obj = load(model_path)
-    pipe = obj["pipeline"]
+    obj = get_model(model_path)
     meta = obj.get("meta", {})
-    X = _coerce_row(financials)
-    out = _score_with_pipe(pipe, X)
+    out = _score_fins(obj["pipeline"], [financials])[0]
     out["model"] = meta.get("model", "unknown")
     return out
 
+def score_batch_from_financial_dicts(model_path: str, fins: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Una sola predict_proba per tutto il batch; output allineato a `fins`."""
+    if not fins:
+        return []
+    obj = get_model(model_path)
+    meta = obj.get("meta", {})
+    outs = _score_fins(obj["pipeline"], fins)
+    for out in outs:
+        out["model"] = meta.get("model", "unknown")
+    return outs
+
+def open_lookup_store(path: str) -> LookupStore:
+    """Store indicizzato su (cik, fiscalYear): `path` è il .sqlite o il CSV (store costruito accanto al primo uso)."""
+    if path.endswith((".sqlite", ".db")):
+        return LookupStore(path)
+    return LookupStore.for_csv(path, columns=ID_COLS + FEATURE_COLUMNS)
+
 def score_from_csv_row(model_path: str, csv_path: str, cik: int, year: int) -> Dict[str, Any]:
-    obj = load(model_path)
-    pipe = obj["pipeline"]
+    obj = get_model(model_path)
     meta = obj.get("meta", {})
-    df = pd.read_csv(csv_path, low_memory=False)
-    row = df[(df["cik"] == cik) & (df["fiscalYear"] == year)]
-    if row.empty:
+    rec = open_lookup_store(csv_path).get(cik, year)
+    if rec is None:
         raise SystemExit("No CSV line for that CIK/year.")
-    fin = {c: (row.iloc[0][c] if c in row.columns else None) for c in FEATURE_COLUMNS}
-    X = _coerce_row(fin)
-    out = _score_with_pipe(pipe, X)
+    fin = {c: rec.get(c) for c in FEATURE_COLUMNS}
+    out = _score_fins(obj["pipeline"], [fin])[0]
     out["model"] = meta.get("model", "unknown")
     return out
 
+# --- FILE SCORING ---
+# punteggio di tutte le righe di un CSV/Parquet a chunk: memoria limitata al chunk,
+# output scritto man mano, chunk eventualmente distribuiti su un pool di processi
+SCORE_FILE_CHUNK_ROWS = 50_000
+
+def _is_parquet(path: str) -> bool:
+    return path.lower().endswith((".parquet", ".pq"))
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Parquet files need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+def _iter_chunks(path: str, chunk_rows: int):
+    wanted = set(FEATURE_COLUMNS) | set(ID_COLS)
+    if _is_parquet(path):
+        pa = _require_pyarrow()
+        pf = pa.parquet.ParquetFile(path)
+        cols = [c for c in pf.schema_arrow.names if c in wanted]
+        if pf.metadata.num_rows == 0:
+            # come read_csv su un file di sola intestazione: un chunk vuoto con le colonne
+            yield pf.schema_arrow.empty_table().select(cols).to_pandas()
+            return
+        for batch in pf.iter_batches(batch_size=chunk_rows, columns=cols):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, low_memory=False, usecols=lambda c: c in wanted)
+
+def _coerce_frame(df: pd.DataFrame) -> np.ndarray:
+    """Come _coerce_values, ma per colonna su un intero DataFrame."""
+    B = np.full((len(df), len(FEATURE_COLUMNS)), np.nan)
+    for j, c in enumerate(FEATURE_COLUMNS):
+        if c not in df.columns:
+            continue
+        if c == "isPubliclyListed":
+            B[:, j] = df[c].map(_bool01).to_numpy(dtype=float)
+        else:
+            B[:, j] = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)
+    return B
+
+def _score_chunk(model_path: str, df: pd.DataFrame) -> np.ndarray:
+    """prob_12m per ogni riga di `df` (top-level: gira anche nei processi del pool)."""
+    if df.empty:
+        return np.empty(0)
+    pipe = get_model(model_path)["pipeline"]
+    outs = _score_array(pipe, _coerce_frame(df))
+    return np.fromiter((o["prob_12m"] for o in outs), dtype=float, count=len(outs))
+
+class _ChunkWriter:
+    """Scrive i chunk in un file temporaneo: commit() lo sposta sul path finale, abort() lo elimina."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.rows = 0
+        self._fh = None
+        self._pq_writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if _is_parquet(self.path):
+            pa = _require_pyarrow()
+            if self._pq_writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._pq_writer = pa.parquet.ParquetWriter(self.tmp_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._pq_writer.schema, preserve_index=False)
+            self._pq_writer.write_table(table)
+        else:
+            if self._fh is None:
+                self._fh = open(self.tmp_path, "w", encoding="utf-8", newline="")
+            df.to_csv(self._fh, header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def _close(self) -> None:
+        if self._pq_writer is not None:
+            self._pq_writer.close()
+            self._pq_writer = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def commit(self) -> None:
+        # anche con zero righe: l'output (sola intestazione) sostituisce quello di un run precedente
+        self._close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        # un output parziale non deve mai sostituire quello di un run precedente
+        try:
+            self._close()
+        finally:
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+
+def score_file(model_path: str, in_path: str, out_path: str,
+               chunk_rows: int = SCORE_FILE_CHUNK_ROWS, workers: int = 1) -> Dict[str, Any]:
+    """Scrive in `out_path` (CSV o Parquet) le colonne identificative presenti più prob_12m.
+
+    Con workers > 1 i chunk vengono valutati in parallelo (al massimo 2 per worker in volo)
+    e scritti nell'ordine di input.
+    """
+    t0 = time.perf_counter()
+    get_model(model_path)  # fallisce subito se il modello non si carica
+    writer = _ChunkWriter(out_path)
+
+    def _emit(df: pd.DataFrame, probs: np.ndarray) -> None:
+        out = df[[c for c in ID_COLS if c in df.columns]].copy()
+        out["prob_12m"] = probs
+        writer.write(out)
+
+    try:
+        if workers <= 1:
+            for df in _iter_chunks(in_path, chunk_rows):
+                _emit(df, _score_chunk(model_path, df))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=get_model, initargs=(model_path,)) as ex:
+                pending: deque = deque()
+                for df in _iter_chunks(in_path, chunk_rows):
+                    feats = df[[c for c in FEATURE_COLUMNS if c in df.columns]]
+                    pending.append((df, ex.submit(_score_chunk, model_path, feats)))
+                    if len(pending) >= 2 * workers:
+                        df_done, fut = pending.popleft()
+                        _emit(df_done, fut.result())
+                while pending:
+                    df_done, fut = pending.popleft()
+                    _emit(df_done, fut.result())
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+
+    return {"rows": writer.rows, "output": out_path, "seconds": round(time.perf_counter() - t0, 3)}
+
+def _synthetic_fins(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Righe sintetiche con NaN, zeri, negativi e booleani in più formati."""
+    rng = np.random.default_rng(seed)
+    fins: List[Dict[str, Any]] = []
+    for _ in range(n):
+        fin: Dict[str, Any] = {}
+        for c in FEATURE_COLUMNS:
+            u = rng.random()
+            if u < 0.2:
+                continue
+            if c == "isPubliclyListed":
+                fin[c] = [True, False, "yes", "0", None, 1, 0.0][rng.integers(7)]
+            elif c == "sic":
+                fin[c] = float(rng.integers(100, 9999))
+            elif c == "fiscalYear":
+                fin[c] = float(rng.integers(2000, 2025))
+            elif u < 0.25:
+                fin[c] = 0.0
+            else:
+                fin[c] = float(rng.normal(0, 1e6)) if u < 0.5 else float(rng.lognormal(12, 3))
+        fins.append(fin)
+    return fins
+
+def parity_check(model_path: str, n: int = 1000, seed: int = 0) -> Dict[str, Any]:
+    """Confronta il fast path numpy con il percorso pandas su righe sintetiche."""
+    fins = _synthetic_fins(n, seed)
+    B = _coerce_array(fins)
+    # feature su tutto il blocco: stessa semantica di _feat_eng su un DataFrame di n righe
+    feat_equal = bool(np.array_equal(_feat_eng_np(B), _feat_eng(_coerce_rows(fins)).to_numpy(), equal_nan=True))
+
+    pipe = get_model(model_path)["pipeline"]
+    mismatches = 0
+    for fin in fins:
+        fast = _predict_fast(pipe, _coerce_array([fin]))[0]
+        slow = _score_with_pipe(pipe, _coerce_row(fin))
+        if fast["prob_12m"] != slow["prob_12m"]:
+            mismatches += 1
+    return {"rows": n, "features_equal": feat_equal, "score_mismatches": mismatches}
+
+def export_and_check(model_path: str, out_path: str, n: int = 200, seed: int = 0) -> Dict[str, Any]:
+    """Esporta un .joblib nel formato compatto e confronta i due modelli su righe sintetiche."""
+    from train_vecthor_model import export_compact
+    obj = get_model(model_path)
+    export_compact(obj["pipeline"], obj.get("meta", {}), out_path)
+    compact = get_model(out_path)["pipeline"]
+    fins = _synthetic_fins(n, seed)
+    ref = np.array([o["proba_raw"] for o in _score_fins(obj["pipeline"], fins)])
+    got = compact.predict_proba(_coerce_array(fins))
+    return {
+        "rows": n,
+        "joblib_bytes": os.path.getsize(model_path),
+        "compact_bytes": os.path.getsize(out_path),
+        "max_abs_diff": float(np.max(np.abs(ref - got))),
+    }
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--model", default=MODEL_PATH_DEFAULT, help="Path to .joblib (models/vecthor_best.joblib)")
+    ap.add_argument("--model", default=MODEL_PATH_DEFAULT, help="Path to .joblib or compact .npz (models/vecthor_best.joblib)")
     ap.add_argument("--json", help="Path to JSON with financial fields")
-    ap.add_argument("--csv", help="Path to vecthor_training_v3.csv")
+    ap.add_argument("--csv", help="Path to vecthor_training_v3.csv (or its .lookup.sqlite store)")
     ap.add_argument("--cik", type=int, help="CIK")
     ap.add_argument("--year", type=int, help="fiscalYear")
+    ap.add_argument("--parity-check", type=int, metavar="N", help="Compare the NumPy fast path with pandas on N synthetic rows")
+    ap.add_argument("--export-compact", metavar="OUT_NPZ", help="Export --model to the compact .npz format and compare scores")
+    ap.add_argument("--score-file", metavar="IN", help="Score every row of a CSV/Parquet file (use with --out)")
+    ap.add_argument("--out", help="Output CSV/Parquet for --score-file")
+    ap.add_argument("--chunk-rows", type=int, default=SCORE_FILE_CHUNK_ROWS, help="Rows per chunk for --score-file")
+    ap.add_argument("--workers", type=int, default=1, help="Processes for --score-file")
     args = ap.parse_args()
 
     if not os.path.exists(args.model):
         raise SystemExit(f"Model not found: {args.model}")
 
+    if args.score_file:
+        if not args.out:
+            raise SystemExit("--score-file needs --out")
+        out = score_file(args.model, args.score_file, args.out, chunk_rows=args.chunk_rows, workers=args.workers)
+        print(json.dumps(out, indent=2))
+        return
+
+    if args.export_compact:
+        out = export_and_check(args.model, args.export_compact)
+        print(json.dumps(out, indent=2))
+        return
+
+    if args.parity_check:
+        out = parity_check(args.model, args.parity_check)
+        print(json.dumps(out, indent=2))
+        if not out["features_equal"] or out["score_mismatches"]:
+            raise SystemExit(1)
+        return
+
     if args.json:
         with open(args.json, "r", encoding="utf-8") as fh:
             fin = json.load(fh)
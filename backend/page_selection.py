@@ -0,0 +1,109 @@
+import re
+
+# --- STATEMENT KEYWORDS ---
+# (keyword, weight): statement titles weigh more than the line items found in them
+
+_KEYWORDS = {
+    "us": {
+        "balance": [
+            ("consolidated balance sheet", 6), ("balance sheets", 6), ("statement of financial position", 6),
+            ("total current assets", 3), ("total current liabilities", 3), ("total assets", 2),
+            ("total liabilities", 2), ("stockholders' equity", 2), ("shareholders' equity", 2),
+            ("retained earnings", 2), ("inventories", 1), ("property, plant and equipment", 1),
+        ],
+        "income": [
+            ("statements of operations", 6), ("statements of income", 6), ("income statement", 6),
+            ("statements of earnings", 6), ("total revenue", 3), ("net sales", 3), ("operating income", 3),
+            ("income from operations", 3), ("interest expense", 2), ("net income", 2), ("net earnings", 2),
+            ("income before income taxes", 2), ("earnings per share", 1),
+        ],
+        "cashflow": [
+            ("statements of cash flows", 6), ("cash flows from operating activities", 4),
+            ("net cash provided by operating activities", 4), ("net cash used in investing activities", 2),
+            ("depreciation and amortization", 2), ("net cash provided by (used in)", 1),
+        ],
+    },
+    "italy": {
+        "balance": [
+            ("stato patrimoniale", 6), ("totale attivo", 3), ("totale passivo", 3), ("attivo circolante", 3),
+            ("patrimonio netto", 2), ("immobilizzazioni materiali", 2), ("rimanenze", 1),
+            ("utili (perdite) portati a nuovo", 2), ("debiti", 1), ("crediti", 1),
+        ],
+        "income": [
+            ("conto economico", 6), ("valore della produzione", 3), ("costi della produzione", 3),
+            ("ricavi delle vendite e delle prestazioni", 3), ("differenza tra valore e costi della produzione", 3),
+            ("interessi e altri oneri finanziari", 2), ("utile (perdita) dell'esercizio", 3),
+            ("risultato prima delle imposte", 2), ("ammortamenti", 1),
+        ],
+        "cashflow": [
+            ("rendiconto finanziario", 6), ("flusso finanziario dell'attività operativa", 4),
+            ("flussi finanziari derivanti dall'attività operativa", 4), ("attività di investimento", 2),
+            ("ammortamenti delle immobilizzazioni", 1),
+        ],
+    },
+}
+
+ALL_STATEMENTS = ("balance", "income", "cashflow")
+
+# bump when the scoring below changes: converted Markdown is cached on it
+PAGE_SELECTION_VERSION = 1
+
+_NUMBER_RE = re.compile(r"\(?-?\d{1,3}(?:[.,\s]\d{3})+(?:[.,]\d+)?\)?|\b\d{4,}\b")
+
+# --- SCORING ---
+
+def _language(country):
+    return "italy" if str(country or "").strip().lower() == "italy" else "us"
+
+
+def _table_density(text):
+    """Numeric tokens per non-empty line: statement pages are mostly columns of figures."""
+    lines = [l for l in text.splitlines() if l.strip()]
+    if not lines:
+        return 0.0
+    return len(_NUMBER_RE.findall(text)) / len(lines)
+
+
+def score_page(text, country, statement):
+    text_l = text.lower()
+    hits = sum(weight for kw, weight in _KEYWORDS[_language(country)][statement] if kw in text_l)
+    if hits == 0:
+        return 0.0
+    return hits * (1.0 + min(_table_density(text), 3.0))
+
+
+def select_statement_pages(doc, country, statements=ALL_STATEMENTS, per_statement=2, max_pages=12,
+                           min_doc_pages=8, min_score=4.0):
+    """0-based page numbers holding the primary financial statements of `doc` (a pymupdf Document).
+
+    For each statement the best `per_statement` pages are kept, plus the page right after
+    each of them when it continues the same statement; pages under `min_score` (a passing
+    mention in the narrative) are ignored. Returns None when the document is short enough
+    to convert whole, or when no page qualifies (e.g. scanned PDFs without text).
+    """
+    n_pages = doc.page_count
+    if n_pages <= min_doc_pages:
+        return None
+
+    texts = [doc[i].get_text("text") for i in range(n_pages)]
+    # best page of every statement first, then the runners-up, so the cap drops the least useful ones
+    ranked = {}
+    for statement in statements:
+        scores = [score_page(t, country, statement) for t in texts]
+        best = sorted((i for i in range(n_pages) if scores[i] >= min_score), key=lambda i: -scores[i])
+        ranked[statement] = [
+            [i] + ([i + 1] if i + 1 < n_pages and scores[i + 1] >= min_score else [])
+            for i in best[:per_statement]
+        ]
+
+    selected = []
+    for rank in range(per_statement):
+        for statement in statements:
+            if rank < len(ranked[statement]):
+                for i in ranked[statement][rank]:
+                    if i not in selected and len(selected) < max_pages:
+                        selected.append(i)
+
+    if not selected:
+        return None
+    return sorted(selected)
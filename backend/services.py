@@ -1,16 +1,269 @@
 import os
+import contextvars
+import hashlib
 import tempfile
 import time
 import json
-import pymupdf4llm
-from google import genai
-from google.genai import types
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from importlib import metadata
+import pymupdf
 from dotenv import load_dotenv
+from cache import DiskCache, content_key
+from metrics import LLM_CALLS, register_cache, span
+from page_selection import ALL_STATEMENTS, PAGE_SELECTION_VERSION, select_statement_pages
 
 # --- AI CONFIGURATION ---
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL_ID = "gemini-2.5-flash"
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")  # e.g. a local stub endpoint for offline runs
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE_S = float(os.getenv("GEMINI_BACKOFF_BASE_S", "0.5"))
+GEMINI_BACKOFF_MAX_S = float(os.getenv("GEMINI_BACKOFF_MAX_S", "8"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+# bump when the corresponding prompt builder changes: cached extractions are keyed on it
+EXTRACTION_PROMPT_VERSION = 1
+PREVIOUS_YEAR_PROMPT_VERSION = 1
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    """One Gemini client per process: keeps the HTTP connection pool and TLS sessions alive."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            # imported on first use: google.genai alone adds ~0.5 s to a cold start
+            import httpx
+            from google import genai
+            from google.genai import types
+
+            http_options = types.HttpOptions(
+                base_url=GEMINI_BASE_URL,
+                timeout=int(GEMINI_TIMEOUT_S * 1000),
+                client_args={"limits": httpx.Limits(
+                    max_connections=GEMINI_MAX_CONNECTIONS,
+                    max_keepalive_connections=GEMINI_MAX_CONNECTIONS,
+                )},
+            )
+            _client = genai.Client(api_key=GEMINI_API_KEY, http_options=http_options)
+            _client_pid = os.getpid()
+        return _client
+
+
+def _is_transient(exc):
+    import httpx
+    from google.genai import errors
+
+    if isinstance(exc, errors.APIError):
+        return exc.code in _TRANSIENT_STATUS
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _backoff_delay(attempt):
+    # exponential with "equal jitter": half fixed, half random
+    delay = min(GEMINI_BACKOFF_MAX_S, GEMINI_BACKOFF_BASE_S * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _generate_content(contents, config):
+    """generate_content on the shared client, retrying transient failures with jittered backoff."""
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            with span("gemini"):
+                response = _get_client().models.generate_content(model=GEMINI_MODEL_ID, contents=contents, config=config)
+            LLM_CALLS.inc("ok")
+            return response
+        except Exception as e:
+            if attempt >= GEMINI_MAX_RETRIES or not _is_transient(e):
+                LLM_CALLS.inc("error")
+                raise
+            LLM_CALLS.inc("retry")
+            time.sleep(_backoff_delay(attempt))
+
+# --- CACHE CONFIGURATION ---
+
+HERE = os.path.dirname(__file__)
+CACHE_DIR = os.getenv("SOLVIBLY_CACHE_DIR", os.path.join(HERE, ".cache"))
+MARKDOWN_CACHE_MAX_MB = float(os.getenv("MARKDOWN_CACHE_MAX_MB", "512"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+INMEMORY_PDF_MAX_MB = float(os.getenv("INMEMORY_PDF_MAX_MB", "64"))
+PAGE_SELECTION = os.getenv("PAGE_SELECTION", "1").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _converter_version():
+    try:
+        return "pymupdf4llm-" + metadata.version("pymupdf4llm")
+    except metadata.PackageNotFoundError:
+        import pymupdf4llm
+        return "pymupdf4llm-" + str(getattr(pymupdf4llm, "__version__", "unknown"))
+
+
+CONVERTER_VERSION = _converter_version()
+MARKDOWN_CACHE = DiskCache(
+    os.path.join(CACHE_DIR, "markdown"),
+    max_bytes=MARKDOWN_CACHE_MAX_MB * 1024 * 1024,
+    suffix=".md",
+)
+LLM_CACHE = DiskCache(
+    os.path.join(CACHE_DIR, "llm"),
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+    suffix=".json",
+)
+register_cache("markdown", MARKDOWN_CACHE)
+register_cache("llm", LLM_CACHE)
+
+# --- CONCURRENCY ---
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "8"))
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ExtractionCancelled(Exception):
+    """Raised inside a pipeline whose sibling already failed."""
+
+
+def _get_executor():
+    # created lazily so that pre-forked workers each get their own threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extract")
+        return _executor
+
+
+def _run_concurrently(*pipelines):
+    """Runs each pipeline(cancel_event) on the shared executor and returns their results in order.
+    The first failure cancels the others (pending ones never start, running ones stop at
+    their next checkpoint) and is re-raised."""
+    cancel = threading.Event()
+    # each pipeline runs in a copy of the caller's context, so its spans land on the request
+    futures = [_get_executor().submit(contextvars.copy_context().run, fn, cancel) for fn in pipelines]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            cancel.set()
+            for other in pending:
+                other.cancel()
+            raise future.exception()
+    return [future.result() for future in futures]
+
+
+def warm_up(converter=True):
+    """Imports the dependencies deferred to first use, e.g. in a pre-fork master.
+    converter=False leaves out pymupdf4llm: it loads onnxruntime, whose native threads do not
+    survive a fork (the forked workers abort at exit), so a pre-fork master leaves it to them."""
+    import httpx
+    from google.genai import errors, types
+    if converter:
+        import pymupdf4llm
+
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise ExtractionCancelled()
+
+# --- CONVERSION ---
+
+def _upload_size(file_storage):
+    """Remaining bytes in the upload stream, or None when the stream cannot seek."""
+    stream = file_storage.stream
+    try:
+        pos = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(pos)
+        return size - pos
+    except (AttributeError, OSError, ValueError):
+        return file_storage.content_length or None
+
+
+def _markdown_cache_key(pdf_sha256, country, statements):
+    if PAGE_SELECTION:
+        selection = f"pages-v{PAGE_SELECTION_VERSION}:{str(country or '').lower()}:{','.join(statements)}"
+    else:
+        selection = "all-pages"
+    return content_key(pdf_sha256, CONVERTER_VERSION, selection)
+
+
+def _cached_markdown(pdf_sha256, country, statements):
+    """Cached Markdown for the selection, or for all statements: last year's report usually
+    went through the full conversion as the current-year upload, and a superset of the pages
+    serves a narrower selection just as well. Returns (key to store under, cached text or None)."""
+    key = _markdown_cache_key(pdf_sha256, country, statements)
+    cached = MARKDOWN_CACHE.get(key)
+    if cached is None and tuple(statements) != ALL_STATEMENTS:
+        full_key = _markdown_cache_key(pdf_sha256, country, ALL_STATEMENTS)
+        if full_key != key:
+            cached = MARKDOWN_CACHE.get(full_key)
+    return key, cached.decode("utf-8") if cached is not None else None
+
+
+def _convert(doc, country, statements):
+    """Converts only the primary-statement pages when they can be located, else the whole document."""
+    import pymupdf4llm  # ~0.8 s to import (layout models): deferred to the first conversion
+
+    with span("to_markdown"):
+        pages = select_statement_pages(doc, country, statements) if PAGE_SELECTION else None
+        return pymupdf4llm.to_markdown(doc, pages=pages)
+
+
+def _pdf_to_markdown(file_storage, country=None, statements=ALL_STATEMENTS):
+    """PDF -> Markdown of the financial-statement pages, cached on disk by SHA-256 of the
+    uploaded bytes + converter version + page selection.
+    Converted straight from memory; only uploads above INMEMORY_PDF_MAX_MB go through a temp file."""
+    size = _upload_size(file_storage)
+    if size is None or size > INMEMORY_PDF_MAX_MB * 1024 * 1024:
+        return _pdf_to_markdown_via_file(file_storage, country, statements)
+
+    with span("file_save"):
+        data = file_storage.read()
+    key, cached = _cached_markdown(hashlib.sha256(data).hexdigest(), country, statements)
+    if cached is not None:
+        return cached
+
+    with pymupdf.open(stream=data, filetype="pdf") as doc:
+        md_text = _convert(doc, country, statements)
+
+    MARKDOWN_CACHE.set(key, md_text.encode("utf-8"))
+    return md_text
+
+
+def _pdf_to_markdown_via_file(file_storage, country, statements):
+    """Fallback for very large uploads: stream to a temp file (hashing on the way) and convert from its path."""
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        digest = hashlib.sha256()
+        with span("file_save"), os.fdopen(fd, "wb") as tmp:
+            for chunk in iter(lambda: file_storage.stream.read(1 << 20), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        key, cached = _cached_markdown(digest.hexdigest(), country, statements)
+        if cached is not None:
+            return cached
+
+        with pymupdf.open(temp_path) as doc:
+            md_text = _convert(doc, country, statements)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    MARKDOWN_CACHE.set(key, md_text.encode("utf-8"))
+    return md_text
+
 
 # --- PROMPTS ---
 
@@ -46,34 +299,73 @@ def _build_extraction_prompt(country, keys=None):
     return prompt
 
 
-def extract_data_with_llm(md_text, country, keys=None):
-    """Sends the text to the Gemini API to extract financial data."""
-    prompt = _build_extraction_prompt(country, keys)
+def _generate_json(prompt, md_text):
+    """Single Gemini call; returns the parsed JSON response."""
+    from google.genai import types
+
+    response = _generate_content(
+        contents=prompt + "\n\nMARKDOWN_TEXT:\n" + md_text,
+        config=types.GenerateContentConfig(response_mime_type="application/json")
+    )
+
+    raw = getattr(response, "text", None)
+    if not raw:
+        cand = getattr(response, "candidates", None)
+        if cand and hasattr(cand[0], "content") and hasattr(cand[0].content, "parts"):
+            raw = "".join(getattr(p, "text", "") for p in cand[0].content.parts)
+
+    if isinstance(raw, dict):
+        return raw
+    return json.loads(str(raw).strip())
+
+
+def _llm_cache_key(md_text, prompt, country, keys, prompt_version):
+    return content_key(
+        hashlib.sha256(md_text.encode("utf-8")).hexdigest(),
+        str(country or "").lower(),
+        json.dumps(keys),
+        f"v{prompt_version}",
+        hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        GEMINI_MODEL_ID,
+    )
+
+
+def _llm_cache_get(key):
+    cached = LLM_CACHE.get(key)
+    if cached is None:
+        return None
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        model_id = "gemini-2.5-flash"
+        return json.loads(cached.decode("utf-8"))
+    except ValueError:
+        return None
 
-        response = client.models.generate_content(
-            model=model_id,
-            contents=prompt + "\n\nMARKDOWN_TEXT:\n" + md_text,
-            config=types.GenerateContentConfig(response_mime_type="application/json")
-        )
 
-        raw = getattr(response, "text", None)
-        if not raw:
-            cand = getattr(response, "candidates", None)
-            if cand and hasattr(cand[0], "content") and hasattr(cand[0].content, "parts"):
-                raw = "".join(getattr(p, "text", "") for p in cand[0].content.parts)
+def _llm_cache_set(key, data):
+    if isinstance(data, dict):
+        LLM_CACHE.set(key, json.dumps(data).encode("utf-8"))
+
 
-        if isinstance(raw, dict):
-            extracted_data = raw
-        else:
-            extracted_data = json.loads(str(raw).strip())
+def invalidate_llm_cache():
+    """Drops every cached extraction (e.g. after changing a prompt without bumping its version)."""
+    LLM_CACHE.clear()
 
-        return extracted_data
+
+def extract_data_with_llm(md_text, country, keys=None):
+    """Sends the text to the Gemini API to extract financial data (cached per document and prompt)."""
+    prompt = _build_extraction_prompt(country, keys)
+    cache_key = _llm_cache_key(md_text, prompt, country, keys, EXTRACTION_PROMPT_VERSION)
+    cached = _llm_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        extracted_data = _generate_json(prompt, md_text)
     except Exception as e:
         raise ValueError(f"AI data extraction failed: {e}")
 
+    _llm_cache_set(cache_key, extracted_data)
+    return extracted_data
+
 
 def _build_previous_year_prompt(country: str) -> str:
     """Builds a focused prompt for extracting only Net Income t-1 from the previous-year PDF."""
@@ -106,96 +398,67 @@ def _build_previous_year_prompt(country: str) -> str:
     return prompt
 
 
-def extract_previous_year_net_income(prev_file_storage, country):
+def extract_previous_year_net_income(prev_file_storage, country, cancel=None):
     """Estrae il Net Income t-1 dal PDF del bilancio precedente."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        temp_path = tmp.name
-        prev_file_storage.save(temp_path)
-        tmp.flush()
-        tmp.close()
-        time.sleep(0.1)
+    with span("prev_year"):
+        return _extract_previous_year_net_income(prev_file_storage, country, cancel)
 
-    try:
-        md_text = pymupdf4llm.to_markdown(temp_path)
-        prompt = _build_previous_year_prompt(country)
-
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        model_id = "gemini-2.5-flash"
-        response = client.models.generate_content(
-            model=model_id,
-            contents=prompt + "\n\nMARKDOWN_TEXT:\n" + md_text,
-            config=types.GenerateContentConfig(response_mime_type="application/json")
-        )
 
-        raw = getattr(response, "text", None)
+def _extract_previous_year_net_income(prev_file_storage, country, cancel):
+    md_text = _pdf_to_markdown(prev_file_storage, country, statements=("income",))
+    _check_cancelled(cancel)
+    prompt = _build_previous_year_prompt(country)
 
-        if not raw:
-            cand = getattr(response, "candidates", None)
-            if cand and hasattr(cand[0], "content") and hasattr(cand[0].content, "parts"):
-                raw = "".join(getattr(p, "text", "") for p in cand[0].content.parts)
+    cache_key = _llm_cache_key(md_text, prompt, country, ["netIncome"], PREVIOUS_YEAR_PROMPT_VERSION)
+    data = _llm_cache_get(cache_key)
+    if data is None:
+        data = _generate_json(prompt, md_text)
+        _llm_cache_set(cache_key, data)
 
-        data = json.loads(str(raw).strip())
-        value = data.get("netIncome")
+    value = data.get("netIncome")
 
-        if isinstance(value, str):
-            value = value.replace(",", "").replace(" ", "")
-            try:
-                value = float(value)
-            except ValueError:
-                value = None
+    if isinstance(value, str):
+        value = value.replace(",", "").replace(" ", "")
+        try:
+            value = float(value)
+        except ValueError:
+            value = None
 
-        return value if isinstance(value, (int, float)) else None
-
-    finally:
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
+    return value if isinstance(value, (int, float)) else None
 
 
 def process_document_data(file_storage, country, company_type, industry_sector, *, keys=None, prev_file=None):
-    """Orchestrates file saving, conversion, AI extraction, and cleanup."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        temp_path = tmp.name
-        file_storage.save(temp_path)
-        tmp.flush()
-        tmp.close()
-        time.sleep(0.1)
-
-    try:
-        md_text = pymupdf4llm.to_markdown(temp_path)
-        financial_data = extract_data_with_llm(md_text, country, keys=keys)
-
-        if prev_file:
-            ni_prev = extract_previous_year_net_income(prev_file, country)
-            if ni_prev is not None:
-                financial_data["netIncome_t_minus_1"] = ni_prev
+    """Orchestrates conversion (cached), AI extraction and enrichment."""
+    def current_year(cancel=None):
+        md_text = _pdf_to_markdown(file_storage, country)
+        _check_cancelled(cancel)
+        return extract_data_with_llm(md_text, country, keys=keys)
+
+    if prev_file:
+        # the two documents are independent: convert + extract them side by side
+        financial_data, ni_prev = _run_concurrently(
+            current_year,
+            lambda cancel: extract_previous_year_net_income(prev_file, country, cancel=cancel),
+        )
+        if ni_prev is not None:
+            financial_data["netIncome_t_minus_1"] = ni_prev
+    else:
+        financial_data = current_year()
 
-        financial_data['country'] = country
-        financial_data['isPubliclyListed'] = company_type == 'public'
-        financial_data['industrySector'] = industry_sector
+    financial_data['country'] = country
+    financial_data['isPubliclyListed'] = company_type == 'public'
+    financial_data['industrySector'] = industry_sector
 
-        if not financial_data.get("fiscalYear"):
-            financial_data["fiscalYear"] = int(time.strftime("%Y"))
+    if not financial_data.get("fiscalYear"):
+        financial_data["fiscalYear"] = int(time.strftime("%Y"))
 
-        if not financial_data.get("companyName") or financial_data.get("companyName") == "N/A":
-            fname = file_storage.filename
-            max_len = 25
-            base, ext = os.path.splitext(fname)
-            if len(base) > max_len:
-                base = base[:max_len] + "…"
-            financial_data["companyName"] = f"Doc: {base}{ext}"
+    if not financial_data.get("companyName") or financial_data.get("companyName") == "N/A":
+        fname = file_storage.filename
+        max_len = 25
+        base, ext = os.path.splitext(fname)
+        if len(base) > max_len:
+            base = base[:max_len] + "…"
+        financial_data["companyName"] = f"Doc: {base}{ext}"
 
-        return financial_data
+    return financial_data
 
-    finally:
-        if os.path.exists(temp_path):
-            for _ in range(5):
-                try:
-                    os.remove(temp_path)
-                    break
-                except PermissionError:
-                    time.sleep(0.1)
-                except Exception:
-                    break
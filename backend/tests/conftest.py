@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# keep job store and caches of the modules under test out of the source tree
+_TMP = tempfile.mkdtemp(prefix="solvibly_tests_")
+os.environ.setdefault("SOLVIBLY_DATA_DIR", os.path.join(_TMP, "data"))
+os.environ.setdefault("SOLVIBLY_CACHE_DIR", os.path.join(_TMP, "cache"))
+
+from vecthor_features import FEATURE_COLUMNS  # noqa: E402
+
+
+def synthetic_training_frame(n=400, seed=0):
+    """Training-style rows (FEATURE_COLUMNS + cik + label) with NaN, zeros and negatives."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({c: rng.lognormal(12, 1.5, n) for c in FEATURE_COLUMNS})
+    df["sic"] = rng.integers(100, 9999, n).astype(float)
+    df["fiscalYear"] = rng.integers(2010, 2024, n).astype(float)
+    df["isPubliclyListed"] = rng.integers(0, 2, n).astype(float)
+    for c in ("netIncome", "ebit", "retainedEarnings", "operatingCashFlow"):
+        df.loc[rng.random(n) < 0.3, c] *= -1
+    for c in FEATURE_COLUMNS:
+        if c not in ("sic", "fiscalYear"):
+            df.loc[rng.random(n) < 0.05, c] = 0.0
+            df.loc[rng.random(n) < 0.15, c] = np.nan
+    leverage = (df["totalCurrentLiabilities"].fillna(0) + df["totalNonCurrentLiabilities"].fillna(0)) / (
+        df["totalCurrentAssets"].fillna(1) + df["totalNonCurrentAssets"].fillna(1))
+    df["label"] = (leverage + rng.normal(0, 0.5, n) > 1.2).astype(int)
+    df["cik"] = rng.integers(1, n // 4, n)
+    return df
+
+
+@pytest.fixture(scope="session")
+def train_data():
+    return synthetic_training_frame()
+
+
+@pytest.fixture(scope="session")
+def fit_pipeline(train_data):
+    """fit_pipeline(name) -> a build_pipelines() candidate fitted on the synthetic frame (few trees)."""
+    from train_vecthor_model import build_pipelines
+
+    fitted = {}
+
+    def fit(name):
+        if name not in fitted:
+            pipe = build_pipelines()[name]
+            params = pipe.get_params()
+            if "clf__n_estimators" in params:
+                pipe.set_params(clf__n_estimators=20, clf__n_jobs=1)
+            if "clf__estimator__n_estimators" in params:
+                pipe.set_params(clf__estimator__n_estimators=20, clf__estimator__n_jobs=1)
+            if "clf__max_iter" in params and name.startswith("hgb"):
+                pipe.set_params(clf__max_iter=50)
+            if "clf__estimator__max_iter" in params:
+                pipe.set_params(clf__estimator__max_iter=50)
+            fitted[name] = pipe.fit(train_data[FEATURE_COLUMNS], train_data["label"].to_numpy())
+        return fitted[name]
+
+    return fit
@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+from joblib import dump
+
+import benchmark
+import controller
+from app import create_app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, fit_pipeline):
+    model_path = str(tmp_path / "model.joblib")
+    dump({"pipeline": fit_pipeline("logreg"), "meta": {"model": "logreg"}}, model_path)
+    monkeypatch.setattr(controller, "MODEL_PATH", model_path)
+    monkeypatch.setattr(controller, "USE_CALIBRATED", False)
+    controller._predict_cache.clear()
+    return create_app(start_jobs=False).test_client()
+
+
+def test_importing_the_app_creates_no_job_store(tmp_path):
+    data_dir = tmp_path / "data"
+    env = {**os.environ, "SOLVIBLY_DATA_DIR": str(data_dir)}
+    subprocess.run([sys.executable, "-c", "from app import create_app; create_app(start_jobs=False)"],
+                   cwd=os.path.dirname(controller.__file__), env=env, check=True)
+    assert not data_dir.exists()
+
+
+def test_predict_etag_and_not_modified(client, fit_pipeline):
+    payload, other = benchmark.synthetic_payloads(2, seed=3)
+    first = client.post("/api/predict", json=payload)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert json.loads(first.data)["vecthorMLScore"] != "N/A"
+
+    # key order does not matter: same canonical input, same ETag and body
+    again = client.post("/api/predict", json=dict(reversed(list(payload.items()))))
+    assert again.headers["ETag"] == etag and again.data == first.data
+
+    cached = client.post("/api/predict", json=payload, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.data == b""
+    assert cached.headers["ETag"] == etag
+
+    changed = client.post("/api/predict", json=other, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+    # a new model file changes the ETag of the same input
+    dump({"pipeline": fit_pipeline("rf"), "meta": {"model": "rf"}}, controller.MODEL_PATH)
+    os.utime(controller.MODEL_PATH, ns=(1, 1))
+    swapped = client.post("/api/predict", json=payload, headers={"If-None-Match": etag})
+    assert swapped.status_code == 200 and swapped.headers["ETag"] != etag
+
+
+def _portfolio_csv(payloads):
+    return pd.DataFrame(payloads).to_csv(index=False).encode("utf-8")
+
+
+def test_portfolio_streams_one_ndjson_line_per_row(client, monkeypatch):
+    monkeypatch.setattr(controller, "PORTFOLIO_FIRST_CHUNK_ROWS", 2)
+    monkeypatch.setattr(controller, "PORTFOLIO_CHUNK_ROWS", 5)
+    payloads = benchmark.synthetic_payloads(13, seed=4)
+    payloads[6]["revenue"] = "not a number"
+    body = _portfolio_csv(payloads)
+
+    batches = []
+    real_batch = controller._calculate_results_batch
+    monkeypatch.setattr(controller, "_calculate_results_batch", lambda rows: batches.append(len(rows)) or real_batch(rows))
+
+    response = client.post("/api/predict/portfolio", data={"file": (io.BytesIO(body), "portfolio.csv")},
+                           content_type="multipart/form-data", buffered=False)
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+
+    lines = response.response
+    first = json.loads(next(iter(lines)))
+    assert first["row"] == 0 and batches == [2]  # the first line leaves before the rest is scored
+    rows = [first] + [json.loads(line) for chunk in lines for line in chunk.splitlines()]
+    response.close()
+    assert batches == [2, 5, 5, 1]
+    assert [r["row"] for r in rows] == list(range(13))
+
+    # same values as the batch endpoint on the same (text) cells
+    items = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False).to_dict("records")
+    coerced = []
+    for item in items:
+        try:
+            coerced.append(controller._coerce_predict_payload(item))
+        except Exception as e:
+            coerced.append(e)
+    want = [json.loads(json.dumps({"row": i, **r})) for i, r in enumerate(real_batch(coerced))]
+    assert rows == want
+    assert "error" in rows[6] and "error" not in rows[5]
+
+
+def test_portfolio_rejects_unusable_files(client):
+    for body, name in ((b"foo,bar\n1,2\n", "p.csv"), (b"x", "p.txt")):
+        response = client.post("/api/predict/portfolio", data={"file": (io.BytesIO(body), name)},
+                               content_type="multipart/form-data")
+        assert response.status_code == 400 and "error" in response.get_json()
+
+
+def test_portfolio_closes_the_spooled_upload_when_the_client_leaves_early(client, monkeypatch):
+    spools, closed_readers = [], []
+    real_temporary_file, real_open = controller.tempfile.TemporaryFile, controller._open_portfolio
+    monkeypatch.setattr(controller.tempfile, "TemporaryFile", lambda: spools.append(real_temporary_file()) or spools[-1])
+
+    def open_portfolio(stream, filename):
+        header, chunks, close = real_open(stream, filename)
+        return header, chunks, lambda: closed_readers.append(True) or close()
+
+    monkeypatch.setattr(controller, "_open_portfolio", open_portfolio)
+    body = _portfolio_csv(benchmark.synthetic_payloads(3, seed=5))
+    with client.application.test_request_context("/api/predict/portfolio", method="POST",
+                                                 data={"file": (io.BytesIO(body), "portfolio.csv")},
+                                                 content_type="multipart/form-data"):
+        response = controller.predict_portfolio()
+    assert response.status_code == 200 and not spools[0].closed
+    response.close()  # the client left before the first line was produced
+    assert spools[0].closed and closed_readers
@@ -0,0 +1,25 @@
+import os
+
+from cache import DiskCache, content_key
+
+
+def test_overwriting_a_key_does_not_grow_the_size(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.set(content_key("a"), b"x" * 100)
+    for _ in range(20):
+        cache.set(content_key("b"), b"y" * 300)
+    cache.set(content_key("b"), b"y" * 200)
+    assert cache.stats()["bytes"] == 300
+    assert cache.evictions == 0
+    assert cache.get(content_key("a")) == b"x" * 100
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.set(content_key("a"), b"x" * 100)
+    cache.set(content_key("b"), b"y" * 100)
+    os.utime(cache._path(content_key("a")), (1, 1))
+    cache.set(content_key("c"), b"z" * 100)
+    assert cache.get(content_key("a")) is None
+    assert cache.get(content_key("c")) == b"z" * 100
+    assert cache.stats()["bytes"] == 200
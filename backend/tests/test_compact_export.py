@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+
+import ml_infer
+from train_vecthor_model import export_compact, save_compact
+
+
+@pytest.mark.parametrize("name", ["logreg", "rf", "rf_cal"])
+def test_compact_export_matches_the_pipeline(tmp_path, fit_pipeline, name):
+    pipe = fit_pipeline(name)
+    path = str(tmp_path / "model.npz")
+    export_compact(pipe, {"model": name}, path)
+    compact = ml_infer.CompactModel.load(path)
+    assert compact.meta == {"model": name}
+
+    fins = ml_infer._synthetic_fins(200, seed=2)
+    want = np.array([o["proba_raw"] for o in ml_infer._score_fins(pipe, fins)])
+    got = compact.predict_proba(ml_infer._coerce_array(fins))
+    np.testing.assert_allclose(got, want, rtol=0, atol=1e-12)
+
+
+def test_save_compact_removes_a_stale_export(tmp_path, fit_pipeline):
+    assert save_compact(fit_pipeline("logreg"), {}, str(tmp_path)) == str(tmp_path / "vecthor_best.npz")
+    assert (tmp_path / "vecthor_best.npz").exists()
+
+    # a single tree is not exportable, and the previous model's .npz must not outlive it
+    lr = fit_pipeline("logreg")
+    tree = Pipeline([*lr.steps[:-1], ("clf", DecisionTreeClassifier())])
+    assert save_compact(tree, {}, str(tmp_path)) is None
+    assert not (tmp_path / "vecthor_best.npz").exists()
@@ -0,0 +1,93 @@
+import math
+
+import numpy as np
+import pytest
+
+from calculation import (
+    _round_or_na,
+    calculate_altman_zscore, calculate_altman_zscore_batch,
+    calculate_fulmer_hfactor, calculate_fulmer_hfactor_batch,
+    calculate_grover_gscore, calculate_grover_gscore_batch,
+    calculate_ohlson_oscore, calculate_ohlson_oscore_batch,
+    calculate_springate_sscore, calculate_springate_sscore_batch,
+    calculate_taffler_tscore, calculate_taffler_tscore_batch,
+    calculate_zmijewski_xscore, calculate_zmijewski_xscore_batch,
+)
+
+MODELS = [
+    (calculate_altman_zscore, calculate_altman_zscore_batch),
+    (calculate_springate_sscore, calculate_springate_sscore_batch),
+    (calculate_taffler_tscore, calculate_taffler_tscore_batch),
+    (calculate_fulmer_hfactor, calculate_fulmer_hfactor_batch),
+    (calculate_grover_gscore, calculate_grover_gscore_batch),
+    (calculate_zmijewski_xscore, calculate_zmijewski_xscore_batch),
+    (calculate_ohlson_oscore, calculate_ohlson_oscore_batch),
+]
+
+KEYS = [
+    "totalAssets", "workingCapital", "retainedEarnings", "ebit", "totalLiabilities", "revenue",
+    "marketCapitalization", "totalEquity", "totalCurrentLiabilities", "totalCurrentAssets",
+    "interestExpense", "quickAssets", "inventories", "inventory", "depreciation", "operatingCashFlow",
+    "totalDebt", "tangibleFixedAssets", "netIncome", "gnpPriceLevelIndex", "netIncome_t_minus_1",
+]
+
+def _value(rng):
+    r = rng.random()
+    if r < 0.55:
+        return float(rng.normal(0, 1) * 10 ** rng.integers(2, 7)) if rng.random() < 0.8 else float(rng.integers(1, 10**6))
+    if r < 0.62:
+        return 0.0
+    if r < 0.69:
+        return None
+    if r < 0.76:
+        return math.nan
+    if r < 0.9:
+        return str(int(rng.integers(-10**5, 10**6)))
+    return "n/a"
+
+
+def _random_rows(rng, n, keys):
+    rows = []
+    for _ in range(n):
+        row = {"isPubliclyListed": bool(rng.integers(0, 2)),
+               "industrySector": rng.choice(["Manufacturing", " manufacturing ", "services"])}
+        row.update((k, _value(rng)) for k in keys)
+        rows.append(row)
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_batch_models_match_scalar_models(seed):
+    rng = np.random.default_rng(seed)
+    # one key set per batch, as _distress_results_batch groups rows
+    keys = [k for k in KEYS if rng.random() < 0.85]
+    rows = _random_rows(rng, 60, keys)
+    columns = {k: [r[k] for r in rows] for k in rows[0]}
+
+    finite = 0
+    for scalar, batch in MODELS:
+        got = [_round_or_na(float(v)) for v in batch(columns)]
+        want = [scalar(r) for r in rows]
+        assert got == want, scalar.__name__
+        finite += sum(v != 'N/A' for v in want)
+    assert finite > 0
+
+
+def test_explicit_nan_is_not_treated_as_missing():
+    row = {"ebit": 100.0, "totalCurrentLiabilities": 50.0, "totalCurrentAssets": 80.0, "totalLiabilities": 120.0,
+           "totalAssets": 300.0, "revenue": 400.0, "inventories": 10.0, "quickAssets": math.nan,
+           "workingCapital": 30.0, "netIncome": 20.0, "operatingCashFlow": 25.0, "gnpPriceLevelIndex": math.nan}
+    columns = {k: [v] for k, v in row.items()}
+    assert calculate_taffler_tscore(row) == 'N/A'
+    assert np.isnan(calculate_taffler_tscore_batch(columns)[0])
+    assert calculate_ohlson_oscore(row) == 'N/A'
+    assert np.isnan(calculate_ohlson_oscore_batch(columns)[0])
+
+
+def test_numeric_strings_are_read_where_the_scalar_model_reads_them():
+    row = {"netIncome": "1000", "totalLiabilities": "5000", "totalCurrentAssets": 3000.0,
+           "totalCurrentLiabilities": "2000", "totalAssets": 10000.0}
+    columns = {k: [v] for k, v in row.items()}
+    want = calculate_zmijewski_xscore(row)
+    assert want != 'N/A'
+    assert _round_or_na(float(calculate_zmijewski_xscore_batch(columns)[0])) == want
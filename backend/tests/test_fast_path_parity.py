@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ml_infer
+from vecthor_features import ENGINEERED_COLUMNS, FEATURE_COLUMNS, _feat_eng
+
+
+def _rows():
+    fins = ml_infer._synthetic_fins(300, seed=1)
+    # explicit NaN/None, numeric strings, string booleans and an empty row on top of the synthetic ones
+    fins += [
+        {},
+        {c: math.nan for c in FEATURE_COLUMNS},
+        {"totalCurrentAssets": "1000", "totalCurrentLiabilities": 0.0, "isPubliclyListed": "no",
+         "netIncome": -250.0, "netIncome_t_minus_1": None, "revenue": math.nan},
+        {"totalCurrentAssets": 0.0, "totalNonCurrentAssets": 0.0, "isPubliclyListed": "yes", "sic": 3500.0,
+         "marketCapitalization": -5.0, "gnpPriceLevelIndex": 0.0},
+    ]
+    return fins
+
+
+def test_feat_eng_np_matches_feat_eng_on_a_block():
+    fins = _rows()
+    got = ml_infer._feat_eng_np(ml_infer._coerce_array(fins))
+    want = _feat_eng(ml_infer._coerce_rows(fins))
+    assert list(want.columns) == ENGINEERED_COLUMNS
+    np.testing.assert_array_equal(got, want.to_numpy())
+
+
+def test_feat_eng_np_matches_feat_eng_row_by_row():
+    for fin in _rows()[-30:]:
+        got = ml_infer._feat_eng_np(ml_infer._coerce_array([fin]))
+        # raw single-row frame as the form sends it: missing columns, strings
+        want = _feat_eng(pd.DataFrame([fin])).to_numpy()
+        np.testing.assert_array_equal(got, want)
+
+
+@pytest.mark.parametrize("name", ["logreg", "rf", "rf_cal"])
+def test_predict_fast_matches_the_pipeline(fit_pipeline, name):
+    pipe = fit_pipeline(name)
+    assert ml_infer._fast_path_ok(pipe)
+    fins = _rows()[-24:]
+    for fin in fins:
+        got = ml_infer._predict_fast(pipe, ml_infer._coerce_array([fin]))[0]
+        want = ml_infer._score_with_pipe(pipe, ml_infer._coerce_row(fin))
+        assert got["prob_12m"] == want["prob_12m"]
+        assert got["proba_raw"] == want["proba_raw"]
+
+    # a block keeps the per-row semantics (up to BLAS summation order)
+    block = ml_infer._predict_fast(pipe, ml_infer._coerce_array(fins))
+    single = [ml_infer._score_with_pipe(pipe, ml_infer._coerce_row(fin)) for fin in fins]
+    np.testing.assert_allclose([o["proba_raw"] for o in block], [o["proba_raw"] for o in single], rtol=1e-9, atol=0)
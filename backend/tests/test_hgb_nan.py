@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+import ml_infer
+from conftest import synthetic_training_frame
+from vecthor_features import FEATURE_COLUMNS
+
+
+@pytest.mark.parametrize("name", ["hgb", "hgb_cal"])
+def test_hgb_scores_like_training_for_single_rows_and_batches(fit_pipeline, name):
+    pipe = fit_pipeline(name)
+    rows = synthetic_training_frame(80, seed=5)[FEATURE_COLUMNS]
+    assert not rows.isna().all().any()  # training-style _feat_eng leaves every NaN in place
+    want = pipe.predict_proba(rows)[:, 1]
+    fins = rows.to_dict("records")
+
+    single = [ml_infer._score_fins(pipe, [fin])[0]["proba_raw"][1] for fin in fins]
+    np.testing.assert_allclose(single, want, rtol=1e-12, atol=0)
+
+    for block in (fins[:40], fins):  # fast path (<= 64 rows) and pandas path
+        got = [o["proba_raw"][1] for o in ml_infer._score_fins(pipe, block)]
+        np.testing.assert_allclose(got, want[:len(block)], rtol=1e-12, atol=0)
+
+    slow = [ml_infer._score_with_pipe(pipe, ml_infer._coerce_row(fin))["proba_raw"][1] for fin in fins[:10]]
+    np.testing.assert_allclose(slow, want[:10], rtol=1e-12, atol=0)
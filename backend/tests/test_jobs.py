@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue
+
+
+def _wait_for(queue, job_id, status, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.02)
+    pytest.fail(f"job {job_id} still {queue.get(job_id)['status']}")
+
+
+def _idle_queue(tmp_path, **kw):
+    """A queue whose worker threads are not started, to drive _claim/_finish by hand."""
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), handler=None, **kw)
+    queue.start = lambda: None
+    return queue
+
+
+def test_only_the_current_claim_can_finish_a_job(tmp_path):
+    cleaned = []
+    queue = _idle_queue(tmp_path, lease_s=0.05, cleanup=cleaned.append)
+    job_id = queue.submit({"n": 1})
+
+    first = queue._claim()
+    assert first == (job_id, {"n": 1}, 1)
+    time.sleep(0.1)  # the first worker stalls past its lease
+    second = queue._claim()
+    assert second == (job_id, {"n": 1}, 2)
+
+    assert queue._finish(job_id, 2, result={"ok": True})
+    assert cleaned == [job_id]
+    # the stale worker neither overwrites the outcome nor removes the job's files
+    assert not queue._finish(job_id, 1, error="boom")
+    assert cleaned == [job_id]
+    job = queue.get(job_id)
+    assert (job["status"], job["result"], job["error"]) == ("done", {"ok": True}, None)
+
+
+def test_lost_job_is_failed_and_cleaned_up(tmp_path):
+    cleaned = []
+    queue = _idle_queue(tmp_path, lease_s=0.05, max_attempts=1, cleanup=cleaned.append)
+    job_id = queue.submit({})
+    assert queue._claim()[0] == job_id
+    time.sleep(0.1)
+    assert queue._claim() is None
+    assert queue.get(job_id)["status"] == "failed"
+    assert cleaned == [job_id]
+
+
+def test_heartbeat_keeps_a_long_job_from_being_claimed_twice(tmp_path):
+    calls = []
+
+    def handler(job_id, payload):
+        calls.append(job_id)
+        time.sleep(1.0)
+        return {"calls": len(calls)}
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), handler=handler, workers=2, lease_s=0.3, poll_s=0.05)
+    job_id = queue.submit({})
+    job = _wait_for(queue, job_id, "done")
+    assert job["attempts"] == 1
+    assert calls == [job_id]
+
+
+def test_worker_survives_a_failing_finish(tmp_path, monkeypatch):
+    done = threading.Event()
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), handler=lambda job_id, payload: payload,
+                     workers=1, lease_s=0.2, poll_s=0.05, cleanup=lambda job_id: done.set())
+    real_finish = queue._finish
+    failures = []
+
+    def flaky_finish(*args, **kw):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return real_finish(*args, **kw)
+
+    monkeypatch.setattr(queue, "_finish", flaky_finish)
+    job_id = queue.submit({"x": 1})
+    job = _wait_for(queue, job_id, "done")
+    assert job["attempts"] == 2 and job["result"] == {"x": 1}
+    assert done.wait(5)
+
+
+def test_stop_requeues_running_jobs_for_another_worker(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    started, release = threading.Event(), threading.Event()
+
+    def stuck(job_id, payload):
+        started.set()
+        release.wait(10)
+        return {"by": "exiting worker"}
+
+    exiting = JobQueue(db, handler=stuck, workers=1, lease_s=60, poll_s=0.05)
+    job_id = exiting.submit({})
+    assert started.wait(5)
+    exiting.stop()
+    assert exiting.get(job_id)["status"] == "queued"
+
+    cleaned = []
+    other = JobQueue(db, handler=lambda job_id, payload: {"by": "other worker"}, workers=1, lease_s=60,
+                     poll_s=0.05, cleanup=cleaned.append)
+    other.start()
+    job = _wait_for(other, job_id, "done")
+    assert job["result"] == {"by": "other worker"}
+    assert cleaned == [job_id]
+
+    # the abandoned handler returns late: it no longer owns the job
+    release.set()
+    time.sleep(0.2)
+    assert other.get(job_id)["result"] == {"by": "other worker"}
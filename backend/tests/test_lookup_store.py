@@ -0,0 +1,22 @@
+import math
+
+from lookup_store import LookupStore
+
+
+def test_lookup_in_a_directory_with_uri_characters(tmp_path, train_data):
+    folder = tmp_path / "data?v=1 #50%"
+    folder.mkdir()
+    csv_path = folder / "train.csv"
+    train_data.head(30).to_csv(csv_path, index=False)
+
+    store = LookupStore.for_csv(str(csv_path))
+    assert store.source_sig() == LookupStore._source_sig(str(csv_path))
+    assert LookupStore.for_csv(str(csv_path)).db_path == store.db_path
+
+    df = train_data.head(30)
+    cik, year = df.iloc[4]["cik"], df.iloc[4]["fiscalYear"]
+    want = df[(df["cik"] == cik) & (df["fiscalYear"] == year)].iloc[0]
+    row = store.get(cik, year)
+    for c in ("revenue", "netIncome", "totalAssets"):
+        assert (math.isnan(row[c]) and math.isnan(want[c])) or math.isclose(row[c], want[c])
+    assert store.get(-1, 1900) is None
@@ -0,0 +1,29 @@
+import hashlib
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import services
+from cache import DiskCache
+from page_selection import ALL_STATEMENTS
+
+
+@pytest.fixture
+def markdown_cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=1 << 20, suffix=".md")
+    monkeypatch.setattr(services, "MARKDOWN_CACHE", cache)
+    monkeypatch.setattr(services, "PAGE_SELECTION", True)
+    monkeypatch.setattr(services, "_convert", lambda *a: pytest.fail("converted again"))
+    return cache
+
+
+@pytest.mark.parametrize("inmemory_max_mb", [64, 0])
+def test_previous_year_reuses_full_conversion(markdown_cache, monkeypatch, inmemory_max_mb):
+    monkeypatch.setattr(services, "INMEMORY_PDF_MAX_MB", inmemory_max_mb)
+    pdf = b"%PDF-1.4 last year's report"
+    key = services._markdown_cache_key(hashlib.sha256(pdf).hexdigest(), "USA", ALL_STATEMENTS)
+    markdown_cache.set(key, "# all statements".encode("utf-8"))
+
+    upload = FileStorage(stream=io.BytesIO(pdf), filename="prev.pdf")
+    assert services._pdf_to_markdown(upload, "USA", statements=("income",)) == "# all statements"
@@ -0,0 +1,26 @@
+import os
+
+from joblib import dump
+
+import ml_infer
+
+
+def test_failed_reload_keeps_previous_model_and_is_not_rehashed(tmp_path, fit_pipeline, monkeypatch):
+    path = str(tmp_path / "model.joblib")
+    dump({"pipeline": fit_pipeline("logreg"), "meta": {}}, path)
+    first = ml_infer.get_model(path)
+
+    with open(path, "wb") as fh:
+        fh.write(b"not a model")
+    hashed = []
+    real_sha256 = ml_infer._file_sha256
+    monkeypatch.setattr(ml_infer, "_file_sha256", lambda p: hashed.append(p) or real_sha256(p))
+
+    for _ in range(3):
+        assert ml_infer.get_model(path) is first
+    assert len(hashed) == 1
+
+    # a new file (different signature) is tried again
+    dump({"pipeline": fit_pipeline("logreg"), "meta": {"v": 2}}, path)
+    os.utime(path, ns=(1, 1))
+    assert ml_infer.get_model(path)["meta"] == {"v": 2}
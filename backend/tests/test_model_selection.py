@@ -0,0 +1,56 @@
+import pytest
+from sklearn.pipeline import Pipeline
+
+import ml_infer
+from train_vecthor_model import build_pipelines, engineered_features, group_ids, measure_costs, select_best
+from vecthor_features import FEATURE_COLUMNS
+
+
+def _res(pr, roc=0.8, latency_ms=None):
+    out = {"pr_auc": pr, "roc_auc": roc}
+    if latency_ms is not None:
+        out["latency_ms"] = latency_ms
+    return out
+
+
+def test_select_best_keeps_a_winner_other_than_rf():
+    results = {"rf": _res(0.60), "rf_cal": _res(0.59), "hgb": _res(0.64), "logreg": _res(0.50)}
+    assert select_best(results) == "hgb"
+
+
+def test_select_best_prefers_rf_cal_only_close_to_a_winning_rf():
+    assert select_best({"rf": _res(0.64), "rf_cal": _res(0.60), "hgb": _res(0.62)}) == "rf_cal"
+    assert select_best({"rf": _res(0.64), "rf_cal": _res(0.58), "hgb": _res(0.62)}) == "rf"
+
+
+def test_select_best_fastest_within_tolerance():
+    results = {"rf": _res(0.64, latency_ms=9.0), "hgb": _res(0.635, latency_ms=2.0), "logreg": _res(0.50, latency_ms=0.1)}
+    assert select_best(results, "fastest", tolerance=0.01) == "hgb"
+    assert select_best(results, "fastest", tolerance=0.2) == "logreg"
+
+
+@pytest.mark.parametrize("name, served", [("rf", ml_infer.CompactModel), ("hgb", Pipeline)])
+def test_measure_costs_times_single_rows_on_the_serving_model(train_data, monkeypatch, name, served):
+    X = train_data[FEATURE_COLUMNS]
+    Xf = engineered_features(X, "synthetic", None)
+    pipe = build_pipelines()[name]
+    if name == "rf":
+        pipe.set_params(clf__n_estimators=20, clf__n_jobs=2)
+    else:
+        pipe.set_params(clf__max_iter=50)
+
+    calls = []
+    real_score_fins = ml_infer._score_fins
+
+    def spy(model, fins):
+        calls.append((model, len(fins)))
+        return real_score_fins(model, fins)
+
+    monkeypatch.setattr(ml_infer, "_score_fins", spy)
+    costs = measure_costs(pipe, X, Xf, train_data["label"].to_numpy(), group_ids(train_data), latency_rows=10)
+    assert costs["latency_ms"] > 0 and costs["fit_s"] > 0 and costs["size_mb"] > 0
+    assert len(calls) == 11 and {n for _, n in calls} == {1}
+    model = calls[0][0]
+    assert isinstance(model, served)
+    if name == "hgb":
+        assert ml_infer._fast_path_ok(model)
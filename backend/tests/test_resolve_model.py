@@ -0,0 +1,38 @@
+import os
+
+import pytest
+from joblib import dump
+
+import ml_infer
+from train_vecthor_model import save_compact
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("VECTHOR_MODEL_PATH", raising=False)
+    monkeypatch.setattr(ml_infer, "MODEL_PATH_DEFAULT", str(tmp_path / "vecthor_best.joblib"))
+    monkeypatch.setattr(ml_infer, "MODEL_PATH_CALIBRATED", str(tmp_path / "vecthor_rf_cal.joblib"))
+    monkeypatch.setattr(ml_infer, "MODEL_PATH_COMPACT", str(tmp_path / "vecthor_best.npz"))
+    return tmp_path
+
+
+def _train(outdir, pipe, name):
+    # what main() writes: the .joblib, then the compact export when the pipeline allows it
+    dump({"pipeline": pipe, "meta": {"model": name}}, str(outdir / "vecthor_best.joblib"))
+    save_compact(pipe, {"model": name}, str(outdir))
+
+
+def test_hgb_after_rf_resolves_to_the_new_joblib(models_dir, fit_pipeline):
+    _train(models_dir, fit_pipeline("rf"), "rf")
+    assert ml_infer.resolve_model_path() == (str(models_dir / "vecthor_best.npz"), False)
+
+    _train(models_dir, fit_pipeline("hgb"), "hgb")
+    path, calibrated = ml_infer.resolve_model_path()
+    assert (path, calibrated) == (str(models_dir / "vecthor_best.joblib"), False)
+    assert ml_infer.get_model(path)["meta"]["model"] == "hgb"
+
+
+def test_compact_older_than_the_joblib_is_ignored(models_dir, fit_pipeline):
+    _train(models_dir, fit_pipeline("logreg"), "logreg")
+    os.utime(models_dir / "vecthor_best.npz", ns=(1, 1))
+    assert ml_infer.resolve_model_path()[0] == str(models_dir / "vecthor_best.joblib")
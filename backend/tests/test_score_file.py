@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+from joblib import dump
+
+import ml_infer
+
+
+@pytest.fixture
+def scoring_inputs(tmp_path, fit_pipeline, train_data):
+    model_path = str(tmp_path / "model.joblib")
+    dump({"pipeline": fit_pipeline("logreg"), "meta": {"model": "logreg"}}, model_path)
+    in_path = str(tmp_path / "in.csv")
+    train_data.head(50).to_csv(in_path, index=False)
+    return model_path, in_path
+
+
+def test_score_file_writes_every_row(tmp_path, scoring_inputs):
+    model_path, in_path = scoring_inputs
+    out_path = str(tmp_path / "out.csv")
+    res = ml_infer.score_file(model_path, in_path, out_path, chunk_rows=20)
+    assert res["rows"] == 50
+    out = pd.read_csv(out_path)
+    assert len(out) == 50 and out["prob_12m"].between(0, 1).all()
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+def test_failed_score_file_keeps_the_previous_output(tmp_path, scoring_inputs, monkeypatch):
+    model_path, in_path = scoring_inputs
+    out_path = str(tmp_path / "out.csv")
+    with open(out_path, "w") as fh:
+        fh.write("previous run\n")
+
+    real_score_chunk = ml_infer._score_chunk
+    calls = []
+
+    def failing_score_chunk(path, df):
+        calls.append(len(df))
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return real_score_chunk(path, df)
+
+    monkeypatch.setattr(ml_infer, "_score_chunk", failing_score_chunk)
+    with pytest.raises(RuntimeError, match="boom"):
+        ml_infer.score_file(model_path, in_path, out_path, chunk_rows=20)
+
+    with open(out_path) as fh:
+        assert fh.read() == "previous run\n"
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+def test_score_file_without_rows_replaces_the_previous_output(tmp_path, scoring_inputs, train_data):
+    model_path, _ = scoring_inputs
+    in_path = str(tmp_path / "empty.csv")
+    train_data.head(0).to_csv(in_path, index=False)
+    out_path = str(tmp_path / "out.csv")
+    with open(out_path, "w") as fh:
+        fh.write("previous run\n")
+
+    res = ml_infer.score_file(model_path, in_path, out_path)
+    assert res == {**res, "rows": 0, "output": out_path}
+    out = pd.read_csv(out_path)
+    assert out.empty
+    assert list(out.columns) == [c for c in ml_infer.ID_COLS if c in train_data.columns] + ["prob_12m"]
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from train_vecthor_model import GROUP_COL, TARGET_COL, group_ids, load_training_data
+
+
+def test_group_ids_are_int64_and_rows_without_cik_stay_apart(tmp_path, train_data):
+    df = train_data.head(20).copy()
+    df[GROUP_COL] = df[GROUP_COL].astype(object)
+    df.loc[[3, 7, 11], GROUP_COL] = None
+    path = tmp_path / "train.csv"
+    df.to_csv(path, index=False)
+
+    loaded = load_training_data(str(path))
+    assert str(loaded[GROUP_COL].dtype) == "Int64"
+    groups = group_ids(loaded)
+    assert groups.dtype == np.int64
+    np.testing.assert_array_equal(groups[[3, 7, 11]], [-1, -2, -3])
+    keep = np.ones(len(df), dtype=bool)
+    keep[[3, 7, 11]] = False
+    np.testing.assert_array_equal(groups[keep], pd.to_numeric(df[GROUP_COL][keep]).to_numpy())
+    assert set(groups[keep]).isdisjoint(groups[~keep])
+    assert len(loaded) == df[TARGET_COL].notna().sum()
@@ -20,313 +20,131 @@ Uso:
 from __future__ import annotations
 
 import os
+import io
+import json
+import time
+import pickle
+import inspect
+import hashlib
 import argparse
+import tempfile
+import threading
 import warnings
 from typing import List, Dict, Any, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import GroupKFold, cross_val_predict
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit, cross_val_predict
 from sklearn.metrics import roc_auc_score, average_precision_score
 from sklearn.pipeline import Pipeline
-from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import StandardScaler, FunctionTransformer
 from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier
-from joblib import dump
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from joblib import dump, load, cpu_count
 
 from sklearn.calibration import CalibratedClassifierCV
+from sklearn.frozen import FrozenEstimator
+
+from cache import DiskCache, content_key
+from vecthor_features import (
+    FEATURE_COLUMNS, ENGINEERED_EXTRA, ENGINEERED_COLUMNS, ID_COLS,
+    _bool01, _safelog_series, _safe_div, _bool01_series, _feat_eng, _feat_names_out, SafeImputer,
+)
+
+try:
+    import psutil  # opzionale: picco RSS per candidato (processo + worker)
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # Sopprimi warning fastidiosi a schermo
 warnings.filterwarnings("ignore")
 np.seterr(all="ignore")  # ignora warning numerici (div/0, invalid, ecc.)
 
 # --------------------------------------------------------------------------------------
-# Colonne attese (coerenti con l’ETL e future inference)
+# Colonne e trasformazioni picklate: stanno in vecthor_features (import leggero per l'inferenza)
 # --------------------------------------------------------------------------------------
-FEATURE_COLUMNS: List[str] = [
-    "sic", "fiscalYear",
-    "totalCurrentAssets", "totalNonCurrentAssets", "totalCurrentLiabilities", "totalNonCurrentLiabilities",
-    "inventories", "totalAssets", "totalLiabilities", "totalEquity",
-    "revenue", "ebit", "netIncome", "interestExpense", "operatingCashFlow",
-    "tangibleFixedAssets", "retainedEarnings", "depreciation",
-    "workingCapital", "netIncome_t_minus_1", "quickAssets",
-    "sharesOutstanding", "marketCapitalization", "isPubliclyListed",
-    "gnpPriceLevelIndex",
-    "longTermDebtCurrent", "dscrCashFlow_proxy", "dscrDebtService_proxy",
-]
-
-# colonne aggiuntive create da _feat_eng
-ENGINEERED_EXTRA = [
-    "r_currentRatio", "r_quickRatio", "r_debtToEquity", "r_debtToAssets",
-    "r_interestCoverage", "r_roa", "r_roe", "r_roi", "r_ros", "r_assetTurnover",
-    "r_dscr_proxy",
-    "m_altmanZ", "m_zmijewskiX", "m_ohlsonO",
-    "log_totalAssets", "log_revenue", "log_totalLiab",
-]
-ENGINEERED_COLUMNS = FEATURE_COLUMNS + ENGINEERED_EXTRA
-
 TARGET_COL = "label"
 GROUP_COL = "cik"
-ID_COLS = ["cik", "companyName", "fiscalYear", "datadate"]
 
 # --------------------------------------------------------------------------------------
-# Utils
+# Loader tipizzato: solo le colonne che servono, float32, Parquet/Arrow nativi
 # --------------------------------------------------------------------------------------
-def _bool01(v: Any) -> float:
-    if isinstance(v, bool):
-        return 1.0 if v else 0.0
-    if isinstance(v, str):
-        vv = v.strip().lower()
-        if vv in ("true", "yes", "y", "1"):
-            return 1.0
-        if vv in ("false", "no", "n", "0", ""):
-            return 0.0
-    try:
-        return 1.0 if float(v) != 0.0 else 0.0
-    except Exception:
-        return 0.0
-
+def _is_arrow_file(path: str) -> bool:
+    return path.lower().endswith((".parquet", ".pq", ".feather", ".arrow"))
 
-def _safelog_series(s: pd.Series) -> pd.Series:
-    arr = pd.to_numeric(s, errors="coerce").to_numpy()
-    with np.errstate(divide="ignore", invalid="ignore"):  # no warning
-        out = np.where(arr > 0.0, np.log(arr), np.nan)
-    return pd.Series(out, index=s.index)
 
-
-def _safe_div(a: pd.Series, b: pd.Series) -> pd.Series:
-    a = pd.to_numeric(a, errors="coerce").astype(float)
-    b = pd.to_numeric(b, errors="coerce").astype(float)
-    with np.errstate(divide='ignore', invalid='ignore'):
-        r = np.where((b == 0.0) | ~np.isfinite(b), np.nan, a / b)
-    return pd.Series(r, index=a.index)
-
-# --------------------------------------------------------------------------------------
-# Feature engineering (top-level + picklable)
-# --------------------------------------------------------------------------------------
-def _feat_eng(df: pd.DataFrame) -> pd.DataFrame:
-    """Feature engineering: ripara base e crea ratios + punteggi classici (subset).
-    Restituisce SEMPRE solo colonne numeriche (no warning in scaler/clf).
+def _read_arrow(path: str, wanted: List[str]) -> pd.DataFrame:
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Input Parquet/Arrow: serve pyarrow (pip install pyarrow)")
+    if path.lower().endswith((".parquet", ".pq")):
+        names = pq.ParquetFile(path).schema_arrow.names
+        table = pq.read_table(path, columns=[c for c in wanted if c in names], memory_map=True)
+    else:
+        table = feather.read_table(path, memory_map=True)
+        table = table.select([c for c in wanted if c in table.column_names])
+    return table.to_pandas(self_destruct=True)
+
+
+def load_training_data(path: str, float_dtype: Any = np.float32) -> pd.DataFrame:
+    """Carica il dataset di training con le sole colonne usate e dtype espliciti.
+
+    Le colonne numeriche sono `float_dtype` (float32: metà memoria, ~7 cifre significative),
+    isPubliclyListed è già 0/1 via _bool01_series, le righe senza label sono scartate.
+    Accetta CSV, Parquet e Arrow/Feather.
     """
-    X = df.copy()
-
-    # assicurati che tutte le colonne attese esistano
-    for c in FEATURE_COLUMNS:
-        if c not in X.columns:
-            X[c] = np.nan
-
-    # tipi
-    X["isPubliclyListed"] = X["isPubliclyListed"].apply(_bool01)
-
-    # derivati base
-    tca = pd.to_numeric(X["totalCurrentAssets"], errors="coerce").astype(float)
-    tnca = pd.to_numeric(X["totalNonCurrentAssets"], errors="coerce").astype(float)
-    tcl = pd.to_numeric(X["totalCurrentLiabilities"], errors="coerce").astype(float)
-    tncl = pd.to_numeric(X["totalNonCurrentLiabilities"], errors="coerce").astype(float)
-
-    # total assets / liabilities fallback
-    X["totalAssets"] = pd.to_numeric(X["totalAssets"], errors="coerce").astype(float).fillna(tca + tnca)
-    X["totalLiabilities"] = pd.to_numeric(X["totalLiabilities"], errors="coerce").astype(float).fillna(tcl + tncl)
-
-    # equity fallback
-    X["totalEquity"] = pd.to_numeric(X["totalEquity"], errors="coerce").astype(float)
-    eq_fallback = (X["totalAssets"] - X["totalLiabilities"]).where(
-        X["totalEquity"].isna() | ~np.isfinite(X["totalEquity"])
-    )
-    X["totalEquity"] = X["totalEquity"].fillna(eq_fallback)
-
-    # working capital & quick assets fallback
-    X["workingCapital"] = pd.to_numeric(X["workingCapital"], errors="coerce").astype(float)
-    X.loc[X["workingCapital"].isna(), "workingCapital"] = (tca - tcl)
-
-    X["inventories"] = pd.to_numeric(X["inventories"], errors="coerce").astype(float)
-    X["quickAssets"] = pd.to_numeric(X["quickAssets"], errors="coerce").astype(float)
-    X.loc[X["quickAssets"].isna(), "quickAssets"] = (tca - X["inventories"].fillna(0.0))
-
-    # DSCR proxy fallback
-    X["operatingCashFlow"] = pd.to_numeric(X["operatingCashFlow"], errors="coerce").astype(float)
-    X["interestExpense"] = pd.to_numeric(X["interestExpense"], errors="coerce").astype(float)
-    X["longTermDebtCurrent"] = pd.to_numeric(X["longTermDebtCurrent"], errors="coerce").astype(float)
-
-    X["dscrCashFlow_proxy"] = pd.to_numeric(X["dscrCashFlow_proxy"], errors="coerce").astype(float)
-    X.loc[X["dscrCashFlow_proxy"].isna(), "dscrCashFlow_proxy"] = X["operatingCashFlow"]
-
-    X["dscrDebtService_proxy"] = pd.to_numeric(X["dscrDebtService_proxy"], errors="coerce").astype(float)
-    X.loc[X["dscrDebtService_proxy"].isna(), "dscrDebtService_proxy"] = (
-        X["interestExpense"].fillna(0.0) + X["longTermDebtCurrent"].fillna(0.0)
-    )
-
-    # altri numerici
-    for c in [
-        "sic", "fiscalYear", "revenue", "ebit", "netIncome", "tangibleFixedAssets",
-        "retainedEarnings", "depreciation", "netIncome_t_minus_1", "sharesOutstanding",
-        "marketCapitalization", "gnpPriceLevelIndex"
-    ]:
-        X[c] = pd.to_numeric(X[c], errors="coerce").astype(float)
-
-    # ---------------- ratios
-    X["r_currentRatio"]     = _safe_div(X["totalCurrentAssets"], X["totalCurrentLiabilities"])  # CA/CL
-    X["r_quickRatio"]       = _safe_div(X["quickAssets"], X["totalCurrentLiabilities"])         # (CA-Inv)/CL
-    X["r_debtToEquity"]     = _safe_div(X["totalLiabilities"], X["totalEquity"])                # TL/EQ
-    X["r_debtToAssets"]     = _safe_div(X["totalLiabilities"], X["totalAssets"])                # TL/TA
-    X["r_interestCoverage"] = _safe_div(X["ebit"], X["interestExpense"])                        # EBIT/Int
-    X["r_roa"]              = _safe_div(X["netIncome"], X["totalAssets"])                       # NI/TA
-    X["r_roe"]              = _safe_div(X["netIncome"], X["totalEquity"])                       # NI/EQ
-    X["r_roi"]              = _safe_div(X["ebit"], X["totalAssets"])                            # EBIT/TA
-    X["r_ros"]              = _safe_div(X["ebit"], X["revenue"])                                # EBIT/Sales
-    X["r_assetTurnover"]    = _safe_div(X["revenue"], X["totalAssets"])                         # Sales/TA
-    X["r_dscr_proxy"]       = _safe_div(X["dscrCashFlow_proxy"], X["dscrDebtService_proxy"])    # OCF/(Int+LTDC)
-
-    # ---------------- classic scores (Altman/Zmijewski/Ohlson)
-    ta = X["totalAssets"]
-    tl = X["totalLiabilities"]
-    sales = X["revenue"]
-    wc = X["workingCapital"]
-    ebit = X["ebit"]
-    eq = X["totalEquity"]
-
-    X1 = _safe_div(wc, ta)
-    RE = X["retainedEarnings"]
-    X2 = _safe_div(RE, ta)
-    X3 = _safe_div(ebit, ta)
-    X5 = _safe_div(sales, ta)
-
-    def _is_manu(sic_val: Any) -> float:
+    numeric = [c for c in FEATURE_COLUMNS if c != "isPubliclyListed"]
+    wanted = list(dict.fromkeys([*ID_COLS, *FEATURE_COLUMNS, TARGET_COL]))
+
+    if _is_arrow_file(path):
+        df = _read_arrow(path, wanted)
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [c for c in wanted if c in header]
+        dtypes = {c: float_dtype for c in numeric + [TARGET_COL]}
+        dtypes[GROUP_COL] = "Int64"
+        dtypes = {c: t for c, t in dtypes.items() if c in usecols}
         try:
-            sv = float(sic_val)
-            return 1.0 if 2000.0 <= sv < 4000.0 else 0.0
-        except Exception:
-            return 0.0
-
-    manu = X["sic"].apply(_is_manu)
-
-    def _safe_div_plain(a: pd.Series, b: pd.Series) -> pd.Series:
-        with np.errstate(divide='ignore', invalid='ignore'):
-            r = pd.to_numeric(a, errors="coerce") / pd.to_numeric(b, errors="coerce")
-            r[~np.isfinite(r)] = np.nan
-            return r
-
-    mc_over_tl = _safe_div_plain(X["marketCapitalization"], tl)
-    eq_over_tl = _safe_div_plain(eq, tl)
-
-    altman_pub_manu  = 1.2 * X1 + 1.4 * X2 + 3.3 * X3 + 0.6 * mc_over_tl + 1.0 * X5
-    altman_pub_other = 6.56 * X1 + 3.26 * X2 + 6.72 * X3 + 1.05 * eq_over_tl
-    altman_priv      = 0.717 * X1 + 0.847 * X2 + 3.107 * X3 + 0.420 * eq_over_tl + 0.998 * X5
-
-    is_pub = X["isPubliclyListed"]
-    X["m_altmanZ"] = (
-        altman_pub_manu * (is_pub.eq(1.0) & manu.eq(1.0))
-        + altman_pub_other * (is_pub.eq(1.0) & manu.eq(0.0))
-        + altman_priv * (is_pub.eq(0.0))
-    ).astype(float)
-    X["m_altmanZ"] = X["m_altmanZ"].fillna(0.0)  # evita colonne all-NaN
-
-    roa = _safe_div(X["netIncome"], ta)
-    lev = _safe_div(tl, ta)
-    cr  = _safe_div(X["totalCurrentAssets"], X["totalCurrentLiabilities"])
-    X["m_zmijewskiX"] = (-4.336 - 4.513 * roa + 5.679 * lev + 0.004 * cr).astype(float)
-
-    ca = X["totalCurrentAssets"]
-    cl = X["totalCurrentLiabilities"]
-    ni_t  = X["netIncome"]
-    ni_tm1= X["netIncome_t_minus_1"]
-    ffo   = X["operatingCashFlow"]
-    gnp   = X["gnpPriceLevelIndex"]
-
-    ratio = _safe_div(ta, gnp)
-    size  = _safelog_series(ratio)
-    size  = size.where((gnp.notna()) & (gnp > 0.0), _safelog_series(ta))
-
-    tlta = _safe_div(tl, ta)
-    wcta = _safe_div(X["workingCapital"], ta)
-    clca = _safe_div(cl, ca)
-    nita = _safe_div(ni_t, ta)
-    futl = _safe_div(ffo, tl)
-    oeneg= (tl > ta).astype(float)
-    intwo= ((ni_tm1.notna()) & (ni_t < 0.0) & (ni_tm1 < 0.0)).astype(float)
-
-    denom = (ni_t.abs() + ni_tm1.abs())
-    chin  = ((ni_t - ni_tm1) / denom).where(denom > 0.0, np.nan)
-
-    X["m_ohlsonO"] = (
-        -1.32
-        - 0.407 * size
-        + 6.03 * tlta
-        - 1.43 * wcta
-        + 0.076 * clca
-        - 1.72 * oeneg
-        - 2.37 * nita
-        - 1.83 * futl
-        + 0.285 * intwo
-        - 0.521 * chin
-    ).astype(float)
-
-    # log features senza warning
-    X["log_totalAssets"] = _safelog_series(X["totalAssets"])
-    X["log_revenue"]     = _safelog_series(X["revenue"])
-    X["log_totalLiab"]   = _safelog_series(X["totalLiabilities"])
-
-    # forza esistenza di tutte le engineered (riempite con NaN, poi SafeImputer gestisce)
-    for c in ENGINEERED_COLUMNS:
-        if c not in X.columns:
-            X[c] = np.nan
-
-    # PREVENZIONE warning Imputer: evita colonne tutte NaN (metti 0.0 dove tutto NaN)
-    always_nan_cols = [c for c in ENGINEERED_COLUMNS if pd.isna(X[c]).all()]
-    for c in always_nan_cols:
-        X[c] = 0.0
-
-    # ritorna solo features numeriche nell'ordine previsto
-    return X[ENGINEERED_COLUMNS].apply(pd.to_numeric, errors="coerce")
+            df = pd.read_csv(path, usecols=usecols, dtype=dtypes)
+        except (ValueError, TypeError):
+            # valori non numerici sporadici: colonne come testo, poi coercizione come in _feat_eng
+            df = pd.read_csv(path, usecols=usecols, dtype={c: object for c in usecols}, low_memory=False)
 
-# --------------------------------------------------------------------------------------
-# Imputer sicuro: median quando possibile, altrimenti costante 0.0 (niente warning)
-# --------------------------------------------------------------------------------------
-class SafeImputer(BaseEstimator, TransformerMixin):
-    def __init__(self, strategy: str = "median", fill_value: float = 0.0):
-        self.strategy = strategy
-        self.fill_value = fill_value
-        self.imputers_: Dict[str, Any] = {}
-        self.columns_: List[str] = []
-
-    # Compatibilità con Pipeline.set_output(...)
-    def set_output(self, *, transform=None):
-        return self
+    for c in numeric + [TARGET_COL]:
+        if c in df.columns and df[c].dtype != float_dtype:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype(float_dtype)
+    if GROUP_COL in df.columns and df[GROUP_COL].dtype != "Int64":
+        df[GROUP_COL] = pd.to_numeric(df[GROUP_COL], errors="coerce").astype("Int64")
 
-    def fit(self, X, y=None):
-        if not isinstance(X, pd.DataFrame):
-            X = pd.DataFrame(X)
-        self.columns_ = list(X.columns)
-        self.stats_: Dict[str, float] = {}
-        for c in self.columns_:
-            col = pd.to_numeric(X[c], errors="coerce")
-            if col.notna().any():
-                # usa mediana reale
-                self.stats_[c] = float(col.median())
-            else:
-                # nessun valore osservato -> fallback costante
-                self.stats_[c] = float(self.fill_value)
-        return self
+    df = df.dropna(subset=[TARGET_COL])
+    df[TARGET_COL] = df[TARGET_COL].astype(np.int8)
 
-    def transform(self, X):
-        if not isinstance(X, pd.DataFrame):
-            X = pd.DataFrame(X, columns=self.columns_)
-        out = pd.DataFrame(index=X.index)
-        for c in self.columns_:
-            col = pd.to_numeric(X[c], errors="coerce").astype(float)
-            fillv = self.stats_[c]
-            out[c] = col.fillna(fillv).to_numpy()
-        return out
+    for c in FEATURE_COLUMNS:
+        if c not in df.columns:
+            df[c] = np.float32(np.nan) if c != "isPubliclyListed" else np.nan
+    df["isPubliclyListed"] = _bool01_series(df["isPubliclyListed"])
+    return df
+
+def group_ids(df: pd.DataFrame) -> np.ndarray:
+    """CIK come int64 per GroupKFold/GroupShuffleSplit (la colonna Int64 darebbe un array object
+    con pd.NA). Una riga senza CIK è un gruppo a sé: id negativi distinti, mai condivisi con altre."""
+    cik = df[GROUP_COL]
+    missing = cik.isna().to_numpy()
+    groups = cik.to_numpy(dtype=np.int64, na_value=-1)
+    if missing.any():
+        print(f"[WARN] {int(missing.sum())} righe senza {GROUP_COL}: ognuna è un gruppo separato", flush=True)
+        groups[missing] = -np.arange(1, int(missing.sum()) + 1)
+    return groups
 
 # --------------------------------------------------------------------------------------
 # Training helpers
 # --------------------------------------------------------------------------------------
-def _feat_names_out(transformer, input_features):
-    """Nomi colonna dell'output del FunctionTransformer (picklable)."""
-    return ENGINEERED_COLUMNS
-
-
 def build_pipelines(random_state: int = 42) -> Dict[str, Pipeline]:
     feat = FunctionTransformer(
         _feat_eng,
@@ -372,15 +190,222 @@ def build_pipelines(random_state: int = 42) -> Dict[str, Pipeline]:
         )),
     ]).set_output(transform="pandas")
 
-    return {"logreg": pipe_lr, "rf": pipe_rf, "rf_cal": pipe_rf_cal}
+    # HistGradientBoosting: NaN gestiti nativamente, niente SafeImputer; molto più leggero del RF
+    hgb_base = HistGradientBoostingClassifier(
+        learning_rate=0.05,
+        max_iter=500,
+        max_leaf_nodes=31,
+        min_samples_leaf=20,
+        l2_regularization=1.0,
+        early_stopping=True,
+        class_weight="balanced",
+        random_state=random_state,
+    )
+
+    pipe_hgb = Pipeline([
+        ("feat", feat),
+        ("clf", hgb_base),
+    ]).set_output(transform="pandas")
+
+    pipe_hgb_cal = Pipeline([
+        ("feat", feat),
+        ("clf", CalibratedClassifierCV(estimator=hgb_base, method="isotonic", cv=5)),
+    ]).set_output(transform="pandas")
+
+    return {"logreg": pipe_lr, "rf": pipe_rf, "rf_cal": pipe_rf_cal, "hgb": pipe_hgb, "hgb_cal": pipe_hgb_cal}
+
+
+# --------------------------------------------------------------------------------------
+# Feature ingegnerizzate una sola volta per dataset (cache su disco)
+# --------------------------------------------------------------------------------------
+FEATURE_CACHE_VERSION = 1  # bump se cambia la semantica di _feat_eng senza toccarne il codice
+FEATURE_CACHE_MAX_MB = 4096
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _feature_code_key() -> str:
+    """Versione del codice feature: sorgente di _feat_eng e helper + colonne."""
+    src = "".join(inspect.getsource(f) for f in (_bool01, _safelog_series, _safe_div, _feat_eng))
+    return content_key(str(FEATURE_CACHE_VERSION), src, *ENGINEERED_COLUMNS)
+
+
+def engineered_features(X: pd.DataFrame, data_path: str, cache_dir: str | None = None) -> pd.DataFrame:
+    """_feat_eng(X) calcolata una volta per dataset e messa in cache per (sha256 del file, versione codice).
+
+    Nota: la regola "colonna tutta NaN -> 0.0" si applica sull'intero dataset e non più sul
+    singolo fold; cambia qualcosa solo per colonne vuote in un fold ma non nel dataset.
+    """
+    if not cache_dir:
+        return _feat_eng(X)
+    cache = DiskCache(cache_dir, FEATURE_CACHE_MAX_MB * 1024 * 1024, suffix=".npy")
+    # i dtype entrano nella chiave: float32 e float64 danno feature diverse
+    key = content_key(_file_sha256(data_path), _feature_code_key(), *map(str, X.dtypes))
+    data = cache.get(key)
+    if data is not None:
+        arr = np.load(io.BytesIO(data), allow_pickle=False)
+        if arr.shape == (len(X), len(ENGINEERED_COLUMNS)):
+            print("[FEAT] Feature dalla cache", flush=True)
+            return pd.DataFrame(arr, columns=ENGINEERED_COLUMNS, index=X.index)
+
+    Xf = _feat_eng(X)
+    buf = io.BytesIO()
+    np.save(buf, Xf.to_numpy(dtype=np.float64), allow_pickle=False)
+    cache.set(key, buf.getvalue())
+    return Xf
+
+
+def _without_feat(pipe: Pipeline) -> Pipeline:
+    """Stessa pipeline senza lo step "feat": lavora sulla matrice già ingegnerizzata."""
+    return Pipeline(pipe.steps[1:]).set_output(transform="pandas")
+
+
+def fit_on_features(pipe: Pipeline, X: pd.DataFrame, Xf: pd.DataFrame, y: np.ndarray) -> Pipeline:
+    """Fitta `pipe` usando le feature già calcolate; la pipeline restituita parte comunque dai dati grezzi."""
+    tail = _without_feat(pipe).fit(Xf, y)
+    feat = pipe.steps[0][1].fit(X.head(1))  # FunctionTransformer: stateless, fit solo formale
+    return Pipeline([(pipe.steps[0][0], feat), *tail.steps]).set_output(transform="pandas")
 
 
-def evaluate_cv(pipe: Pipeline, X: pd.DataFrame, y: np.ndarray, groups: np.ndarray, n_splits: int = 5) -> Tuple[float, float, np.ndarray]:
+# --------------------------------------------------------------------------------------
+# Parallelismo: un budget di core diviso tra fold (processi) e alberi (thread)
+# --------------------------------------------------------------------------------------
+def parallel_plan(n_jobs: int, n_splits: int) -> Tuple[int, int]:
+    """(fold_jobs, tree_jobs) con fold_jobs * tree_jobs <= n_jobs: prima i fold, il resto agli alberi."""
+    budget = cpu_count() if n_jobs is None or n_jobs <= 0 else n_jobs
+    fold_jobs = max(1, min(n_splits, budget))
+    return fold_jobs, max(1, budget // fold_jobs)
+
+
+def set_tree_jobs(pipe: Pipeline, n_jobs: int) -> Pipeline:
+    """Thread per gli alberi; il CalibratedClassifierCV resta sequenziale sui suoi fold interni.
+    (HistGradientBoosting usa OpenMP: nei worker joblib i thread sono già limitati da loky.)"""
+    clf = pipe.steps[-1][1]
+    if isinstance(clf, CalibratedClassifierCV):
+        clf.set_params(n_jobs=1)
+        if "n_jobs" in clf.estimator.get_params():
+            clf.set_params(estimator__n_jobs=n_jobs)
+    elif "n_jobs" in clf.get_params():
+        clf.set_params(n_jobs=n_jobs)
+    return pipe
+
+
+class ResourceMonitor:
+    """Wall time e picco RSS di un blocco. Con psutil campiona la somma processo + figli (worker loky);
+    senza, usa resource.getrusage (picco dall'avvio del processo, non del singolo blocco)."""
+
+    def __init__(self, interval_s: float = 0.2):
+        self.interval_s = interval_s
+        self.wall_s = 0.0
+        self.peak_rss_mb = float("nan")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rss_mb(self) -> float:
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.peak_rss_mb = max(self.peak_rss_mb, self._rss_mb())
+
+    def __enter__(self) -> "ResourceMonitor":
+        self._t0 = time.perf_counter()
+        if psutil is not None:
+            self.peak_rss_mb = self._rss_mb()
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.wall_s = time.perf_counter() - self._t0
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        elif resource is not None:
+            kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                     resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+            self.peak_rss_mb = kb / 1024  # Linux: KB
+
+
+def measure_costs(pipe: Pipeline, X: pd.DataFrame, Xf: pd.DataFrame, y: np.ndarray, groups: np.ndarray,
+                  n_splits: int = 5, latency_rows: int = 50) -> Dict[str, float]:
+    """Costi di un candidato: fit sul train del primo fold, latenza mediana per riga singola e
+    dimensione del pickle. La latenza è quella del serving: una riga grezza alla volta con
+    ml_infer (CompactModel se la pipeline è esportabile, altrimenti il fast path numpy), alberi
+    su un solo thread. Il fit parte dalle feature già calcolate."""
+    import ml_infer  # solo qui: il resto del training non ne ha bisogno
+
+    train_idx, test_idx = next(GroupKFold(n_splits=n_splits).split(Xf, y, groups))
+    t0 = time.perf_counter()
+    fitted = fit_on_features(pipe, X.iloc[train_idx], Xf.iloc[train_idx], y[train_idx])
+    fit_s = time.perf_counter() - t0
+
+    clf = fitted.steps[-1][1]
+    for est in [clf, *(m.estimator for m in getattr(clf, "calibrated_classifiers_", []))]:
+        est = _unfrozen(est)
+        if "n_jobs" in est.get_params(deep=False):
+            est.set_params(n_jobs=1)
+    model: Any = fitted
+    with tempfile.TemporaryDirectory(prefix="vecthor_cost_") as tmp:
+        try:
+            export_compact(fitted, {}, os.path.join(tmp, "model.npz"))
+            model = ml_infer.CompactModel.load(os.path.join(tmp, "model.npz"))
+        except ValueError:
+            pass  # non esportabile (hgb): in produzione si serve il .joblib
+
+    fins = X.iloc[test_idx[:latency_rows]].to_dict("records")
+    ml_infer._score_fins(model, fins[:1])  # warm-up
+    times = []
+    for fin in fins:
+        t0 = time.perf_counter()
+        ml_infer._score_fins(model, [fin])
+        times.append(time.perf_counter() - t0)
+    return {
+        "fit_s": fit_s,
+        "latency_ms": float(np.median(times)) * 1000.0,
+        "size_mb": len(pickle.dumps(fitted, protocol=pickle.HIGHEST_PROTOCOL)) / (1024 * 1024),
+    }
+
+
+def select_best(results: Dict[str, Dict[str, Any]], strategy: str = "pr_auc", tolerance: float = 0.01) -> str:
+    """"pr_auc": PR-AUC (poi ROC-AUC); se vince il RF, rf_cal quando gli è vicino.
+    "fastest": il candidato a latenza minima con PR-AUC entro `tolerance` dal migliore."""
+    best_name = max(results, key=lambda k: (results[k]["pr_auc"], results[k]["roc_auc"]))
+    if strategy == "fastest":
+        best_pr = results[best_name]["pr_auc"]
+        ok = [k for k in results if results[k]["pr_auc"] >= best_pr - tolerance and "latency_ms" in results[k]]
+        if ok:
+            return min(ok, key=lambda k: (results[k]["latency_ms"], -results[k]["pr_auc"]))
+        return best_name
+
+    # ✅ Preferisci il calibrato per probabilità “pulite”, ma solo al posto del RF che calibra:
+    # un altro candidato (hgb, logreg) che vince su PR-AUC resta il migliore
+    if best_name == "rf" and "rf_cal" in results:
+        if results["rf_cal"]["pr_auc"] >= results["rf"]["pr_auc"] - 0.05:
+            best_name = "rf_cal"
+    return best_name
+
+
+def evaluate_cv(pipe: Pipeline, X: pd.DataFrame, y: np.ndarray, groups: np.ndarray, n_splits: int = 5,
+                n_jobs: int = -1) -> Tuple[float, float, np.ndarray]:
     gkf = GroupKFold(n_splits=n_splits)
     try:
-        oof = cross_val_predict(pipe, X, y, groups=groups, cv=gkf, method="predict_proba", n_jobs=-1)[:, 1]
+        oof = cross_val_predict(pipe, X, y, groups=groups, cv=gkf, method="predict_proba", n_jobs=n_jobs)[:, 1]
     except Exception:
-        oof = cross_val_predict(pipe, X, y, groups=groups, cv=gkf, method="decision_function", n_jobs=-1)
+        oof = cross_val_predict(pipe, X, y, groups=groups, cv=gkf, method="decision_function", n_jobs=n_jobs)
         oof = 1.0 / (1.0 + np.exp(-oof))
 
     try:
@@ -394,53 +419,322 @@ def evaluate_cv(pipe: Pipeline, X: pd.DataFrame, y: np.ndarray, groups: np.ndarr
     return roc, pr, oof
 
 
+# --------------------------------------------------------------------------------------
+# Export compatto: solo array numpy (.npz), niente pickle né oggetti sklearn
+# --------------------------------------------------------------------------------------
+COMPACT_FORMAT_VERSION = 1
+
+
+def _forest_arrays(forests: List[RandomForestClassifier]) -> Dict[str, np.ndarray]:
+    """Nodi di tutti gli alberi concatenati; le foglie puntano a se stesse (traversal a passi fissi)."""
+    feature, threshold, left, right, missing_left, value = [], [], [], [], [], []
+    roots, forest_offsets, depth = [], [0], 0
+    base = 0
+    for forest in forests:
+        for est in forest.estimators_:
+            t = est.tree_
+            n = t.node_count
+            ids = np.arange(base, base + n, dtype=np.int64)
+            leaf = t.children_left == -1
+            feature.append(np.where(leaf, 0, t.feature).astype(np.int32))
+            threshold.append(np.where(leaf, 0.0, t.threshold).astype(np.float64))
+            left.append(np.where(leaf, ids, t.children_left + base))
+            right.append(np.where(leaf, ids, t.children_right + base))
+            mgl = getattr(t, "missing_go_to_left", None)
+            missing_left.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+            # come DecisionTreeClassifier.predict_proba: frazioni per classe nella foglia
+            v = np.asarray(t.value[:, 0, :], dtype=np.float64)
+            s = v.sum(axis=1, keepdims=True)
+            value.append(v / np.where(s == 0.0, 1.0, s))
+            roots.append(base)
+            depth = max(depth, int(t.max_depth))
+            base += n
+        forest_offsets.append(len(roots))
+    idx = np.int32 if base < np.iinfo(np.int32).max else np.int64
+    return {
+        "tree_feature": np.concatenate(feature),
+        "tree_threshold": np.concatenate(threshold),
+        "tree_left": np.concatenate(left).astype(idx),
+        "tree_right": np.concatenate(right).astype(idx),
+        "tree_missing_left": np.concatenate(missing_left),
+        "tree_value": np.concatenate(value),
+        "tree_roots": np.asarray(roots, dtype=np.int64),
+        "forest_offsets": np.asarray(forest_offsets, dtype=np.int64),
+        "max_depth": np.asarray(depth, dtype=np.int64),
+    }
+
+
+def _unfrozen(est: Any) -> Any:
+    """Stimatore dentro un FrozenEstimator (modelli aggiornati con --incremental)."""
+    return est.estimator if isinstance(est, FrozenEstimator) else est
+
+
+def export_compact(pipe: Pipeline, meta: Dict[str, Any], path: str) -> None:
+    """Salva `pipe` (feat → impute → [scale] → clf) come .npz autocontenuto per ml_infer.CompactModel.
+
+    Supporta LogisticRegression, RandomForestClassifier e CalibratedClassifierCV (isotonic) su RF.
+    """
+    steps = dict(pipe.steps)
+    imputer = steps.get("impute")
+    if imputer is None:
+        raise ValueError("Export compatto: serve una pipeline con SafeImputer")
+    if list(imputer.columns_) != ENGINEERED_COLUMNS:
+        raise ValueError("Export compatto: l'imputer non è sulle ENGINEERED_COLUMNS")
+
+    arrays: Dict[str, np.ndarray] = {
+        "format_version": np.asarray(COMPACT_FORMAT_VERSION),
+        "meta_json": np.asarray(json.dumps(meta)),
+        "columns": np.asarray(ENGINEERED_COLUMNS),
+        "impute_stats": np.asarray([imputer.stats_[c] for c in imputer.columns_], dtype=np.float64),
+    }
+
+    scaler = steps.get("scale")
+    if scaler is not None:
+        n = len(ENGINEERED_COLUMNS)
+        arrays["scale_mean"] = np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(n), dtype=np.float64)
+        arrays["scale_scale"] = np.asarray(scaler.scale_ if scaler.with_std else np.ones(n), dtype=np.float64)
+
+    clf = steps["clf"]
+    if isinstance(clf, LogisticRegression):
+        arrays["kind"] = np.asarray("logreg")
+        arrays["coef"] = np.asarray(clf.coef_, dtype=np.float64)
+        arrays["intercept"] = np.asarray(clf.intercept_, dtype=np.float64)
+    elif isinstance(clf, RandomForestClassifier):
+        arrays["kind"] = np.asarray("rf")
+        arrays.update(_forest_arrays([clf]))
+    elif isinstance(clf, CalibratedClassifierCV):
+        members = clf.calibrated_classifiers_
+        forests = [_unfrozen(m.estimator) for m in members]
+        if clf.method != "isotonic" or not all(isinstance(f, RandomForestClassifier) for f in forests):
+            raise ValueError("Export compatto: supportato solo CalibratedClassifierCV isotonic su RandomForest")
+        arrays["kind"] = np.asarray("rf_cal")
+        arrays.update(_forest_arrays(forests))
+        iso = [m.calibrators[0] for m in members]
+        arrays["iso_offsets"] = np.cumsum([0] + [len(c.X_thresholds_) for c in iso]).astype(np.int64)
+        arrays["iso_x"] = np.concatenate([c.X_thresholds_ for c in iso]).astype(np.float64)
+        arrays["iso_y"] = np.concatenate([c.y_thresholds_ for c in iso]).astype(np.float64)
+        arrays["iso_bounds"] = np.asarray([[c.X_min_, c.X_max_] for c in iso], dtype=np.float64)
+    else:
+        raise ValueError(f"Export compatto non supportato per {type(clf).__name__}")
+
+    # scrittura atomica: ml_infer ricarica il file appena cambia
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def save_compact(pipe: Pipeline, meta: Dict[str, Any], outdir: str) -> str | None:
+    """export_compact in outdir/vecthor_best.npz; se la pipeline non è esportabile rimuove
+    l'export di un training precedente, che ml_infer preferirebbe al .joblib appena salvato."""
+    path = os.path.join(outdir, "vecthor_best.npz")
+    try:
+        export_compact(pipe, meta, path)
+        return path
+    except ValueError as e:
+        print(f"[WARN] Export compatto saltato: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[WARN] Rimosso l'export compatto precedente: {path}")
+        return None
+
+
+# --------------------------------------------------------------------------------------
+# Retrain incrementale: alberi extra sui nuovi anni + sola ricalibrazione
+# --------------------------------------------------------------------------------------
+def merged_forest(clf: Any) -> RandomForestClassifier:
+    """Un unico RF con tutti gli alberi del modello (per rf_cal: quelli di ogni membro calibrato)."""
+    if isinstance(clf, RandomForestClassifier):
+        return clf
+    if isinstance(clf, CalibratedClassifierCV):
+        forests = [_unfrozen(m.estimator) for m in clf.calibrated_classifiers_]
+        if all(isinstance(f, RandomForestClassifier) for f in forests):
+            rf = forests[0]
+            rf.estimators_ = [t for f in forests for t in f.estimators_]
+            rf.n_estimators = len(rf.estimators_)
+            return rf
+    raise SystemExit(f"Retrain incrementale: serve un modello rf o rf_cal, non {type(clf).__name__}")
+
+
+def _holdout_scores(pipe: Pipeline, Xf: pd.DataFrame, y: np.ndarray) -> Dict[str, float]:
+    p = pipe.predict_proba(Xf)[:, 1]
+    try:
+        roc = float(roc_auc_score(y, p))
+    except ValueError:
+        roc = float("nan")
+    try:
+        pr = float(average_precision_score(y, p))
+    except ValueError:
+        pr = float("nan")
+    return {"roc_auc": roc, "pr_auc": pr}
+
+
+def incremental_update(prev: Dict[str, Any], X: pd.DataFrame, Xf: pd.DataFrame, y: np.ndarray, groups: np.ndarray,
+                       years: np.ndarray, since_year: int, extra_trees: int, holdout_frac: float,
+                       calib_frac: float, n_jobs: int, random_state: int) -> Tuple[Pipeline, Dict[str, Any]]:
+    """Aggiorna il modello `prev` ({"pipeline","meta"}) con le righe di fiscalYear > since_year.
+
+    Le righe nuove vengono divise per cik: una quota dell'anno più recente è il holdout di
+    validazione, il resto va in parte agli alberi extra (warm start) e in parte alla nuova
+    calibrazione isotonic sul forest congelato. Feature e imputer restano quelli di `prev`.
+    """
+    new_idx = np.flatnonzero(years > since_year)
+    if len(new_idx) == 0:
+        raise SystemExit(f"Nessuna riga con fiscalYear > {since_year}")
+
+    # holdout: quota di aziende dell'anno più recente, esclusa da alberi e calibrazione
+    last_idx = new_idx[years[new_idx] == years[new_idx].max()]
+    gss = GroupShuffleSplit(n_splits=1, test_size=holdout_frac, random_state=random_state)
+    _, ho = next(gss.split(last_idx, groups=groups[last_idx]))
+    holdout_idx = last_idx[ho]
+    rest_idx = np.setdiff1d(new_idx, holdout_idx)
+    gss = GroupShuffleSplit(n_splits=1, test_size=calib_frac, random_state=random_state)
+    fit_pos, cal_pos = next(gss.split(rest_idx, groups=groups[rest_idx]))
+    fit_idx, cal_idx = rest_idx[fit_pos], rest_idx[cal_pos]
+    for name, idx in (("alberi extra", fit_idx), ("calibrazione", cal_idx)):
+        if len(np.unique(y[idx])) < 2:
+            raise SystemExit(f"Retrain incrementale: le righe per {name} hanno una sola classe")
+
+    old_pipe = prev["pipeline"]
+    steps = dict(old_pipe.steps)
+    imputer = steps["impute"]
+    before = _holdout_scores(_without_feat(old_pipe), Xf.iloc[holdout_idx], y[holdout_idx])
+
+    rf = merged_forest(steps["clf"])
+    n_old = rf.n_estimators
+    rf.set_params(warm_start=True, n_estimators=n_old + extra_trees, n_jobs=n_jobs)
+    rf.fit(imputer.transform(Xf.iloc[fit_idx]), y[fit_idx])
+    rf.set_params(warm_start=False)
+
+    cal = CalibratedClassifierCV(FrozenEstimator(rf), method="isotonic")
+    cal.fit(imputer.transform(Xf.iloc[cal_idx]), y[cal_idx])
+
+    pipe = Pipeline([*old_pipe.steps[:-1], ("clf", cal)]).set_output(transform="pandas")
+    after = _holdout_scores(_without_feat(pipe), Xf.iloc[holdout_idx], y[holdout_idx])
+
+    report = {
+        "since_year": int(since_year),
+        "new_rows": int(len(new_idx)),
+        "fit_rows": int(len(fit_idx)),
+        "calib_rows": int(len(cal_idx)),
+        "holdout_rows": int(len(holdout_idx)),
+        "trees_before": int(n_old),
+        "trees_after": int(rf.n_estimators),
+        "holdout_before": before,
+        "holdout_after": after,
+    }
+    return pipe, report
+
+
+def main_incremental(args: argparse.Namespace, df: pd.DataFrame, X: pd.DataFrame, Xf: pd.DataFrame,
+                     y: np.ndarray, groups: np.ndarray) -> None:
+    prev = load(args.incremental)
+    prev_meta = prev.get("meta", {})
+    since_year = args.since_year if args.since_year is not None else prev_meta.get("fiscal_year_max")
+    if since_year is None:
+        raise SystemExit("Il modello precedente non ha fiscal_year_max nei meta: indica --since-year")
+
+    _, tree_jobs = parallel_plan(args.n_jobs, 1)
+    years = pd.to_numeric(df["fiscalYear"], errors="coerce").to_numpy()
+    with ResourceMonitor() as mon:
+        pipe, report = incremental_update(
+            prev, X, Xf, y, groups, years, int(since_year), args.extra_trees,
+            args.holdout_frac, args.calib_frac, tree_jobs, args.random_state,
+        )
+    report["wall_s"] = mon.wall_s
+
+    before, after = report["holdout_before"], report["holdout_after"]
+    print(f"[INC] {report['new_rows']} righe nuove (> {since_year}); alberi {report['trees_before']} → {report['trees_after']}")
+    print(f"[INC] holdout ({report['holdout_rows']} righe): PR-AUC {before['pr_auc']:.4f} → {after['pr_auc']:.4f} | "
+          f"ROC-AUC {before['roc_auc']:.4f} → {after['roc_auc']:.4f} | {mon.wall_s:.1f}s")
+
+    if after["pr_auc"] < before["pr_auc"] - args.tolerance and not args.force:
+        raise SystemExit("Il modello aggiornato peggiora sul holdout oltre la tolleranza: non salvato (usa --force)")
+
+    meta = {
+        **prev_meta,
+        "model": "rf_cal",
+        "fiscal_year_max": int(np.nanmax(years)),
+        "incremental": [*prev_meta.get("incremental", []), report],
+    }
+    model_path = os.path.join(args.outdir, "vecthor_best.joblib")
+    dump({"pipeline": pipe, "meta": meta}, model_path)
+    save_compact(pipe, meta, args.outdir)
+    print("\n✅ Salvato modello aggiornato in:", model_path)
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--data", required=True, help="Path a vecthor_training_v3.csv")
+    ap.add_argument("--data", required=True, help="Path a vecthor_training_v3.csv (anche .parquet / .feather)")
     ap.add_argument("--outdir", required=True, help="Cartella output modelli")
     ap.add_argument("--splits", type=int, default=5)
     ap.add_argument("--random-state", type=int, default=42)
+    ap.add_argument("--float64", action="store_true", help="Carica le colonne numeriche in float64 invece di float32")
+    ap.add_argument("--feature-cache", help="Cartella cache feature (default: <outdir>/feature_cache)")
+    ap.add_argument("--no-feature-cache", action="store_true", help="Ricalcola sempre le feature")
+    ap.add_argument("--n-jobs", type=int, default=int(os.getenv("VECTHOR_N_JOBS", "0")),
+                    help="Budget totale di core (0 = tutti), diviso tra fold e alberi")
+    ap.add_argument("--models", default=",".join(build_pipelines()),
+                    help="Candidati da valutare, separati da virgola")
+    ap.add_argument("--select", choices=["pr_auc", "fastest"], default="pr_auc",
+                    help="pr_auc: il migliore; fastest: il più veloce entro --select-tolerance di PR-AUC")
+    ap.add_argument("--select-tolerance", type=float, default=0.01)
+    ap.add_argument("--no-costs", action="store_true", help="Non misurare fit time, latenza e dimensione")
+    ap.add_argument("--incremental", metavar="PREV_JOBLIB",
+                    help="Aggiorna il modello indicato con i nuovi anni invece di riaddestrare da zero")
+    ap.add_argument("--since-year", type=int, help="Righe nuove: fiscalYear > questo (default: fiscal_year_max nei meta)")
+    ap.add_argument("--extra-trees", type=int, default=100, help="Alberi aggiunti con --incremental")
+    ap.add_argument("--holdout-frac", type=float, default=0.3, help="Quota di aziende dell'ultimo anno tenuta fuori")
+    ap.add_argument("--calib-frac", type=float, default=0.5, help="Quota delle righe nuove per la ricalibrazione")
+    ap.add_argument("--tolerance", type=float, default=0.02, help="Calo massimo di PR-AUC sul holdout")
+    ap.add_argument("--force", action="store_true", help="Salva anche se il holdout peggiora")
     args = ap.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
 
-    # 1) carica dati
-    df = pd.read_csv(args.data, low_memory=False)
+    # 1-3) carica solo le colonne utili, tipizzate; righe senza label scartate, isPubliclyListed già 0/1
+    df = load_training_data(args.data, np.float64 if args.float64 else np.float32)
 
-    # 2) filtra righe valide
-    df = df.dropna(subset=[TARGET_COL])
-    df[TARGET_COL] = df[TARGET_COL].astype(int)
+    X = df[FEATURE_COLUMNS]
+    y = df[TARGET_COL].values
+    groups = group_ids(df)
 
-    # 3) prepara X, y, groups
-    for c in FEATURE_COLUMNS:
-        if c not in df.columns:
-            df[c] = np.nan
-    df["isPubliclyListed"] = df["isPubliclyListed"].apply(_bool01)
+    # 4) feature una sola volta, poi costruisci pipelines e valuta CV sulla matrice ingegnerizzata
+    feature_cache = None if args.no_feature_cache else (args.feature_cache or os.path.join(args.outdir, "feature_cache"))
+    Xf = engineered_features(X, args.data, feature_cache)
 
-    X = df[FEATURE_COLUMNS].copy()
-    y = df[TARGET_COL].values
-    groups = df[GROUP_COL].values
+    if args.incremental:
+        main_incremental(args, df, X, Xf, y, groups)
+        return
+
+    fold_jobs, tree_jobs = parallel_plan(args.n_jobs, args.splits)
+    print(f"[PAR] {fold_jobs} fold in parallelo × {tree_jobs} thread per RF", flush=True)
 
-    # 4) costruisci pipelines e valuta CV
     pipes = build_pipelines(random_state=args.random_state)
+    wanted = [m.strip() for m in args.models.split(",") if m.strip()]
+    unknown = [m for m in wanted if m not in pipes]
+    if unknown:
+        raise SystemExit(f"Candidati sconosciuti: {', '.join(unknown)}")
+    pipes = {k: pipes[k] for k in wanted}
     results: Dict[str, Dict[str, Any]] = {}
 
+    # i fold paralleli condividono Xf senza copie: joblib passa ai worker i blocchi sopra max_nbytes
+    # (1 MB) come memmap di un file temporaneo, e ogni chiamata di cross_val_predict lo scrive una volta
     for name, pipe in pipes.items():
         print(f"[CV] Valuto {name}…", flush=True)
-        roc, pr, oof = evaluate_cv(pipe, X, y, groups, n_splits=args.splits)
-        results[name] = {"roc_auc": roc, "pr_auc": pr, "oof": oof}
-        print(f"    ROC-AUC={roc:.4f} | PR-AUC={pr:.4f}")
-
-    # 5) scegli il migliore (PR-AUC primario su dataset sbilanciati)
-    best_name = max(results, key=lambda k: (results[k]["pr_auc"], results[k]["roc_auc"]))
-
-    # ✅ Forza il calibrato per probabilità “pulite”
-    if "rf_cal" in results:
-        # se il calibrato è vicino al RF, preferiscilo; oppure forzalo sempre:
-        if results["rf_cal"]["pr_auc"] >= results.get("rf", {"pr_auc": -1})["pr_auc"] - 0.05:
-            best_name = "rf_cal"
-        # in alternativa, per forzarlo SEMPRE:
-        # best_name = "rf_cal"
+        with ResourceMonitor() as mon:
+            roc, pr, oof = evaluate_cv(set_tree_jobs(_without_feat(pipe), tree_jobs), Xf, y, groups,
+                                       n_splits=args.splits, n_jobs=fold_jobs)
+        results[name] = {"roc_auc": roc, "pr_auc": pr, "oof": oof,
+                         "wall_s": mon.wall_s, "peak_rss_mb": mon.peak_rss_mb}
+        print(f"    ROC-AUC={roc:.4f} | PR-AUC={pr:.4f} | {mon.wall_s:.1f}s | peak RSS {mon.peak_rss_mb:.0f} MB")
+        if not args.no_costs:
+            costs = measure_costs(set_tree_jobs(pipe, fold_jobs * tree_jobs), X, Xf, y, groups, args.splits)
+            results[name].update(costs)
+            print(f"    fit={costs['fit_s']:.1f}s | latenza={costs['latency_ms']:.2f} ms/riga | "
+                  f"modello={costs['size_mb']:.1f} MB")
+
+    # 5) scegli il migliore (PR-AUC primario su dataset sbilanciati, oppure il più veloce entro tolleranza)
+    best_name = select_best(results, args.select, args.select_tolerance)
 
     best_pipe = build_pipelines(args.random_state)[best_name]
 
@@ -457,7 +751,8 @@ def main() -> None:
 
     # 7) fit finale su TUTTO il dataset e salva il modello
     print("[FIT] Refit del modello migliore su tutto il dataset…")
-    best_pipe.fit(X, y)
+    # refit singolo: tutto il budget agli alberi
+    best_pipe = fit_on_features(set_tree_jobs(best_pipe, fold_jobs * tree_jobs), X, Xf, y)
 
     meta = {
         "feature_columns": FEATURE_COLUMNS,
@@ -465,25 +760,43 @@ def main() -> None:
         "model": best_name,
         "splits": args.splits,
         "random_state": args.random_state,
-        "metrics_cv": {k: {"roc_auc": float(v["roc_auc"]), "pr_auc": float(v["pr_auc"])} for k, v in results.items()},
+        "fiscal_year_max": int(pd.to_numeric(df["fiscalYear"], errors="coerce").max()),
+        "metrics_cv": {
+            k: {"roc_auc": float(v["roc_auc"]), "pr_auc": float(v["pr_auc"]),
+                "wall_s": float(v["wall_s"]), "peak_rss_mb": float(v["peak_rss_mb"]),
+                **{c: float(v[c]) for c in ("fit_s", "latency_ms", "size_mb") if c in v}}
+            for k, v in results.items()
+        },
         "version": 3,
     }
 
     model_path = os.path.join(args.outdir, "vecthor_best.joblib")
     dump({"pipeline": best_pipe, "meta": meta}, model_path)
 
+    compact_path = save_compact(best_pipe, meta, args.outdir)
+
     # 8) metrics.txt
     with open(os.path.join(args.outdir, "metrics.txt"), "w", encoding="utf-8") as fh:
         fh.write("Vecthor ML — CV results\n")
         for k, v in results.items():
-            fh.write(f"{k}: ROC-AUC={v['roc_auc']:.4f} | PR-AUC={v['pr_auc']:.4f}\n")
+            line = (f"{k}: ROC-AUC={v['roc_auc']:.4f} | PR-AUC={v['pr_auc']:.4f} | "
+                    f"wall={v['wall_s']:.1f}s | peak_rss={v['peak_rss_mb']:.0f}MB")
+            if "fit_s" in v:
+                line += f" | fit={v['fit_s']:.1f}s | latency={v['latency_ms']:.2f}ms/row | size={v['size_mb']:.1f}MB"
+            fh.write(line + "\n")
+        fh.write(f"Parallelism: {fold_jobs} fold jobs x {tree_jobs} tree jobs\n")
+        fh.write(f"Selection: {args.select}" + (f" (tolerance {args.select_tolerance})" if args.select == "fastest" else "") + "\n")
         fh.write(f"\nBest: {best_name}\n")
         fh.write(f"Saved: {model_path}\n")
+        if compact_path:
+            fh.write(f"Compact: {compact_path}\n")
 
     print("\n✅ Salvato modello in:", model_path)
     print("   Predizioni:", os.path.join(args.outdir, "preds_full.csv"))
     print("   Top500:", os.path.join(args.outdir, "top500.csv"))
     print("   Metriche:", os.path.join(args.outdir, "metrics.txt"))
+    if compact_path:
+        print("   Compatto:", compact_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,332 @@
+"""
+vecthor_features.py — trasformazioni salvate dentro le pipeline Vecthor
+
+Feature engineering (_feat_eng, _feat_names_out) e SafeImputer, condivisi da training e
+inferenza. Modulo piccolo e stabile: i pickle lo referenziano per nome, quindi le funzioni
+qui non vanno rinominate né spostate. Dipende solo da numpy/pandas; sklearn viene
+importato solo quando serve SafeImputer.
+"""
+from __future__ import annotations
+
+import threading
+import warnings
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Sopprimi warning fastidiosi a schermo
+warnings.filterwarnings("ignore")
+np.seterr(all="ignore")  # ignora warning numerici (div/0, invalid, ecc.)
+
+# --------------------------------------------------------------------------------------
+# Colonne attese (coerenti con l’ETL e future inference)
+# --------------------------------------------------------------------------------------
+FEATURE_COLUMNS: List[str] = [
+    "sic", "fiscalYear",
+    "totalCurrentAssets", "totalNonCurrentAssets", "totalCurrentLiabilities", "totalNonCurrentLiabilities",
+    "inventories", "totalAssets", "totalLiabilities", "totalEquity",
+    "revenue", "ebit", "netIncome", "interestExpense", "operatingCashFlow",
+    "tangibleFixedAssets", "retainedEarnings", "depreciation",
+    "workingCapital", "netIncome_t_minus_1", "quickAssets",
+    "sharesOutstanding", "marketCapitalization", "isPubliclyListed",
+    "gnpPriceLevelIndex",
+    "longTermDebtCurrent", "dscrCashFlow_proxy", "dscrDebtService_proxy",
+]
+
+# colonne aggiuntive create da _feat_eng
+ENGINEERED_EXTRA = [
+    "r_currentRatio", "r_quickRatio", "r_debtToEquity", "r_debtToAssets",
+    "r_interestCoverage", "r_roa", "r_roe", "r_roi", "r_ros", "r_assetTurnover",
+    "r_dscr_proxy",
+    "m_altmanZ", "m_zmijewskiX", "m_ohlsonO",
+    "log_totalAssets", "log_revenue", "log_totalLiab",
+]
+ENGINEERED_COLUMNS = FEATURE_COLUMNS + ENGINEERED_EXTRA
+
+ID_COLS = ["cik", "companyName", "fiscalYear", "datadate"]
+
+# --------------------------------------------------------------------------------------
+# Utils
+# --------------------------------------------------------------------------------------
+def _bool01(v: Any) -> float:
+    if isinstance(v, bool):
+        return 1.0 if v else 0.0
+    if isinstance(v, str):
+        vv = v.strip().lower()
+        if vv in ("true", "yes", "y", "1"):
+            return 1.0
+        if vv in ("false", "no", "n", "0", ""):
+            return 0.0
+    try:
+        return 1.0 if float(v) != 0.0 else 0.0
+    except Exception:
+        return 0.0
+
+
+def _safelog_series(s: pd.Series) -> pd.Series:
+    arr = pd.to_numeric(s, errors="coerce").to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):  # no warning
+        out = np.where(arr > 0.0, np.log(arr), np.nan)
+    return pd.Series(out, index=s.index)
+
+
+def _safe_div(a: pd.Series, b: pd.Series) -> pd.Series:
+    a = pd.to_numeric(a, errors="coerce").astype(float)
+    b = pd.to_numeric(b, errors="coerce").astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.where((b == 0.0) | ~np.isfinite(b), np.nan, a / b)
+    return pd.Series(r, index=a.index)
+
+def _bool01_series(s: pd.Series) -> pd.Series:
+    """_bool01 vettorizzata: applicata una volta per valore distinto; mancanti (NaN/None) -> 1.0 come _bool01(nan)."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    lut = np.array([_bool01(u) for u in uniques] + [1.0], dtype=np.float32)
+    return pd.Series(lut[codes], index=s.index)  # codice -1 (mancante) -> ultimo elemento
+
+# --------------------------------------------------------------------------------------
+# Feature engineering (top-level + picklable)
+# --------------------------------------------------------------------------------------
+def _feat_eng(df: pd.DataFrame, fill_all_nan: bool = True) -> pd.DataFrame:
+    """Feature engineering: ripara base e crea ratios + punteggi classici (subset).
+    Restituisce SEMPRE solo colonne numeriche (no warning in scaler/clf).
+    fill_all_nan=False lascia i NaN anche nelle colonne tutte NaN (pipeline senza imputer, hgb).
+    """
+    X = df.copy()
+
+    # assicurati che tutte le colonne attese esistano
+    for c in FEATURE_COLUMNS:
+        if c not in X.columns:
+            X[c] = np.nan
+
+    # tipi
+    X["isPubliclyListed"] = X["isPubliclyListed"].apply(_bool01)
+
+    # derivati base
+    tca = pd.to_numeric(X["totalCurrentAssets"], errors="coerce").astype(float)
+    tnca = pd.to_numeric(X["totalNonCurrentAssets"], errors="coerce").astype(float)
+    tcl = pd.to_numeric(X["totalCurrentLiabilities"], errors="coerce").astype(float)
+    tncl = pd.to_numeric(X["totalNonCurrentLiabilities"], errors="coerce").astype(float)
+
+    # total assets / liabilities fallback
+    X["totalAssets"] = pd.to_numeric(X["totalAssets"], errors="coerce").astype(float).fillna(tca + tnca)
+    X["totalLiabilities"] = pd.to_numeric(X["totalLiabilities"], errors="coerce").astype(float).fillna(tcl + tncl)
+
+    # equity fallback
+    X["totalEquity"] = pd.to_numeric(X["totalEquity"], errors="coerce").astype(float)
+    eq_fallback = (X["totalAssets"] - X["totalLiabilities"]).where(
+        X["totalEquity"].isna() | ~np.isfinite(X["totalEquity"])
+    )
+    X["totalEquity"] = X["totalEquity"].fillna(eq_fallback)
+
+    # working capital & quick assets fallback
+    X["workingCapital"] = pd.to_numeric(X["workingCapital"], errors="coerce").astype(float)
+    X.loc[X["workingCapital"].isna(), "workingCapital"] = (tca - tcl)
+
+    X["inventories"] = pd.to_numeric(X["inventories"], errors="coerce").astype(float)
+    X["quickAssets"] = pd.to_numeric(X["quickAssets"], errors="coerce").astype(float)
+    X.loc[X["quickAssets"].isna(), "quickAssets"] = (tca - X["inventories"].fillna(0.0))
+
+    # DSCR proxy fallback
+    X["operatingCashFlow"] = pd.to_numeric(X["operatingCashFlow"], errors="coerce").astype(float)
+    X["interestExpense"] = pd.to_numeric(X["interestExpense"], errors="coerce").astype(float)
+    X["longTermDebtCurrent"] = pd.to_numeric(X["longTermDebtCurrent"], errors="coerce").astype(float)
+
+    X["dscrCashFlow_proxy"] = pd.to_numeric(X["dscrCashFlow_proxy"], errors="coerce").astype(float)
+    X.loc[X["dscrCashFlow_proxy"].isna(), "dscrCashFlow_proxy"] = X["operatingCashFlow"]
+
+    X["dscrDebtService_proxy"] = pd.to_numeric(X["dscrDebtService_proxy"], errors="coerce").astype(float)
+    X.loc[X["dscrDebtService_proxy"].isna(), "dscrDebtService_proxy"] = (
+        X["interestExpense"].fillna(0.0) + X["longTermDebtCurrent"].fillna(0.0)
+    )
+
+    # altri numerici
+    for c in [
+        "sic", "fiscalYear", "revenue", "ebit", "netIncome", "tangibleFixedAssets",
+        "retainedEarnings", "depreciation", "netIncome_t_minus_1", "sharesOutstanding",
+        "marketCapitalization", "gnpPriceLevelIndex"
+    ]:
+        X[c] = pd.to_numeric(X[c], errors="coerce").astype(float)
+
+    # ---------------- ratios
+    X["r_currentRatio"]     = _safe_div(X["totalCurrentAssets"], X["totalCurrentLiabilities"])  # CA/CL
+    X["r_quickRatio"]       = _safe_div(X["quickAssets"], X["totalCurrentLiabilities"])         # (CA-Inv)/CL
+    X["r_debtToEquity"]     = _safe_div(X["totalLiabilities"], X["totalEquity"])                # TL/EQ
+    X["r_debtToAssets"]     = _safe_div(X["totalLiabilities"], X["totalAssets"])                # TL/TA
+    X["r_interestCoverage"] = _safe_div(X["ebit"], X["interestExpense"])                        # EBIT/Int
+    X["r_roa"]              = _safe_div(X["netIncome"], X["totalAssets"])                       # NI/TA
+    X["r_roe"]              = _safe_div(X["netIncome"], X["totalEquity"])                       # NI/EQ
+    X["r_roi"]              = _safe_div(X["ebit"], X["totalAssets"])                            # EBIT/TA
+    X["r_ros"]              = _safe_div(X["ebit"], X["revenue"])                                # EBIT/Sales
+    X["r_assetTurnover"]    = _safe_div(X["revenue"], X["totalAssets"])                         # Sales/TA
+    X["r_dscr_proxy"]       = _safe_div(X["dscrCashFlow_proxy"], X["dscrDebtService_proxy"])    # OCF/(Int+LTDC)
+
+    # ---------------- classic scores (Altman/Zmijewski/Ohlson)
+    ta = X["totalAssets"]
+    tl = X["totalLiabilities"]
+    sales = X["revenue"]
+    wc = X["workingCapital"]
+    ebit = X["ebit"]
+    eq = X["totalEquity"]
+
+    X1 = _safe_div(wc, ta)
+    RE = X["retainedEarnings"]
+    X2 = _safe_div(RE, ta)
+    X3 = _safe_div(ebit, ta)
+    X5 = _safe_div(sales, ta)
+
+    def _is_manu(sic_val: Any) -> float:
+        try:
+            sv = float(sic_val)
+            return 1.0 if 2000.0 <= sv < 4000.0 else 0.0
+        except Exception:
+            return 0.0
+
+    manu = X["sic"].apply(_is_manu)
+
+    def _safe_div_plain(a: pd.Series, b: pd.Series) -> pd.Series:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = pd.to_numeric(a, errors="coerce") / pd.to_numeric(b, errors="coerce")
+            r[~np.isfinite(r)] = np.nan
+            return r
+
+    mc_over_tl = _safe_div_plain(X["marketCapitalization"], tl)
+    eq_over_tl = _safe_div_plain(eq, tl)
+
+    altman_pub_manu  = 1.2 * X1 + 1.4 * X2 + 3.3 * X3 + 0.6 * mc_over_tl + 1.0 * X5
+    altman_pub_other = 6.56 * X1 + 3.26 * X2 + 6.72 * X3 + 1.05 * eq_over_tl
+    altman_priv      = 0.717 * X1 + 0.847 * X2 + 3.107 * X3 + 0.420 * eq_over_tl + 0.998 * X5
+
+    is_pub = X["isPubliclyListed"]
+    X["m_altmanZ"] = (
+        altman_pub_manu * (is_pub.eq(1.0) & manu.eq(1.0))
+        + altman_pub_other * (is_pub.eq(1.0) & manu.eq(0.0))
+        + altman_priv * (is_pub.eq(0.0))
+    ).astype(float)
+    X["m_altmanZ"] = X["m_altmanZ"].fillna(0.0)  # evita colonne all-NaN
+
+    roa = _safe_div(X["netIncome"], ta)
+    lev = _safe_div(tl, ta)
+    cr  = _safe_div(X["totalCurrentAssets"], X["totalCurrentLiabilities"])
+    X["m_zmijewskiX"] = (-4.336 - 4.513 * roa + 5.679 * lev + 0.004 * cr).astype(float)
+
+    ca = X["totalCurrentAssets"]
+    cl = X["totalCurrentLiabilities"]
+    ni_t  = X["netIncome"]
+    ni_tm1= X["netIncome_t_minus_1"]
+    ffo   = X["operatingCashFlow"]
+    gnp   = X["gnpPriceLevelIndex"]
+
+    ratio = _safe_div(ta, gnp)
+    size  = _safelog_series(ratio)
+    size  = size.where((gnp.notna()) & (gnp > 0.0), _safelog_series(ta))
+
+    tlta = _safe_div(tl, ta)
+    wcta = _safe_div(X["workingCapital"], ta)
+    clca = _safe_div(cl, ca)
+    nita = _safe_div(ni_t, ta)
+    futl = _safe_div(ffo, tl)
+    oeneg= (tl > ta).astype(float)
+    intwo= ((ni_tm1.notna()) & (ni_t < 0.0) & (ni_tm1 < 0.0)).astype(float)
+
+    denom = (ni_t.abs() + ni_tm1.abs())
+    chin  = ((ni_t - ni_tm1) / denom).where(denom > 0.0, np.nan)
+
+    X["m_ohlsonO"] = (
+        -1.32
+        - 0.407 * size
+        + 6.03 * tlta
+        - 1.43 * wcta
+        + 0.076 * clca
+        - 1.72 * oeneg
+        - 2.37 * nita
+        - 1.83 * futl
+        + 0.285 * intwo
+        - 0.521 * chin
+    ).astype(float)
+
+    # log features senza warning
+    X["log_totalAssets"] = _safelog_series(X["totalAssets"])
+    X["log_revenue"]     = _safelog_series(X["revenue"])
+    X["log_totalLiab"]   = _safelog_series(X["totalLiabilities"])
+
+    # forza esistenza di tutte le engineered (riempite con NaN, poi SafeImputer gestisce)
+    for c in ENGINEERED_COLUMNS:
+        if c not in X.columns:
+            X[c] = np.nan
+
+    # PREVENZIONE warning Imputer: evita colonne tutte NaN (metti 0.0 dove tutto NaN)
+    if fill_all_nan:
+        always_nan_cols = [c for c in ENGINEERED_COLUMNS if pd.isna(X[c]).all()]
+        for c in always_nan_cols:
+            X[c] = 0.0
+
+    # ritorna solo features numeriche nell'ordine previsto
+    return X[ENGINEERED_COLUMNS].apply(pd.to_numeric, errors="coerce")
+
+# --------------------------------------------------------------------------------------
+# Nomi colonna per FunctionTransformer(feature_names_out=...)
+# --------------------------------------------------------------------------------------
+def _feat_names_out(transformer, input_features):
+    """Nomi colonna dell'output del FunctionTransformer (picklable)."""
+    return ENGINEERED_COLUMNS
+
+# --------------------------------------------------------------------------------------
+# Imputer sicuro: median quando possibile, altrimenti costante 0.0 (niente warning)
+# La classe viene definita al primo accesso a vecthor_features.SafeImputer: sklearn costa
+# ~1.5 s di import e serve solo al training e alle pipeline joblib, non al modello .npz.
+# --------------------------------------------------------------------------------------
+_SAFE_IMPUTER_LOCK = threading.Lock()
+
+
+def _define_safe_imputer() -> type:
+    from sklearn.base import BaseEstimator, TransformerMixin
+
+    class SafeImputer(BaseEstimator, TransformerMixin):
+        __qualname__ = "SafeImputer"  # pickle lo risolve come vecthor_features.SafeImputer
+
+        def __init__(self, strategy: str = "median", fill_value: float = 0.0):
+            self.strategy = strategy
+            self.fill_value = fill_value
+            self.imputers_: Dict[str, Any] = {}
+            self.columns_: List[str] = []
+
+        # Compatibilità con Pipeline.set_output(...)
+        def set_output(self, *, transform=None):
+            return self
+
+        def fit(self, X, y=None):
+            if not isinstance(X, pd.DataFrame):
+                X = pd.DataFrame(X)
+            self.columns_ = list(X.columns)
+            self.stats_: Dict[str, float] = {}
+            for c in self.columns_:
+                col = pd.to_numeric(X[c], errors="coerce")
+                if col.notna().any():
+                    # usa mediana reale
+                    self.stats_[c] = float(col.median())
+                else:
+                    # nessun valore osservato -> fallback costante
+                    self.stats_[c] = float(self.fill_value)
+            return self
+
+        def transform(self, X):
+            if not isinstance(X, pd.DataFrame):
+                X = pd.DataFrame(X, columns=self.columns_)
+            out = pd.DataFrame(index=X.index)
+            for c in self.columns_:
+                col = pd.to_numeric(X[c], errors="coerce").astype(float)
+                fillv = self.stats_[c]
+                out[c] = col.fillna(fillv).to_numpy()
+            return out
+
+    return SafeImputer
+
+
+def __getattr__(name: str) -> Any:
+    if name == "SafeImputer":
+        with _SAFE_IMPUTER_LOCK:
+            if "SafeImputer" not in globals():
+                globals()["SafeImputer"] = _define_safe_imputer()
+        return globals()["SafeImputer"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
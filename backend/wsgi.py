@@ -0,0 +1,11 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app (see gunicorn.conf.py) this module is imported once in the master:
+the model and the heavy imports are loaded here and shared copy-on-write by the workers,
+which start their own upload job threads after the fork.
+"""
+from app import create_app
+from controller import warm_up
+
+app = create_app(start_jobs=False)
+warm_up(converter=False)  # the PDF converter is imported by each worker (gunicorn.conf.py post_fork)